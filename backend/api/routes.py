@@ -1,19 +1,26 @@
 """FastAPI routes — đầy đủ endpoints."""
-import json
+import time
 import uuid
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, File, HTTPException, Request, UploadFile
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from ..config import settings
+from ..core.admission import PRIORITY_HIGH, PRIORITY_NORMAL, Overloaded
 from ..core.database import (
-    create_conversation,
+    get_all_conversations,
     get_db,
-    get_history,
-    save_message,
+    get_messages_page,
+    get_session_window,
+    storage_stats,
 )
+from ..core.message_search import search_messages
+from ..core.metrics import metrics
+from ..core.session_cache import prompt_tail
+from .sse import coalesce_tokens, sse_event
 
 router = APIRouter()
 
@@ -41,9 +48,52 @@ class ConversationCreate(BaseModel):
     title: str = "Cuộc hội thoại mới"
 
 
+class ChunksRequest(BaseModel):
+    ids: List[str]
+
+
+def request_priority(request: Request) -> int:
+    """Lane ưu tiên cho request mang X-Priority-Key hợp lệ (vd cán bộ tuyển sinh)."""
+    key = request.headers.get("X-Priority-Key", "")
+    return PRIORITY_HIGH if key and key in settings.PRIORITY_KEYS else PRIORITY_NORMAL
+
+
+def overloaded(e: Overloaded) -> HTTPException:
+    return HTTPException(e.status_code, e.detail, headers={"Retry-After": str(e.retry_after)})
+
+
+async def load_prompt_history(request: Request, db: AsyncSession, conv_id: str, limit: int):
+    """
+    (summary, tin chưa tóm tắt) cho prompt: SessionCache trước, miss → đọc cửa sổ
+    từ DB rồi nạp cache. Hội thoại đã archive → restore về bảng nóng trước (tin
+    nhắn sắp ghi không bị mồ côi). Luôn trả connection về pool trước khi sang bước LLM.
+    """
+    sessions = getattr(request.app.state, "sessions", None)
+    archiver = getattr(request.app.state, "archiver", None)
+    drops = request.app.state.history_drops
+    if sessions is None:
+        if archiver is not None:
+            await archiver.restore(conv_id)
+        summary, upto, total, messages = await get_session_window(db, conv_id, limit)
+        drops.note(conv_id, total - upto, limit)
+        result = summary, prompt_tail(upto, total, messages, limit)
+    else:
+        result = sessions.prompt_history(conv_id, limit)
+        if result is None:
+            if archiver is not None:
+                await archiver.restore(conv_id)  # hội thoại archive không bao giờ nằm trong cache
+            sessions.begin_load(conv_id)
+            summary, upto, total, messages = await get_session_window(db, conv_id, sessions.window)
+            sessions.put(conv_id, summary, upto, total, messages)
+            drops.note(conv_id, total - upto, limit)
+            result = summary, prompt_tail(upto, total, messages, limit)
+    await db.close()  # trả connection về pool — không giữ trong lúc chờ admission / LLM
+    return result
+
+
 # ─── Chat Endpoints ──────────────────────────────────────────
 @router.post("/chat", response_model=ChatResponse)
-async def chat(req: ChatRequest, request: Request, db: Session = Depends(get_db)):
+async def chat(req: ChatRequest, request: Request, db: AsyncSession = Depends(get_db)):
     """
     Gửi câu hỏi → nhận câu trả lời + sources.
     Tự động tạo conversation mới nếu không có conversation_id.
@@ -51,22 +101,32 @@ async def chat(req: ChatRequest, request: Request, db: Session = Depends(get_db)
     engine = getattr(request.app.state, "chat_engine", None)
     if engine is None:
         raise HTTPException(503, "AI engine chưa sẵn sàng. Hãy index tài liệu trước.")
+    writer = request.app.state.writer
 
-    # Tạo conversation nếu cần
+    # Tạo conversation nếu cần (commit cùng batch với messages bên dưới)
     conv_id = req.conversation_id
     if not conv_id:
-        conv = create_conversation(db)
+        conv = await writer.create_conversation(durable=False)
         conv_id = conv.id
 
-    # Lấy history
-    history = get_history(db, conv_id)
+    # Lấy rolling summary + các tin chưa được tóm tắt (không load toàn bộ history)
+    summary, history = await load_prompt_history(request, db, conv_id, engine.prompt_builder.HISTORY_WINDOW)
 
     # Generate
-    result = engine.chat(req.query, history)
-
-    # Lưu messages
-    save_message(db, conv_id, "user", req.query)
-    save_message(db, conv_id, "assistant", result["answer"], result["sources"])
+    try:
+        result = await engine.chat(
+            req.query, history, priority=request_priority(request), summary=summary,
+        )
+    except Overloaded as e:
+        raise overloaded(e)
+
+    # Lưu messages — write-behind: 1 group commit cho cả lượt
+    await writer.save_message(conv_id, "user", req.query, durable=False)
+    committed = await writer.save_message(
+        conv_id, "assistant", result["answer"], **engine.source_refs(result["sources"]),
+    )
+    if engine.memory is not None:
+        engine.memory.schedule(conv_id, after=committed)
 
     return {
         "answer": result["answer"],
@@ -76,81 +136,166 @@ async def chat(req: ChatRequest, request: Request, db: Session = Depends(get_db)
 
 
 @router.post("/chat/stream")
-async def chat_stream(req: ChatRequest, request: Request, db: Session = Depends(get_db)):
+async def chat_stream(req: ChatRequest, request: Request, db: AsyncSession = Depends(get_db)):
     """Streaming endpoint — Server-Sent Events."""
     engine = getattr(request.app.state, "chat_engine", None)
     if engine is None:
         raise HTTPException(503, "AI engine chưa sẵn sàng.")
+    writer = request.app.state.writer
 
     # 1. Quản lý Conversation ID và Title
     is_new = False
     if not req.conversation_id:
         # Nếu chưa có ID, tạo mới với title là đoạn đầu query
         title = req.query[:30] + "..." if len(req.query) > 30 else req.query
-        conv = create_conversation(db, title=title)
+        conv = await writer.create_conversation(title=title, durable=False)
         conv_id = conv.id
         is_new = True
     else:
         conv_id = req.conversation_id
     
-    history = get_history(db, conv_id)
-
-    # 2. Lưu câu hỏi của User
-    save_message(db, conv_id, "user", req.query)
+    summary, history = await load_prompt_history(request, db, conv_id, engine.prompt_builder.HISTORY_WINDOW)
 
-    # 3. Lấy config từ request nếu có
-    llm_kwargs = {}
+    # 2. Lấy config từ request nếu có
+    llm_kwargs = {"priority": request_priority(request), "summary": summary}
+    summary_llm = None
     if req.llm_config:
-        llm_kwargs = {
+        summary_llm = {
             "api_key": req.llm_config.api_key,
             "provider": req.llm_config.provider,
             "model_name": req.llm_config.model
         }
+        llm_kwargs.update(summary_llm)
+
+    # 3. Admission: event đầu tiên chỉ có sau khi được cấp slot generation,
+    #    quá tải → 429/503 + Retry-After thay vì mở SSE stream
+    events = engine.stream_chat(req.query, history, **llm_kwargs)
+    try:
+        first = await events.__anext__()
+    except Overloaded as e:
+        raise overloaded(e)
+
+    # 4. Lưu câu hỏi của User (FIFO: commit xong thì conversation mới cũng đã commit)
+    #    Lỗi → đóng events để trả subscriber / huỷ generation đã bắt đầu
+    try:
+        await writer.save_message(conv_id, "user", req.query)
+    except BaseException:
+        await events.aclose()
+        raise
+
+    async def replay_first():
+        yield first
+        async for event in events:
+            yield event
+
+    # Event đầu tiên luôn mang sources (fast path / cache / retrieval)
+    refs = engine.source_refs(first.get("sources") or [])
 
     async def generate():
         full_answer = []
-        async for data_str in engine.stream_chat(req.query, history, **llm_kwargs):
-            try:
-                data = json.loads(data_str)
-                # Thêm conversation_id vào mọi chunk
-                data["conversation_id"] = conv_id
-                
-                if "token" in data:
-                    full_answer.append(data["token"])
-                
-                yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
-            except:
-                # Fallback nếu không phải JSON
-                yield f"data: {json.dumps({'token': data_str, 'conversation_id': conv_id}, ensure_ascii=False)}\n\n"
+        frames = coalesce_tokens(
+            replay_first(),
+            max_delay=settings.SSE_COALESCE_MS / 1000,
+            max_chars=settings.SSE_COALESCE_CHARS,
+        )
+        try:
+            async for event in frames:
+                if "token" in event:
+                    full_answer.append(event["token"])
+                # Thêm conversation_id vào mọi frame, serialize 1 lần
+                event["conversation_id"] = conv_id
+                yield sse_event(event)
+        finally:
+            # Client ngắt giữa chừng → huỷ đăng ký ngay, không chờ GC đóng generator.
+            # (generate() chưa kịp chạy thì events bị GC → finalizer aclose() làm thay)
+            await events.aclose()
 
         # Lưu câu trả lời sau khi stream xong
-        save_message(db, conv_id, "assistant", "".join(full_answer))
-        yield f"data: {json.dumps({'done': True, 'conversation_id': conv_id}, ensure_ascii=False)}\n\n"
+        committed = await writer.save_message(conv_id, "assistant", "".join(full_answer), **refs)
+        if engine.memory is not None:
+            # cập nhật summary ở background, cùng provider / key với lượt chat
+            engine.memory.schedule(conv_id, after=committed, llm=summary_llm)
+        yield sse_event({"done": True, "conversation_id": conv_id})
 
     return StreamingResponse(generate(), media_type="text/event-stream")
 
 
 # ─── Conversation Endpoints ───────────────────────────────────
 @router.get("/conversations")
-def list_conversations(db: Session = Depends(get_db)):
+async def list_conversations(db: AsyncSession = Depends(get_db)):
     """Lấy danh sách các cuộc hội thoại gần đây."""
-    from ..core.database import get_all_conversations
-    convs = get_all_conversations(db)
+    convs = await get_all_conversations(db)
     return [{"id": c.id, "title": c.title, "created_at": c.created_at} for c in convs]
 
 
 @router.post("/conversations")
-def new_conversation(body: ConversationCreate, db: Session = Depends(get_db)):
+async def new_conversation(body: ConversationCreate, request: Request):
     """Tạo cuộc hội thoại mới."""
-    conv = create_conversation(db, title=body.title)
+    conv = await request.app.state.writer.create_conversation(title=body.title)
     return {"id": conv.id, "title": conv.title, "created_at": conv.created_at}
 
 
 @router.get("/conversations/{conv_id}/messages")
-def get_messages(conv_id: str, db: Session = Depends(get_db)):
-    """Lấy lịch sử tin nhắn của một cuộc hội thoại."""
-    history = get_history(db, conv_id, limit=50)
-    return {"conversation_id": conv_id, "messages": history}
+async def get_messages(
+    conv_id: str,
+    request: Request,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Lịch sử tin nhắn, phân trang từ mới → cũ (keyset).
+    Trang đầu = các tin mới nhất; truyền before=next_cursor để tải tin cũ hơn.
+    """
+    try:
+        messages, next_cursor = await get_messages_page(db, conv_id, limit=limit, before=before)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if not messages and not before:
+        # Hội thoại cũ đã chuyển ra archive → đọc lại nguyên hội thoại từ file
+        archiver = getattr(request.app.state, "archiver", None)
+        archived = await archiver.load(conv_id) if archiver else None
+        if archived is not None:
+            return {"conversation_id": conv_id, "messages": archived["messages"], "next_cursor": None, "archived": True}
+    return {"conversation_id": conv_id, "messages": messages, "next_cursor": next_cursor}
+
+
+@router.get("/search")
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=10_000),
+    sort: str = Query("rank", pattern="^(rank|recent)$"),
+    role: Optional[str] = Query(None, pattern="^(user|assistant)$"),
+    conversation_id: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Tìm kiếm toàn văn trên tin nhắn (FTS5, không phân biệt dấu: "hoc phi" ~ "học phí").
+    sort=rank: liên quan nhất trước (bm25); sort=recent: mới nhất trước.
+    Phân trang: truyền offset=next_offset để lấy trang tiếp theo.
+    """
+    results, next_offset = await search_messages(
+        db, q, limit=limit, offset=offset, sort=sort, role=role, conversation_id=conversation_id,
+    )
+    return {"query": q, "results": results, "next_offset": next_offset}
+
+
+@router.post("/chunks")
+async def get_chunks(body: ChunksRequest, request: Request):
+    """
+    Nội dung các chunk nguồn theo chunk_id (tin nhắn chỉ lưu id).
+    Body thay vì query string: 1 trang history (limit=200) có tới 600 id.
+    Chunk không còn trong index hiện tại (đã re-ingest tài liệu khác) → null.
+    """
+    engine = getattr(request.app.state, "chat_engine", None)
+    if engine is None:
+        raise HTTPException(503, "AI engine chưa sẵn sàng.")
+    chunk_ids = list(dict.fromkeys(i for i in body.ids if i))
+    return {
+        "index_version": engine.retriever.index_version,
+        "chunks": engine.retriever.vs.get_chunks(chunk_ids),
+    }
 
 
 # ─── Ingest Endpoint (Upload tài liệu) ───────────────────────
@@ -176,6 +321,7 @@ async def ingest(request: Request, file: UploadFile = File(...)):
         tmp.write(content)
         tmp_path = tmp.name
 
+    start = time.perf_counter()
     try:
         engine = getattr(request.app.state, "chat_engine", None)
 
@@ -183,7 +329,14 @@ async def ingest(request: Request, file: UploadFile = File(...)):
         retriever = await build_index_incremental(tmp_path, engine)
         if engine:
             engine.retriever = retriever
-
+            # Bảng Excel → thêm vào fast path tra cứu
+            if engine.tables is not None and ext in {".xlsx", ".xls"}:
+                engine.tables.add_file(tmp_path, source=file.filename)
+    except Exception:
+        metrics.ingest_done(start, ok=False)
+        raise
+    else:
+        metrics.ingest_done(start, ok=True)
         return {
             "status": "success",
             "message": f"Đã index file: {file.filename}",
@@ -193,11 +346,43 @@ async def ingest(request: Request, file: UploadFile = File(...)):
         Path(tmp_path).unlink(missing_ok=True)
 
 
+# ─── Stats ───────────────────────────────────────────────────
+@router.get("/stats")
+def stats(request: Request):
+    """Số liệu vận hành: semantic cache hit rate, ..."""
+    engine = getattr(request.app.state, "chat_engine", None)
+    if engine is None:
+        raise HTTPException(503, "AI engine chưa sẵn sàng.")
+    data = engine.stats()
+    writer = getattr(request.app.state, "writer", None)
+    data["db_writer"] = writer.stats() if writer else None
+    data["database"] = storage_stats()
+    sessions = getattr(request.app.state, "sessions", None)
+    data["session_cache"] = sessions.stats() if sessions else None
+    drops = getattr(request.app.state, "history_drops", None)
+    data["history_dropped"] = drops.stats() if drops else None
+    archiver = getattr(request.app.state, "archiver", None)
+    data["archive"] = archiver.stats() if archiver else None
+    return data
+
+
 # ─── Health ──────────────────────────────────────────────────
 @router.get("/health")
+@router.get("/health/live")
 def health(request: Request):
+    """Liveness — luôn trả lời ngay, kể cả khi model đang load."""
     engine = getattr(request.app.state, "chat_engine", None)
     return {
         "status": "ok",
         "engine_ready": engine is not None,
     }
+
+
+@router.get("/health/ready")
+def ready(request: Request):
+    """Readiness — 503 cho đến khi model + indexes load xong."""
+    tracker = getattr(request.app.state, "startup", None)
+    startup = tracker.snapshot() if tracker else {"status": "ready"}
+    if startup["status"] != "ready":
+        return JSONResponse(status_code=503, content={"ready": False, "startup": startup})
+    return {"ready": True, "startup": startup}
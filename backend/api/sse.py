@@ -0,0 +1,123 @@
+"""
+Server-Sent Events — serialize 1 lần, gộp token thành frame.
+
+Engine yield event dạng dict ({"sources": ...}, {"token": ...}); route chỉ
+json.dumps đúng 1 lần khi ghi frame. Token được gộp theo cửa sổ thời gian /
+kích thước (vd 20ms hoặc 64 ký tự) → số frame và CPU mỗi câu trả lời giảm mạnh
+khi có nhiều stream đồng thời, độ trễ hiển thị tăng không đáng kể.
+"""
+import asyncio
+import json
+from typing import AsyncIterator
+
+
+def sse_event(data: dict) -> str:
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class _Flush:
+    """Marker của timer: hết cửa sổ thời gian của frame thứ `frame`."""
+
+    __slots__ = ("frame",)
+
+    def __init__(self, frame: int):
+        self.frame = frame
+
+
+class _Failed:
+    __slots__ = ("error",)
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_END = object()
+
+
+async def coalesce_tokens(
+    events: AsyncIterator[dict],
+    max_delay: float = 0.02,
+    max_chars: int = 64,
+) -> AsyncIterator[dict]:
+    """
+    Gộp các event {"token": ...} liên tiếp.
+    - Token đầu tiên flush ngay (không làm chậm time-to-first-token)
+    - Sau đó flush khi buffer đủ max_chars hoặc token cũ nhất chờ quá max_delay
+    - Event khác (sources, ...) flush buffer rồi đi qua nguyên vẹn
+
+    1 task đọc upstream cho cả stream, đẩy event vào queue; cửa sổ thời gian là
+    1 timer / frame đẩy marker vào cùng queue → không tạo task / wait mới mỗi token.
+    """
+    loop = asyncio.get_running_loop()
+    iterator = events.__aiter__()
+    queue: asyncio.Queue = asyncio.Queue()
+    buffer = []
+    size = 0
+    frame = 0
+    timer = None
+    first = True
+
+    async def read():
+        try:
+            while True:
+                queue.put_nowait(await iterator.__anext__())
+        except StopAsyncIteration:
+            queue.put_nowait(_END)
+        except BaseException as e:  # kể cả CancelledError của upstream → raise lại ở consumer
+            queue.put_nowait(_Failed(e))
+
+    def flush() -> dict:
+        nonlocal buffer, size, frame, timer
+        if timer is not None:
+            timer.cancel()
+            timer = None
+        frame += 1
+        text, buffer, size = "".join(buffer), [], 0
+        return {"token": text}
+
+    reader = asyncio.ensure_future(read())
+    try:
+        while True:
+            item = await queue.get()
+            if item is _END:
+                break
+            if isinstance(item, _Failed):
+                raise item.error
+            if isinstance(item, _Flush):
+                if item.frame == frame and buffer:  # marker cũ (frame đã flush theo size) → bỏ qua
+                    yield flush()
+                continue
+
+            token = item.get("token") if len(item) == 1 else None
+            if token is None:
+                if buffer:
+                    yield flush()
+                yield item
+                continue
+
+            if first:
+                first = False
+                yield item
+                continue
+
+            if not buffer:
+                timer = loop.call_later(max_delay, queue.put_nowait, _Flush(frame))
+            buffer.append(token)
+            size += len(token)
+            if size >= max_chars:
+                yield flush()
+
+        if buffer:
+            yield flush()
+    finally:
+        if timer is not None:
+            timer.cancel()
+        if not reader.done():
+            reader.cancel()
+            try:
+                await reader
+            except BaseException:
+                pass
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
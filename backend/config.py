@@ -1,16 +1,101 @@
 """App configuration từ .env file."""
+from typing import Dict, List, Optional
+
 from pydantic_settings import BaseSettings
 
 
 class Settings(BaseSettings):
     GEMINI_API_KEY: str = ""
+    GEMINI_API_ENDPOINT: str = ""     # để trống = endpoint mặc định của Google
+    GEMINI_TRANSPORT: str = ""        # "rest" | "grpc" — để trống = mặc định SDK
+    LLM_THREADS: int = 128            # thread pool cho SDK blocking (Gemini stream)
+    LLM_CLIENT_POOL_SIZE: int = 64    # số client (provider, model, credential) giữ lại
+    LLM_CLIENT_IDLE_TTL: int = 900    # giây — client idle lâu hơn thì huỷ
     LLM_PROVIDER: str = "gemini"  # "gemini" hoặc "ollama"
     OLLAMA_MODEL: str = "qwen2.5:7b"
+    OLLAMA_BASE_URL: str = "http://localhost:11434"
+    OLLAMA_MAX_CONNECTIONS: int = 20
+    OLLAMA_MAX_KEEPALIVE: int = 10
+    OLLAMA_CONNECT_TIMEOUT: float = 5.0
+    OLLAMA_READ_TIMEOUT: float = 120.0
+    OLLAMA_MAX_RETRIES: int = 2
+    # Hedge / failover: target dự phòng dạng "provider:model", vd ["ollama:qwen2.5:7b"]
+    LLM_FALLBACKS: List[str] = []
+    LLM_HEDGE_ENABLED: bool = True
+    LLM_HEDGE_QUANTILE: float = 0.95      # hedge delay = quantile TTFT của target
+    LLM_HEDGE_MIN_DELAY_MS: float = 250.0
+    LLM_HEDGE_MAX_DELAY_MS: float = 4000.0
+    LLM_HEDGE_DEFAULT_DELAY_MS: float = 1500.0  # khi chưa đủ mẫu TTFT
+    SINGLE_FLIGHT_ENABLED: bool = True    # gộp request giống hệt nhau đang chạy
+    # Admission control: số generation đồng thời tối đa theo provider
+    LLM_CONCURRENCY: Dict[str, int] = {"gemini": 16, "ollama": 4}
+    LLM_QUEUE_SIZE: int = 64              # số request chờ tối đa mỗi provider
+    LLM_QUEUE_TIMEOUT: float = 10.0       # giây — chờ lâu hơn thì trả 503
+    PRIORITY_KEYS: List[str] = []         # giá trị X-Priority-Key được vào lane ưu tiên
+    # SSE: gộp token thành 1 frame theo cửa sổ thời gian / số ký tự
+    SSE_COALESCE_MS: float = 20.0
+    SSE_COALESCE_CHARS: int = 64
     EMBEDDING_MODEL: str = "keepitreal/vietnamese-sbert"
     CHUNK_SIZE: int = 256
     CHUNK_OVERLAP: int = 50
     TOP_K: int = 5
+    # Hybrid retrieval: trọng số RRF + số candidate mỗi retriever (k * factor)
+    RRF_DENSE_WEIGHT: float = 1.0
+    RRF_SPARSE_WEIGHT: float = 1.5
+    RETRIEVAL_CANDIDATE_FACTOR: int = 3
+    # Cross-encoder re-ranker (sau RRF fusion)
+    RERANKER_ENABLED: bool = False
+    RERANKER_MODEL: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+    RERANKER_CANDIDATES: int = 15        # số candidate fusion đưa vào cross-encoder
+    RERANKER_TOP_N: int = 3              # số chunk giữ lại cho LLM
+    RERANKER_MIN_SCORE: Optional[float] = None
+    RERANKER_LATENCY_BUDGET_MS: float = 200.0
+
+    # Fast path tra cứu bảng điểm chuẩn / học phí (không gọi LLM)
+    TABLE_FAST_PATH_ENABLED: bool = True
+    # Rolling summary hội thoại (prompt = summary + lượt mới nhất)
+    CONVERSATION_SUMMARY_ENABLED: bool = True
+    CONVERSATION_SUMMARY_MAX_TOKENS: int = 300
+    CONVERSATION_SUMMARY_KEEP_MESSAGES: int = 2   # tin mới nhất giữ nguyên văn (1 lượt)
+    # FAQ intent router (exemplars trong data/faq.json, tự reload khi file đổi)
+    FAQ_ENABLED: bool = True
+    FAQ_PATH: str = "data/faq.json"       # tương đối với thư mục backend/
+    FAQ_THRESHOLD: float = 0.82           # cosine tối thiểu với 1 exemplar
+    FAQ_MARGIN: float = 0.04              # chênh lệch tối thiểu với intent thứ 2
+    FAQ_RELOAD_INTERVAL: float = 5.0      # giây giữa 2 lần kiểm tra mtime
+
+    # Semantic answer cache
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_THRESHOLD: float = 0.92   # cosine tối thiểu giữa 2 query
+    SEMANTIC_CACHE_TTL: int = 3600           # giây
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 1000
+    SEMANTIC_CACHE_MAX_BYTES: int = 16 * 1024 * 1024
+    # Ngân sách token cho prompt, key "provider" hoặc "provider:model"
+    CONTEXT_TOKEN_BUDGETS: Dict[str, int] = {"gemini": 6000, "ollama": 2500}
     DATABASE_URL: str = "sqlite:///./chatbot.db"
+    # SQLite storage profile (WAL, 1 writer + pool chỉ-đọc)
+    DB_READ_POOL_SIZE: int = 8
+    DB_SYNCHRONOUS: str = "NORMAL"        # NORMAL an toàn với WAL; FULL = fsync mỗi commit
+    DB_MMAP_SIZE: int = 268435456         # 256MB
+    DB_CACHE_SIZE_KB: int = 65536         # page cache mỗi connection
+    DB_BUSY_TIMEOUT_MS: int = 5000
+    DB_WAL_AUTOCHECKPOINT: int = 1000     # pages
+    DB_CHECKPOINT_INTERVAL: float = 60.0  # giây, 0 = tắt checkpoint nền
+    # Retention: hội thoại không hoạt động > ARCHIVE_RETENTION_DAYS → zstd JSONL theo tháng
+    ARCHIVE_ENABLED: bool = True
+    ARCHIVE_DIR: str = "data/archive"     # tương đối với thư mục backend/
+    ARCHIVE_RETENTION_DAYS: int = 180
+    ARCHIVE_INTERVAL: float = 86400.0     # giây giữa 2 lần chạy job
+    ARCHIVE_BATCH: int = 200              # hội thoại / frame / transaction
+    # Session cache: cửa sổ hội thoại nóng trong RAM (write-through, LRU theo bytes)
+    SESSION_CACHE_ENABLED: bool = True
+    SESSION_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    SESSION_CACHE_WINDOW: int = 12        # tin nhắn / hội thoại (≥ cửa sổ history của prompt)
+    # Write-behind: gom ghi message thành group commit
+    DB_WRITE_DURABILITY: str = "flush"    # flush = chờ commit rồi mới trả lời | async = fire-and-forget
+    DB_FLUSH_INTERVAL_MS: float = 10.0    # cửa sổ gom batch
+    DB_WRITE_BATCH: int = 256             # số row tối đa / transaction
+    DB_WRITE_QUEUE: int = 10000           # queue đầy → request chờ (backpressure)
     HOST: str = "0.0.0.0"
     PORT: int = 8000
 
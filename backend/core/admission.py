@@ -0,0 +1,209 @@
+"""
+Module 8d: Admission control — giới hạn số generation đồng thời theo provider.
+
+Không giới hạn → spike traffic đẩy toàn bộ tải vào Ollama / quota Gemini,
+mọi request cùng chậm. Scheduler:
+- Mỗi provider có số slot generation tối đa (concurrency limit)
+- Hết slot → xếp hàng (bounded), lane ưu tiên (HIGH) được phục vụ trước
+- Hàng đợi đầy → từ chối ngay 429 + Retry-After
+- Ước lượng thời gian chờ vượt deadline, hoặc chờ quá deadline → 503 + Retry-After
+  (không giữ request mà chắc chắn client đã bỏ đi)
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from typing import Dict, List, Optional
+
+from .llm_router import LatencyHistogram
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2     # việc nền (vd tóm tắt hội thoại) — phục vụ sau mọi request người dùng
+
+
+class Overloaded(Exception):
+    """Không nhận thêm generation: status_code 429 (queue đầy) hoặc 503 (quá deadline)."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "future")
+
+    def __init__(self, priority: int, seq: int, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.future = future
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class Slot:
+    """Quyền chạy 1 generation. release() idempotent."""
+
+    def __init__(self, gate: "ProviderGate"):
+        self._gate = gate
+        self._start = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._gate._release(time.monotonic() - self._start)
+
+
+class ProviderGate:
+
+    def __init__(self, name: str, limit: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self.active = 0
+        self.waiting = 0
+        self._heap: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._service_time: Optional[float] = None  # EMA thời gian giữ slot
+
+        self.wait_time = LatencyHistogram()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_full = 0
+        self.dropped_deadline = 0
+        self.max_depth = 0
+        self.by_priority = {PRIORITY_HIGH: 0, PRIORITY_NORMAL: 0}
+
+    def estimated_wait(self, position: int) -> float:
+        """Thời gian chờ ước lượng cho người thứ `position` trong hàng."""
+        service = self._service_time if self._service_time is not None else 1.0
+        return position * service / self.limit
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.estimated_wait(self.waiting + 1)))
+
+    async def acquire(self, priority: int = PRIORITY_NORMAL) -> Slot:
+        self.by_priority[priority] = self.by_priority.get(priority, 0) + 1
+        if self.active < self.limit and not self.waiting:
+            return self._admit(0.0)
+
+        if self.waiting >= self.max_queue:
+            self.rejected_full += 1
+            raise Overloaded(429, f"{self.name}: generation queue full", self.retry_after())
+
+        # Lane ưu tiên chỉ phải chờ các waiter ưu tiên khác
+        ahead = self.waiting if priority != PRIORITY_HIGH else sum(
+            1 for w in self._heap if w.priority == PRIORITY_HIGH and not w.future.done()
+        )
+        if self.estimated_wait(ahead + 1) > self.queue_timeout:
+            self.dropped_deadline += 1
+            raise Overloaded(503, f"{self.name}: estimated wait exceeds deadline", self.retry_after())
+
+        start = time.monotonic()
+        waiter = _Waiter(priority, next(self._seq), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._heap, waiter)
+        self.waiting += 1
+        self.queued += 1
+        self.max_depth = max(self.max_depth, self.waiting)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not waiter.future.done():
+                waiter.future.cancel()
+                self.waiting -= 1
+                self.dropped_deadline += 1
+                raise Overloaded(503, f"{self.name}: queue deadline exceeded", self.retry_after())
+        except BaseException:
+            # Client huỷ khi đang chờ: trả lại slot nếu vừa được cấp
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(None)
+            else:
+                waiter.future.cancel()
+                self.waiting -= 1
+            raise
+        return self._record_wait(time.monotonic() - start)
+
+    def _admit(self, waited: float) -> Slot:
+        self.active += 1
+        return self._record_wait(waited)
+
+    def _record_wait(self, waited: float) -> Slot:
+        self.admitted += 1
+        self.wait_time.observe(waited)
+        return Slot(self)
+
+    def _release(self, held: Optional[float]) -> None:
+        if held is not None:
+            self._service_time = held if self._service_time is None else 0.8 * self._service_time + 0.2 * held
+        self.active -= 1
+        # Chuyển slot cho waiter kế tiếp còn chờ (bỏ qua waiter đã huỷ / quá hạn)
+        while self._heap and self.active < self.limit:
+            waiter = heapq.heappop(self._heap)
+            if waiter.future.done():
+                continue
+            self.waiting -= 1
+            self.active += 1
+            waiter.future.set_result(True)
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_depth,
+            "queue_capacity": self.max_queue,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected_queue_full": self.rejected_full,
+            "dropped_deadline": self.dropped_deadline,
+            "by_priority": {"high": self.by_priority[PRIORITY_HIGH], "normal": self.by_priority[PRIORITY_NORMAL]},
+            "wait_ms": {
+                "p50": round(1000 * (self.wait_time.quantile(0.5) or 0), 1),
+                "p95": round(1000 * (self.wait_time.quantile(0.95) or 0), 1),
+                "p99": round(1000 * (self.wait_time.quantile(0.99) or 0), 1),
+            },
+            "service_time_ms": round(1000 * self._service_time, 1) if self._service_time else None,
+        }
+
+
+class AdmissionController:
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, int]] = None,
+        max_queue: int = 64,
+        queue_timeout: float = 10.0,
+        default_limit: int = 8,
+    ):
+        self.limits = limits or {}
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.default_limit = default_limit
+        self._gates: Dict[str, ProviderGate] = {}
+
+    def gate(self, provider: str) -> ProviderGate:
+        if provider not in self._gates:
+            self._gates[provider] = ProviderGate(
+                provider,
+                self.limits.get(provider, self.default_limit),
+                self.max_queue,
+                self.queue_timeout,
+            )
+        return self._gates[provider]
+
+    async def acquire(self, provider: str, priority: int = PRIORITY_NORMAL) -> Slot:
+        return await self.gate(provider).acquire(priority)
+
+    def stats(self) -> dict:
+        return {name: gate.stats() for name, gate in self._gates.items()}
+
+    def wait_histograms(self) -> dict:
+        """provider → snapshot histogram thời gian chờ slot (cho /metrics)."""
+        return {name: gate.wait_time.snapshot() for name, gate in self._gates.items()}
@@ -0,0 +1,337 @@
+"""
+Retention / archival — bảng nóng không phình mãi qua mùa tuyển sinh.
+
+Job định kỳ (archive_loop):
+1. Chọn hội thoại không còn hoạt động: tạo trước cutoff (now - retention_days)
+   và không có tin nhắn nào từ cutoff — theo batch, qua index created_at và
+   (conversation_id, created_at)
+2. Ghi ra <archive_dir>/<YYYY-MM>.jsonl.zst (tháng tạo hội thoại): mỗi batch là
+   1 frame zstd nối vào cuối file (các frame nối nhau vẫn là 1 file zstd hợp lệ),
+   fsync trước khi xoá gì khỏi DB
+3. 1 transaction ghi: thêm dòng archived_conversations (file, offset, length của
+   frame) + xoá khỏi messages / conversations (trigger FTS tự dọn index tìm kiếm)
+4. Gộp segment FTS (tombstone của các tin vừa xoá), rồi PRAGMA incremental_vacuum từng bước nhỏ — trả trang trống cho OS mà không giữ
+   write lock lâu. Chỉ khi DB đã ở auto_vacuum=INCREMENTAL: DB tạo trước đó
+   chuyển offline bằng backend.dev.enable_incremental_vacuum (VACUUM toàn bộ)
+
+Đọc lại theo yêu cầu: tra index → đọc đúng 1 frame → giải nén → tìm dòng.
+Hội thoại archive nhận tin nhắn mới → restore() đưa lại bảng nóng trước khi ghi.
+Crash giữa bước 2 và 3: frame mồ côi trong file (vô hại), lần chạy sau archive lại.
+"""
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import zstandard
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from . import database
+from .database import ArchivedConversation, Conversation, Message, ReadSession, SessionLocal, write_lock, writing
+from .message_search import optimize_search_index
+from .session_cache import SessionCache
+
+RESTORE_GRACE = 3600.0  # giây — hội thoại vừa restore không bị archive lại trước khi tin mới kịp commit
+
+
+class ConversationArchiver:
+
+    def __init__(
+        self,
+        archive_dir: Path,
+        retention_days: int = 180,
+        batch: int = 200,
+        level: int = 10,
+        vacuum_step: int = 1000,
+        sessions: Optional[SessionCache] = None,
+        has_pending: Optional[Callable[[str], bool]] = None,
+        session_factory=SessionLocal,
+        read_session_factory=ReadSession,
+        engine: Optional[AsyncEngine] = None,
+    ):
+        """
+        Args:
+            retention_days: hội thoại không hoạt động lâu hơn → chuyển ra archive
+            batch:          số hội thoại / frame / transaction
+            vacuum_step:    số trang trả lại mỗi lần giữ write lock
+            has_pending:    hội thoại còn row trong write-behind queue → bỏ qua lượt này
+        """
+        self.archive_dir = Path(archive_dir)
+        self.retention_days = retention_days
+        self.batch = batch
+        self.level = level
+        self.vacuum_step = vacuum_step
+        self.sessions = sessions
+        self.has_pending = has_pending
+        self.session_factory = session_factory
+        self.read_session_factory = read_session_factory
+        self.engine = engine or database.engine
+
+        self.runs = 0
+        self.archived = 0
+        self.restored = 0
+        self.failures = 0
+        self.freed_pages = 0
+        self.archive_bytes = 0
+        self.last_run: Dict = {}
+        self._restored_at: Dict[str, float] = {}
+        self._warned_full_vacuum = False
+
+    # ─── Job ─────────────────────────────────────────────────
+    async def run_once(self, now: Optional[datetime] = None) -> dict:
+        start = time.perf_counter()
+        cutoff = (now or datetime.utcnow()) - timedelta(days=self.retention_days)
+        for cid in list(self._restored_at):
+            self._recently_restored(cid)  # dọn mốc restore đã hết hạn
+        archived = 0
+        while True:
+            found, done = await self.archive_batch(cutoff)
+            archived += done
+            if found < self.batch or done == 0:
+                break
+        if archived:
+            async with write_lock:
+                async with self.engine.begin() as conn:
+                    await conn.run_sync(optimize_search_index)
+        freed = await self.vacuum()
+        self.runs += 1
+        self.last_run = {
+            "cutoff": cutoff.isoformat(),
+            "archived": archived,
+            "freed_pages": freed,
+            "ms": round((time.perf_counter() - start) * 1000, 1),
+        }
+        if archived:
+            print(f"  [INFO] Archive: {archived} conversations older than {cutoff:%Y-%m-%d} "
+                  f"moved out, {freed} pages freed ({self.last_run['ms']}ms)")
+        return self.last_run
+
+    async def archive_batch(self, cutoff: datetime) -> Tuple[int, int]:
+        """Returns: (số hội thoại ứng viên, số hội thoại đã archive)."""
+        async with self.read_session_factory() as db:
+            active = (
+                select(Message.id)
+                .where(Message.conversation_id == Conversation.id, Message.created_at >= cutoff)
+                .exists()
+            )
+            convs = (await db.scalars(
+                select(Conversation)
+                .where(Conversation.created_at < cutoff, ~active)
+                .order_by(Conversation.created_at)
+                .limit(self.batch)
+            )).all()
+            found = len(convs)
+            if self.has_pending:
+                convs = [c for c in convs if not self.has_pending(c.id)]
+            convs = [c for c in convs if not self._recently_restored(c.id)]
+            ids = [c.id for c in convs]
+            msgs = (await db.scalars(
+                select(Message).where(Message.conversation_id.in_(ids))
+                .order_by(Message.conversation_id, Message.created_at)
+            )).all() if ids else []
+        if not convs:
+            return found, 0
+
+        by_conv: Dict[str, List[Message]] = {}
+        for m in msgs:
+            by_conv.setdefault(m.conversation_id, []).append(m)
+        by_month: Dict[str, List[Conversation]] = {}
+        for c in convs:
+            by_month.setdefault(f"{c.created_at:%Y-%m}", []).append(c)
+
+        index = []
+        for month, group in by_month.items():
+            records = [self._record(c, by_conv.get(c.id, [])) for c in group]
+            file = f"{month}.jsonl.zst"
+            offset, length = await asyncio.to_thread(self._append_frame, file, records)
+            for c in group:
+                history = by_conv.get(c.id, [])
+                index.append(ArchivedConversation(
+                    id=c.id, title=c.title, created_at=c.created_at,
+                    last_message_at=history[-1].created_at if history else c.created_at,
+                    messages=len(history), file=file, offset=offset, length=length,
+                ))
+
+        try:
+            async with self.session_factory() as db:
+                async with writing(db):
+                    # Hội thoại có tin nhắn mới trong lúc ghi file → giữ lại bảng nóng
+                    revived = set((await db.scalars(
+                        select(Message.conversation_id).distinct()
+                        .where(Message.conversation_id.in_(ids), Message.created_at >= cutoff)
+                    )).all())
+                    done = [i for i in ids if i not in revived]
+                    await db.execute(delete(ArchivedConversation).where(ArchivedConversation.id.in_(done)))
+                    db.add_all(row for row in index if row.id not in revived)
+                    await db.execute(delete(Message).where(Message.conversation_id.in_(done)))
+                    await db.execute(delete(Conversation).where(Conversation.id.in_(done)))
+        except Exception as e:
+            self.failures += 1
+            print(f"  [WARN] Archive batch failed ({e}), conversations stay in hot tables")
+            return found, 0
+
+        if self.sessions is not None:
+            for cid in done:
+                self.sessions.invalidate(cid)
+        self.archived += len(done)
+        return found, len(done)
+
+    @staticmethod
+    def _record(c: Conversation, msgs: List[Message]) -> dict:
+        return {
+            "id": c.id,
+            "title": c.title,
+            "created_at": c.created_at.isoformat(),
+            "summary": c.summary or "",
+            "summary_upto": c.summary_upto or 0,
+            "messages": [
+                {
+                    "id": m.id,
+                    "role": m.role,
+                    "content": m.content,
+                    "sources": json.loads(m.sources) if m.sources else [],
+                    "source_ids": m.source_ids.split(",") if m.source_ids else [],
+                    "index_version": m.index_version or "",
+                    "created_at": m.created_at.isoformat(),
+                }
+                for m in msgs
+            ],
+        }
+
+    def _append_frame(self, file: str, records: List[dict]) -> Tuple[int, int]:
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+        frame = zstandard.ZstdCompressor(level=self.level).compress(data)
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.archive_dir / file, "ab") as f:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(frame)
+            f.flush()
+            os.fsync(f.fileno())
+        self.archive_bytes += len(frame)
+        return offset, len(frame)
+
+    # ─── Compaction ──────────────────────────────────────────
+    async def vacuum(self) -> int:
+        """
+        Trả các trang trống (sau khi xoá) về OS theo từng bước vacuum_step trang.
+        DB tạo trước khi bật auto_vacuum=INCREMENTAL → bỏ qua: chuyển đổi cần VACUUM
+        toàn bộ (ghi lại cả file, chặn mọi lượt ghi) nên chỉ chạy offline.
+        """
+        freed = 0
+        while True:
+            async with write_lock:
+                async with self.engine.connect() as conn:
+                    if (await conn.exec_driver_sql("PRAGMA auto_vacuum")).scalar() != 2:
+                        if not self._warned_full_vacuum:
+                            self._warned_full_vacuum = True
+                            print("  [WARN] Archive: auto_vacuum is not INCREMENTAL, free pages are kept. "
+                                  "Stop the server and run python -m backend.dev.enable_incremental_vacuum")
+                        return 0
+                    free = (await conn.exec_driver_sql("PRAGMA freelist_count")).scalar()
+                    if not free:
+                        break
+                    # pysqlite execute() chỉ step 1 lần = 1 trang; executescript chạy tới hết
+                    raw = await conn.get_raw_connection()
+                    await raw.driver_connection.executescript(f"PRAGMA incremental_vacuum({self.vacuum_step});")
+            freed += min(free, self.vacuum_step)
+            await asyncio.sleep(0)  # nhường write lock cho writer giữa các bước
+        self.freed_pages += freed
+        return freed
+
+    # ─── Đọc lại ─────────────────────────────────────────────
+    async def load(self, conversation_id: str) -> Optional[dict]:
+        """Hội thoại đã archive (đủ tin nhắn) hoặc None nếu không có trong archive."""
+        async with self.read_session_factory() as db:
+            row = await db.get(ArchivedConversation, conversation_id)
+        if row is None:
+            return None
+        return await asyncio.to_thread(self._read_record, row.file, row.offset, row.length, conversation_id)
+
+    async def restore(self, conversation_id: str) -> bool:
+        """
+        Hội thoại đã archive nhận tin nhắn mới → đưa lại bảng nóng (conversation +
+        toàn bộ tin nhắn, summary) trước khi ghi tin mới, để tin mới không mồ côi
+        và prompt vẫn có history. Frame cũ trong file thành mồ côi (vô hại).
+        Returns False nếu hội thoại không có trong archive.
+        """
+        record = await self.load(conversation_id)
+        if record is None:
+            return False
+        # Đánh dấu trước khi commit: job archive chọn ứng viên sau thời điểm này sẽ bỏ qua
+        self._restored_at[conversation_id] = time.monotonic()
+        async with self.session_factory() as db:
+            async with writing(db):
+                if await db.get(ArchivedConversation, conversation_id) is None:
+                    return True  # request khác vừa restore xong
+                db.add(Conversation(
+                    id=record["id"],
+                    title=record["title"],
+                    created_at=datetime.fromisoformat(record["created_at"]),
+                    summary=record["summary"],
+                    summary_upto=record["summary_upto"],
+                ))
+                db.add_all(
+                    Message(
+                        id=m["id"],
+                        conversation_id=conversation_id,
+                        role=m["role"],
+                        content=m["content"],
+                        sources=database.encode_sources(m["sources"]),
+                        source_ids=",".join(m["source_ids"]),
+                        index_version=m["index_version"],
+                        created_at=datetime.fromisoformat(m["created_at"]),
+                    )
+                    for m in record["messages"]
+                )
+                await db.execute(delete(ArchivedConversation).where(ArchivedConversation.id == conversation_id))
+        if self.sessions is not None:
+            self.sessions.invalidate(conversation_id)
+        self.restored += 1
+        print(f"  [INFO] Archive: conversation {conversation_id} restored "
+              f"({len(record['messages'])} messages)")
+        return True
+
+    def _recently_restored(self, conversation_id: str) -> bool:
+        restored_at = self._restored_at.get(conversation_id)
+        if restored_at is None:
+            return False
+        if time.monotonic() - restored_at < RESTORE_GRACE:
+            return True
+        del self._restored_at[conversation_id]
+        return False
+
+    def _read_record(self, file: str, offset: int, length: int, conversation_id: str) -> Optional[dict]:
+        with open(self.archive_dir / file, "rb") as f:
+            f.seek(offset)
+            frame = f.read(length)
+        for line in zstandard.ZstdDecompressor().decompress(frame).splitlines():
+            record = json.loads(line)
+            if record["id"] == conversation_id:
+                return record
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "retention_days": self.retention_days,
+            "runs": self.runs,
+            "archived": self.archived,
+            "restored": self.restored,
+            "failures": self.failures,
+            "freed_pages": self.freed_pages,
+            "archive_bytes_written": self.archive_bytes,
+            "last_run": dict(self.last_run),
+        }
+
+
+async def archive_loop(archiver: ConversationArchiver, interval: float) -> None:
+    """Chạy job archive định kỳ (lần đầu sau interval — không tranh tài nguyên lúc startup)."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await archiver.run_once()
+        except Exception as e:
+            print(f"  [WARN] Archive job failed: {e}")
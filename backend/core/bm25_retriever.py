@@ -22,17 +22,28 @@ from typing import List, Tuple
 import numpy as np
 from rank_bm25 import BM25Okapi
 
-try:
-    from underthesea import word_tokenize
-    _HAS_UNDERTHESEA = True
-except ImportError:
-    _HAS_UNDERTHESEA = False
-    print("  [Warning] underthesea not found. Using whitespace tokenizer.")
+_word_tokenize = None   # underthesea.word_tokenize — import lazy ở lần gọi đầu
+_HAS_UNDERTHESEA: bool | None = None
+
+
+def _get_word_tokenize():
+    """Import underthesea lần đầu cần dùng (import mất vài giây)."""
+    global _word_tokenize, _HAS_UNDERTHESEA
+    if _HAS_UNDERTHESEA is None:
+        try:
+            from underthesea import word_tokenize
+            _word_tokenize = word_tokenize
+            _HAS_UNDERTHESEA = True
+        except ImportError:
+            _HAS_UNDERTHESEA = False
+            print("  [Warning] underthesea not found. Using whitespace tokenizer.")
+    return _word_tokenize
 
 
 def tokenize_vi(text: str) -> List[str]:
     """Tokenize tiếng Việt — underthesea nếu có, fallback whitespace."""
-    if _HAS_UNDERTHESEA:
+    word_tokenize = _get_word_tokenize()
+    if word_tokenize is not None:
         return word_tokenize(text, format="text").split()
     return text.lower().split()
 
@@ -7,12 +7,25 @@ PTIT System Prompt được tối ưu để:
 - Phân biệt 2 cơ sở HN và HCM
 - Hướng dẫn thủ tục nhập học rõ ràng
 """
-import json
-from typing import AsyncIterator, List, Optional
+import asyncio
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
-import google.generativeai as genai
+import numpy as np
 
+from .admission import PRIORITY_LOW, PRIORITY_NORMAL, AdmissionController
+from .context_packer import ContextPacker
+from .conversation_memory import ConversationMemory
+from .faq_router import FAQRouter
 from .hybrid_retriever import HybridRetriever
+from .llm_providers import GeminiProvider, OllamaProvider, ProviderPool, ThreadBridge
+from .llm_router import LLMRouter, LLMTarget
+from .metrics import metrics
+from .semantic_cache import SemanticCache, chunk_set_key
+from .single_flight import SingleFlight, Subscription, flight_key, normalize_query
+from .table_index import TableIndex
+from .vector_store import chunk_id
 
 
 class PromptBuilder:
@@ -27,34 +40,81 @@ QUY TẮC BẮT BUỘC:
 4. PHÂN BIỆT rõ ràng Hà Nội (BVH) và TP.HCM (BVS).
 5. Ưu tiên trả lời bằng danh sách hoặc bảng nếu có nhiều số liệu."""
 
+    HISTORY_WINDOW = 6  # sliding window 3 turns (6 messages) — tin chưa được tóm tắt
+    CHUNK_HEADER = "[Nguồn {n}]\n"
+    CHUNK_SEPARATOR = "\n\n---\n\n"
+    HISTORY_HEADER = "\n=== LỊCH SỬ HỘI THOẠI ==="
+
+    def __init__(self, packer: Optional[ContextPacker] = None):
+        self.packer = packer or ContextPacker()
+
     def build(
         self,
         query: str,
         context_chunks: List[str],
         history: Optional[List[dict]] = None,
+        summary: str = "",
     ) -> str:
+        turns = history[-self.HISTORY_WINDOW:] if history else []
+        return self._render(query, context_chunks, turns, summary)
+
+    def build_packed(
+        self,
+        query: str,
+        results: List[Tuple[str, float]],
+        history: Optional[List[dict]] = None,
+        token_budget: Optional[int] = None,
+        summary: str = "",
+    ) -> Tuple[str, Dict[str, int], List[str]]:
+        """
+        Build prompt trong ngân sách token.
+        summary: rolling summary của phần hội thoại cũ (history chỉ còn tin chưa tóm tắt)
+        Returns: (prompt, usage, chunks) — usage = số token từng phần (system, context, history),
+                 chunks = các chunk thực sự có trong prompt (đã bỏ / cắt theo ngân sách).
+        """
+        turns = history[-self.HISTORY_WINDOW:] if history else []
+        if token_budget is None:
+            chunks = [c for c, _ in results]
+            prompt = self._render(query, chunks, turns, summary)
+            return prompt, {"total": self.packer.counter.count(prompt)}, chunks
+
+        # Phần cố định = prompt với context/history rỗng (summary đã giới hạn độ dài → tính vào đây)
+        # + header mục lịch sử nếu có history (bỏ dư nếu cuối cùng không giữ tin nào)
+        fixed = self.packer.counter.count(self._render(query, [], [], summary))
+        if turns:
+            fixed += self.packer.counter.count(self.HISTORY_HEADER)
+        packed = self.packer.pack(results, turns, token_budget, fixed, self._frame_tokens)
+        prompt = self._render(query, packed.chunks, packed.history, summary)
+        return prompt, packed.usage, packed.chunks
+
+    def _frame_tokens(self, i: int) -> int:
+        """Token của header "[Nguồn i]" + dấu phân cách trước chunk thứ i (từ 0)."""
+        frame = self.CHUNK_HEADER.format(n=i + 1) + (self.CHUNK_SEPARATOR if i else "")
+        return self.packer.counter.count(frame)
+
+    def _render(self, query: str, context_chunks: List[str], turns: List[dict], summary: str = "") -> str:
         if context_chunks:
-            context = "\n\n---\n\n".join(
-                f"[Nguồn {i+1}]\n{chunk}"
+            context = self.CHUNK_SEPARATOR.join(
+                self.CHUNK_HEADER.format(n=i + 1) + chunk
                 for i, chunk in enumerate(context_chunks)
             )
         else:
             context = "Không tìm thấy thông tin liên quan trong cơ sở dữ liệu."
 
         history_str = ""
-        if history:
-            turns = history[-6:]  # sliding window 3 turns (6 messages)
-            for turn in turns:
-                role = "Người dùng" if turn["role"] == "user" else "Trợ lý"
-                history_str += f"\n{role}: {turn['content']}"
+        for turn in turns:
+            role = "Người dùng" if turn["role"] == "user" else "Trợ lý"
+            history_str += f"\n{role}: {turn['content']}"
 
         prompt = f"""{self.SYSTEM}
 
 === THÔNG TIN TUYỂN SINH (NGỮ CẢNH) ===
 {context}
 """
+        if summary:
+            prompt += f"\n=== TÓM TẮT HỘI THOẠI TRƯỚC ĐÓ ===\n{summary}\n"
         if history_str:
-            prompt += f"\n=== LỊCH SỬ HỘI THOẠI ==={history_str}\n"
+            prompt += f"{self.HISTORY_HEADER}{history_str}\n"
 
         prompt += f"\n=== CÂU HỎI ===\nNgười dùng: {query}\nTrợ lý:"
         return prompt
@@ -68,62 +128,336 @@ class ChatEngine:
         api_key: str = "",
         provider: str = "gemini",
         model_name: str = "gemini-1.5-flash-latest",
+        cache: Optional[SemanticCache] = None,
+        token_budgets: Optional[Dict[str, int]] = None,
+        ollama: Optional[OllamaProvider] = None,
+        bridge: Optional[ThreadBridge] = None,
+        gemini_endpoint: str = "",
+        gemini_transport: str = "",
+        client_pool_size: int = 64,
+        client_idle_ttl: float = 900.0,
+        router: Optional[LLMRouter] = None,
+        fallbacks: Optional[List[str]] = None,
+        single_flight: bool = True,
+        admission: Optional[AdmissionController] = None,
+        tables: Optional[TableIndex] = None,
+        faq: Optional[FAQRouter] = None,
+        summaries: bool = True,
+        summary_max_tokens: int = 300,
+        summary_keep_messages: int = 2,
+        session_cache=None,
     ):
         self.retriever = retriever
+        self.cache = cache
         self.prompt_builder = PromptBuilder()
+        # {"provider:model" | "provider": max prompt tokens}
+        self.token_budgets = token_budgets or {}
+        self._prompt_sizes: deque = deque(maxlen=1000)
         self.provider = provider.lower()
         self.model_name = model_name
 
+        # Thread pool cho SDK blocking (Gemini) — stream không chặn event loop
+        self.bridge = bridge or ThreadBridge()
+        self.gemini_options = {"api_endpoint": gemini_endpoint, "transport": gemini_transport}
+        self.default_api_key = api_key
+        # Client theo (provider, model, credential) — build 1 lần, dùng lại
+        self.clients = ProviderPool(self._make_client, client_pool_size, client_idle_ttl)
+
         if self.provider == "gemini":
             if not api_key:
                 print("  [WARN] GEMINI_API_KEY missing. ChatEngine will fail.")
-            genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel(
-                model_name,
-                generation_config={
-                    "temperature": 0.2,
-                    "top_p": 0.8,
-                    "max_output_tokens": 1024,
-                },
-            )
+            self.clients.get("gemini", model_name, api_key)  # build sẵn client mặc định
         elif self.provider == "ollama":
-            import httpx
-            self.ollama_client = httpx.Client(base_url="http://localhost:11434", timeout=60.0)
             print(f"  [INFO] ChatEngine using Ollama Local ({model_name})")
 
-    def chat(
+        # Client Ollama dùng chung (tạo trong lifespan); UI có thể chọn Ollama theo request
+        self.ollama = ollama or OllamaProvider()
+
+        # Hedge / failover sang các target dự phòng, dạng "provider:model"
+        self.router = router or LLMRouter()
+        self.fallbacks = [f.split(":", 1) for f in (fallbacks or []) if ":" in f]
+        # Gộp các request giống hệt nhau đang chạy đồng thời
+        self.flights = SingleFlight(enabled=single_flight)
+        # Giới hạn generation đồng thời theo provider + hàng đợi ưu tiên
+        self.admission = admission or AdmissionController()
+        # Fast path tra cứu bảng (điểm chuẩn, học phí) — không qua retrieval / LLM
+        self.tables = tables
+        # Intent router câu hỏi thường gặp — chạy trước retrieval
+        self.faq = faq
+        # Rolling summary hội thoại — prompt = summary + lượt mới nhất
+        self.memory = ConversationMemory(
+            self.complete,
+            counter=self.prompt_builder.packer.counter,
+            keep_messages=summary_keep_messages,
+            max_tokens=summary_max_tokens,
+            sessions=session_cache,
+        ) if summaries else None
+
+    def _make_client(self, provider: str, model_name: str, api_key: str) -> GeminiProvider:
+        """Factory cho ProviderPool (hiện chỉ Gemini cần client theo credential)."""
+        if provider != "gemini":
+            raise ValueError(f"No pooled client for provider '{provider}'")
+        return GeminiProvider(api_key, model_name, self.bridge, **self.gemini_options)
+
+    async def gemini_client(self, model_name: str, api_key: str = "") -> GeminiProvider:
+        """Client trong pool; credential mới → build client trong thread, không chặn event loop."""
+        return await self.clients.aget("gemini", model_name, api_key or self.default_api_key)
+
+    async def _target(self, provider: str, model_name: str, api_key: str = "") -> LLMTarget:
+        if provider == "gemini":
+            client = await self.gemini_client(model_name, api_key)
+            return LLMTarget(f"gemini:{model_name}", client.stream)
+        if provider == "ollama":
+            return LLMTarget(f"ollama:{model_name}", lambda prompt: self.ollama.stream(prompt, model_name))
+        raise ValueError(f"Unknown LLM provider '{provider}'")
+
+    async def targets(self, provider: str, model_name: str, api_key: str = "") -> List[LLMTarget]:
+        """Target chính (theo request) + các fallback cấu hình sẵn (credential mặc định)."""
+        targets = [await self._target(provider, model_name, api_key)]
+        for fb_provider, fb_model in self.fallbacks:
+            if fb_provider == "gemini" and not self.default_api_key:
+                continue
+            target = await self._target(fb_provider, fb_model)
+            if all(t.name != target.name for t in targets):
+                targets.append(target)
+        return targets
+
+    async def _fast_path(self, query: str):
+        """
+        Trả lời không cần retrieval / LLM: tra bảng (điểm chuẩn, học phí)
+        rồi FAQ intent router.
+        Returns: (answer, sources, fast_path | None, q_emb | None)
+        — q_emb đã encode cho FAQ được dùng lại cho semantic cache / retriever.
+        """
+        table = self.tables.lookup(query) if self.tables else None
+        if table is not None:
+            return table.answer, table.sources, "table", None
+
+        if self.faq is None:
+            return None, None, None, None
+        q_emb = await self._encode(query)
+        match = self.faq.route(q_emb)
+        if match is not None:
+            return match.answer, match.sources, f"faq:{match.intent}", q_emb
+        return None, None, None, q_emb
+
+    async def _encode(self, query: str) -> np.ndarray:
+        """Embed query trong thread pool — forward pass của SentenceTransformer không chặn event loop."""
+        start = time.perf_counter()
+        q_emb = await asyncio.to_thread(self.retriever.embedder.encode, query)
+        metrics.observe("query_embed", start)
+        return q_emb
+
+    async def _cache_lookup(self, query: str, history: Optional[List[dict]], k: int, q_emb=None):
+        """
+        Retrieve + tra semantic cache.
+        Chỉ dùng cache cho câu hỏi đầu hội thoại: khi có history, câu trả lời
+        phụ thuộc ngữ cảnh trước đó nên không tái sử dụng được.
+
+        Returns: (results, cache_ctx, cached_entry)
+        """
+        use_cache = self.cache is not None and not history
+        if not use_cache:
+            return await self.retriever.aretrieve(query, k=k, q_emb=q_emb), None, None
+
+        if q_emb is None:
+            q_emb = await self._encode(query)
+        results = await self.retriever.aretrieve(query, k=k, q_emb=q_emb)
+        cache_ctx = {
+            "q_emb": q_emb,
+            "chunk_key": chunk_set_key(chunk for chunk, _ in results),
+            "index_version": self.retriever.index_version,
+        }
+        entry = self.cache.lookup(q_emb, cache_ctx["chunk_key"], cache_ctx["index_version"])
+        return results, cache_ctx, entry
+
+    def _cache_store(self, cache_ctx: Optional[dict], query: str, answer: str, sources: List[str]):
+        if cache_ctx is None:
+            return
+        self.cache.put(
+            cache_ctx["q_emb"], query, answer, sources,
+            cache_ctx["chunk_key"], cache_ctx["index_version"],
+        )
+
+    def source_refs(self, sources: List[str]) -> dict:
+        """
+        Tách sources để lưu DB: chunk của index → chỉ chunk_id, nguồn khác
+        (dòng bảng, FAQ) giữ nguyên text. source_ids giữ đúng thứ tự nguồn:
+        slot rỗng = nguồn inline kế tiếp. Kwargs cho writer.save_message.
+        """
+        ids = [chunk_id(s) for s in sources]
+        known = self.retriever.vs.get_chunks(ids)
+        refs = [cid if known[cid] is not None else "" for cid in ids]
+        return {
+            "sources": [s for s, cid in zip(sources, ids) if known[cid] is None],
+            "source_ids": refs if any(refs) else [],
+            "index_version": self.retriever.index_version,
+        }
+
+    def token_budget(self, provider: str, model_name: str) -> Optional[int]:
+        """Ngân sách token cho prompt: ưu tiên 'provider:model', rồi 'provider'."""
+        budgets = self.token_budgets
+        return budgets.get(f"{provider}:{model_name}", budgets.get(provider))
+
+    def _build_prompt(self, query, results, history, provider, model_name, summary=""):
+        """Returns: (prompt, usage, sources) — sources = top-3 chunk mà prompt thực sự chứa."""
+        start = time.perf_counter()
+        prompt, usage, chunks = self.prompt_builder.build_packed(
+            query, results, history, self.token_budget(provider, model_name), summary
+        )
+        metrics.observe("prompt_build", start)
+        self._prompt_sizes.append(usage["total"])
+        return prompt, usage, chunks[:3]
+
+    async def _start_generation(
+        self,
+        query: str,
+        prompt: str,
+        results: List[Tuple[str, float]],
+        history: Optional[List[dict]],
+        provider: str,
+        model_name: str,
+        api_key: str = "",
+        cache_ctx: Optional[dict] = None,
+        priority: int = PRIORITY_NORMAL,
+        summary: str = "",
+        sources: Optional[List[str]] = None,
+    ) -> Subscription:
+        """
+        Bắt đầu sinh câu trả lời, trả về iterator token (caller aclose() khi xong / bỏ ngang).
+        - Request có cùng query (chuẩn hoá), context, history và model dùng chung
+          1 generation (single-flight) — follower không chiếm slot
+        - Leader phải qua admission control: raise Overloaded nếu provider quá tải
+        sources: nguồn trích dẫn lưu kèm câu trả lời trong semantic cache
+        """
+        sources = sources if sources is not None else [chunk for chunk, _ in results][:3]
+        turns = history[-PromptBuilder.HISTORY_WINDOW:] if history else []
+        key = flight_key(
+            normalize_query(query),
+            chunk_set_key(chunk for chunk, _ in results),
+            [(t["role"], t["content"]) for t in turns],
+            summary,
+            provider, model_name,
+            ProviderPool.credential_hash(api_key or self.default_api_key),
+        )
+        if self.flights.in_flight(key):
+            return self.flights.subscribe(key, None)[0]
+
+        slot = await self.admission.acquire(provider, priority)
+
+        async def produce():
+            parts: List[str] = []
+            targets = await self.targets(provider, model_name, api_key)
+            async for token in self.router.stream(prompt, targets):
+                parts.append(token)
+                yield token
+            self._cache_store(cache_ctx, query, "".join(parts).strip(), sources)
+
+        # Slot trả khi task generation kết thúc — kể cả khi bị huỷ trước khi produce() chạy
+        tokens, leader = self.flights.subscribe(key, produce, on_done=slot.release)
+        if not leader:
+            slot.release()  # generation cùng key đã được tạo trong lúc chờ slot
+        return tokens
+
+    async def complete(
+        self,
+        prompt: str,
+        provider: Optional[str] = None,
+        model_name: Optional[str] = None,
+        api_key: str = "",
+        priority: int = PRIORITY_LOW,
+    ) -> str:
+        """
+        Gọi LLM cho việc nền (tóm tắt hội thoại), không qua cache / single-flight.
+        Mặc định provider của server; truyền provider / key của lượt chat để tóm tắt
+        chạy được cả khi server không có key. Lỗi → router thử tiếp các fallback.
+        """
+        provider = provider or self.provider
+        model_name = model_name or self.model_name
+        slot = await self.admission.acquire(provider, priority)
+        try:
+            targets = await self.targets(provider, model_name, api_key)
+            parts = [t async for t in self.router.stream(prompt, targets)]
+        finally:
+            slot.release()
+        return "".join(parts)
+
+    def stats(self) -> dict:
+        sizes = np.array(self._prompt_sizes) if self._prompt_sizes else None
+        return {
+            "semantic_cache": self.cache.stats() if self.cache else None,
+            "reranker": self.retriever.reranker.stats() if self.retriever.reranker else None,
+            "ollama_pool": self.ollama.stats(),
+            "llm_threads": self.bridge.stats(),
+            "llm_clients": self.clients.stats(),
+            "llm_router": self.router.stats(),
+            "single_flight": self.flights.stats(),
+            "admission": self.admission.stats(),
+            "table_fast_path": self.tables.stats() if self.tables else None,
+            "faq_router": self.faq.stats() if self.faq else None,
+            "conversation_memory": self.memory.stats() if self.memory else None,
+            "prompt_tokens": {
+                "samples": len(self._prompt_sizes),
+                "p50": int(np.percentile(sizes, 50)) if sizes is not None else 0,
+                "p95": int(np.percentile(sizes, 95)) if sizes is not None else 0,
+            },
+        }
+
+    async def chat(
         self,
         query: str,
         history: Optional[List[dict]] = None,
         k: int = 5,
+        priority: int = PRIORITY_NORMAL,
+        summary: str = "",
     ) -> dict:
-        # 1. Retrieve
-        results = self.retriever.retrieve(query, k=k)
+        # 0. Fast path: tra bảng / FAQ — khớp chắc chắn thì trả lời ngay
+        answer, sources, fast_path, q_emb = await self._fast_path(query)
+        if fast_path is not None:
+            return {
+                "answer": answer,
+                "sources": sources,
+                "num_sources": len(sources),
+                "retrieval_scores": [],
+                "cached": False,
+                "fast_path": fast_path,
+            }
+
+        # 1. Retrieve (+ semantic cache)
+        results, cache_ctx, cached = await self._cache_lookup(query, history, k, q_emb)
         context_chunks = [chunk for chunk, _ in results]
         scores = [round(float(score), 4) for _, score in results]
 
-        # 2. Build prompt
-        prompt = self.prompt_builder.build(query, context_chunks, history)
+        if cached is not None:
+            return {
+                "answer": cached.answer,
+                "sources": cached.sources,
+                "num_sources": len(context_chunks),
+                "retrieval_scores": scores,
+                "cached": True,
+            }
 
-        # 3. Generate
-        if self.provider == "gemini":
-            response = self.model.generate_content(prompt)
-            answer = response.text.strip()
-        else:
-            # Ollama API call
-            resp = self.ollama_client.post("/api/generate", json={
-                "model": self.model_name,
-                "prompt": prompt,
-                "stream": False,
-                "options": {"temperature": 0.2}
-            })
-            answer = resp.json().get("response", "").strip()
+        # 2. Build prompt (trong ngân sách token)
+        #    sources = chunk thực sự có trong prompt (packer có thể bỏ / cắt chunk top)
+        prompt, usage, sources = self._build_prompt(query, results, history, self.provider, self.model_name, summary)
+
+        # 3. Generate — qua router (hedge / failover), gom token thành câu trả lời
+        tokens = await self._start_generation(
+            query, prompt, results, history, self.provider, self.model_name,
+            cache_ctx=cache_ctx, priority=priority, summary=summary, sources=sources,
+        )
+        try:
+            answer = "".join([token async for token in tokens]).strip()
+        finally:
+            await tokens.aclose()
 
         return {
             "answer": answer,
-            "sources": context_chunks[:3],
+            "sources": sources,
             "num_sources": len(context_chunks),
             "retrieval_scores": scores,
+            "token_usage": usage,
+            "cached": False,
         }
 
     async def stream_chat(
@@ -132,45 +466,49 @@ class ChatEngine:
         history: Optional[List[dict]] = None,
         k: int = 5,
         **kwargs,
-    ) -> AsyncIterator[str]:
-        import json
+    ) -> AsyncIterator[dict]:
+        """
+        Stream event dạng dict: {"sources": [...], ...} rồi các {"token": "..."}.
+        Không serialize ở đây — route ghi SSE frame (json.dumps đúng 1 lần).
+        """
         # 0. Override config nếu có
         provider = kwargs.get("provider", self.provider).lower()
         api_key = kwargs.get("api_key", "")
         model_name = kwargs.get("model_name", self.model_name)
+        summary = kwargs.get("summary", "")
 
-        results = self.retriever.retrieve(query, k=k)
-        context_chunks = [chunk for chunk, _ in results]
-        prompt = self.prompt_builder.build(query, context_chunks, history)
+        answer, sources, fast_path, q_emb = await self._fast_path(query)
+        if fast_path is not None:
+            yield {"sources": sources, "fast_path": fast_path}
+            yield {"token": answer}
+            return
 
-        # Trả về sources đầu tiên
-        yield json.dumps({"sources": context_chunks[:3]}, ensure_ascii=False)
+        results, cache_ctx, cached = await self._cache_lookup(query, history, k, q_emb)
 
-        if provider == "gemini":
-            # Nếu có api_key mới, cấu hình lại
-            if api_key:
-                genai.configure(api_key=api_key)
-                model = genai.GenerativeModel(model_name)
-            else:
-                model = self.model
-            
-            response = model.generate_content(prompt, stream=True)
-            for chunk in response:
-                if chunk.text:
-                    yield json.dumps({"token": chunk.text}, ensure_ascii=False)
-        else:
-            # Ollama
-            import httpx
-            async with httpx.AsyncClient(base_url="http://localhost:11434", timeout=60.0) as client:
-                async with client.stream("POST", "/api/generate", json={
-                    "model": model_name,
-                    "prompt": prompt,
-                    "stream": True,
-                    "options": {"temperature": 0.2}
-                }) as resp:
-                    async for line in resp.aiter_lines():
-                        if line:
-                            data = json.loads(line)
-                            token = data.get("response", "")
-                            if token:
-                                yield json.dumps({"token": token}, ensure_ascii=False)
+        # Cache hit → stream ngay toàn bộ câu trả lời, không gọi LLM
+        if cached is not None:
+            yield {"sources": cached.sources, "cached": True}
+            yield {"token": cached.answer}
+            return
+
+        prompt, usage, sources = self._build_prompt(query, results, history, provider, model_name, summary)
+
+        # Admission trước event đầu tiên: quá tải → Overloaded raise ngay ở
+        # lần __anext__ đầu, route trả 429/503 thay vì mở SSE stream
+        # Gemini: client riêng theo api_key của request (lấy từ pool);
+        # router chọn stream ra token đầu tiên sớm nhất giữa target chính và fallback
+        tokens = await self._start_generation(
+            query, prompt, results, history, provider, model_name, api_key, cache_ctx,
+            kwargs.get("priority", PRIORITY_NORMAL), summary, sources,
+        )
+
+        # Route bỏ ngang sau event đầu (lưu DB lỗi, client ngắt) → aclose() stream này
+        # → huỷ đăng ký subscriber, generation không ai nghe sẽ bị huỷ
+        try:
+            # Trả về sources đầu tiên
+            yield {"sources": sources, "token_usage": usage}
+
+            async for token in tokens:
+                yield {"token": token}
+        finally:
+            await tokens.aclose()
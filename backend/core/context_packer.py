@@ -0,0 +1,173 @@
+"""
+Context Packer — đóng gói ngữ cảnh theo ngân sách token.
+
+Vấn đề: ghép tất cả chunks + 6 tin nhắn history → độ dài prompt dao động
+mạnh, có thể vượt context window nhỏ của Ollama, tăng latency và chi phí.
+
+Cách làm:
+  1. Đếm token cố định: system prompt + câu hỏi
+  2. Phần còn lại chia cho context (ưu tiên) và history (tối đa history_share)
+  3. Nhét chunks theo fused score giảm dần đến khi hết ngân sách, tính cả khung
+     của từng chunk trong prompt ("[Nguồn i]", dấu phân cách). Chunk top-1 quá
+     dài được cắt cho vừa; phần còn lại < min_chunk_tokens thì bỏ
+  4. History: giữ tin nhắn mới nhất trước, cắt/bỏ tin nhắn cũ khi thiếu chỗ
+"""
+import math
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import tiktoken
+    _HAS_TIKTOKEN = True
+except ImportError:
+    _HAS_TIKTOKEN = False
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+class TokenCounter:
+    """
+    Đếm token — tiktoken (cl100k_base) nếu có, fallback ước lượng theo từ.
+    Tiếng Việt: 1 âm tiết ≈ 1.5 token BPE với các tokenizer phổ biến.
+    """
+
+    VI_TOKENS_PER_WORD = 1.5
+
+    def __init__(self, encode: Optional[Callable[[str], List[int]]] = None):
+        if encode is None and _HAS_TIKTOKEN:
+            encode = tiktoken.get_encoding("cl100k_base").encode
+        self._encode = encode
+        # Chunk lặp lại rất nhiều giữa các request → cache số token
+        self.count = lru_cache(maxsize=8192)(self._count)
+
+    def _count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encode is not None:
+            return len(self._encode(text))
+        return math.ceil(len(_WORD_RE.findall(text)) * self.VI_TOKENS_PER_WORD)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cắt text (theo từ) sao cho ≤ max_tokens."""
+        if max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        words = text.split()
+        lo, hi = 0, len(words)
+        while lo < hi:  # binary search số từ giữ lại
+            mid = (lo + hi + 1) // 2
+            if self._count(" ".join(words[:mid]) + " …") <= max_tokens:
+                lo = mid
+            else:
+                hi = mid - 1
+        return " ".join(words[:lo]) + " …" if lo else ""
+
+
+@dataclass
+class PackedContext:
+    chunks: List[str]
+    history: List[dict]
+    usage: Dict[str, int] = field(default_factory=dict)
+
+
+class ContextPacker:
+
+    def __init__(
+        self,
+        counter: Optional[TokenCounter] = None,
+        history_share: float = 0.25,
+        min_chunk_tokens: int = 64,
+    ):
+        self.counter = counter or TokenCounter()
+        self.history_share = history_share        # tỉ lệ ngân sách tối đa cho history
+        self.min_chunk_tokens = min_chunk_tokens  # chunk cắt ngắn hơn mức này thì bỏ
+
+    def pack(
+        self,
+        results: List[Tuple[str, float]],
+        history: List[dict],
+        budget: int,
+        fixed_tokens: int,
+        frame_tokens: Optional[Callable[[int], int]] = None,
+    ) -> PackedContext:
+        """
+        Args:
+            results: [(chunk, fused_score), ...]
+            history: tin nhắn cũ → mới, đã giới hạn cửa sổ
+            budget: tổng token tối đa của prompt
+            fixed_tokens: token của system prompt + câu hỏi + khung prompt
+            frame_tokens: i → token khung bao quanh chunk thứ i trong prompt
+        """
+        count = self.counter.count
+        frame_tokens = frame_tokens or (lambda i: 0)
+        available = max(budget - fixed_tokens, 0)
+
+        history_tokens = sum(self._turn_tokens(t) for t in history)
+        history_reserve = min(history_tokens, int(available * self.history_share))
+
+        # 1. Context theo fused score giảm dần
+        ranked = sorted(results, key=lambda x: x[1], reverse=True)
+        chunk_budget = available - history_reserve
+        chunks: List[str] = []
+        used = 0
+        for i, (chunk, _) in enumerate(ranked):
+            frame = frame_tokens(len(chunks))
+            n = count(chunk) + frame
+            if used + n <= chunk_budget:
+                chunks.append(chunk)
+                used += n
+            elif i == 0:
+                # Nguồn top-1 quá dài — cắt cho vừa (không vượt ngân sách), quá ít chỗ thì bỏ
+                room = chunk_budget - used - frame
+                truncated = self.counter.truncate(chunk, room) if room >= self.min_chunk_tokens else ""
+                if truncated:
+                    chunks.append(truncated)
+                    used += count(truncated) + frame
+            elif chunk_budget - used >= self.min_chunk_tokens:
+                continue  # chunk sau có thể ngắn hơn, thử tiếp
+            else:
+                break
+        context_tokens = used
+
+        # 2. History: mới nhất trước, dùng phần ngân sách còn lại
+        history_budget = available - context_tokens
+        kept: List[dict] = []
+        used = 0
+        for turn in reversed(history):
+            n = self._turn_tokens(turn)
+            if used + n <= history_budget:
+                kept.append(turn)
+                used += n
+                continue
+            remaining = history_budget - used
+            if remaining >= self.min_chunk_tokens:
+                content = self.counter.truncate(turn["content"], remaining - 4)
+                if content:
+                    kept.append({**turn, "content": content})
+                    used += self._turn_tokens(kept[-1])
+            break
+        kept.reverse()
+        history_used = used
+
+        return PackedContext(
+            chunks=chunks,
+            history=kept,
+            usage={
+                "budget": budget,
+                "fixed": fixed_tokens,
+                "context": context_tokens,
+                "history": history_used,
+                "total": fixed_tokens + context_tokens + history_used,
+                "chunks_used": len(chunks),
+                "chunks_dropped": len(results) - len(chunks),
+                "history_used": len(kept),
+                "history_dropped": len(history) - len(kept),
+            },
+        )
+
+    def _turn_tokens(self, turn: dict) -> int:
+        # +4 cho nhãn "Người dùng:"/"Trợ lý:" và xuống dòng
+        return self.counter.count(turn["content"]) + 4
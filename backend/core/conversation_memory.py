@@ -0,0 +1,175 @@
+"""
+Module 8e: Conversation memory — rolling summary giữ prompt không phình theo độ dài chat.
+
+Trước đây prompt dán nguyên 6 tin nhắn gần nhất → hội thoại dài = prompt dài,
+generation chậm. Thay vào đó:
+- Sau mỗi lượt hỏi-đáp, background task gộp các tin nhắn cũ (trừ lượt mới nhất)
+  vào 1 bản tóm tắt ngắn, lưu trên dòng Conversation (summary, summary_upto)
+- Prompt = summary + các tin chưa được tóm tắt (thường chỉ lượt mới nhất)
+  → kích thước prompt gần như cố định dù hội thoại dài bao nhiêu
+- Cập nhật là incremental: mỗi lần chỉ gửi summary cũ + vài tin nhắn mới cho LLM
+- Chạy ở lane ưu tiên thấp của admission control; quá tải → bỏ qua,
+  lượt sau gộp bù (tin chưa tóm tắt vẫn nằm trong prompt nên không mất ngữ cảnh)
+- Tóm tắt bằng cùng provider / model / key với lượt chat vừa xong (provider
+  mặc định của server có thể không có key), rồi tới các fallback của router
+- Summary tụt lại quá HISTORY_WINDOW tin → tin cũ nhất bị bỏ khỏi prompt:
+  ghi log (1 lần / hội thoại) + đếm trong HistoryDrops (/api/stats, /metrics)
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from .admission import Overloaded
+from .context_packer import TokenCounter
+from .database import ReadSession, SessionLocal, get_unsummarized, update_conversation_summary
+from .session_cache import SessionCache
+
+
+class ConversationMemory:
+
+    PROMPT = """Bạn đang ghi chú cho chuyên viên tư vấn tuyển sinh PTIT. Hãy cập nhật BẢN TÓM TẮT hội thoại bằng các tin nhắn mới.
+
+Yêu cầu:
+- Giữ lại: thông tin thí sinh đã nêu (điểm, tổ hợp, cơ sở HN/HCM, ngành quan tâm), các câu hỏi chính và số liệu/kết luận đã được trả lời.
+- Bỏ lời chào, câu lặp lại, chi tiết không còn liên quan.
+- Viết tiếng Việt, gạch đầu dòng, tối đa {max_words} từ. Chỉ trả về bản tóm tắt.
+
+=== BẢN TÓM TẮT HIỆN TẠI ===
+{summary}
+
+=== TIN NHẮN MỚI ===
+{messages}
+
+=== BẢN TÓM TẮT CẬP NHẬT ===
+"""
+
+    def __init__(
+        self,
+        complete: Callable[..., Awaitable[str]],
+        counter: Optional[TokenCounter] = None,
+        keep_messages: int = 2,
+        max_tokens: int = 300,
+        message_tokens: int = 400,
+        session_factory=SessionLocal,
+        read_session_factory=ReadSession,
+        sessions: Optional[SessionCache] = None,
+    ):
+        """
+        Args:
+            complete:       gọi LLM (prompt, **llm → text), do ChatEngine cung cấp
+            keep_messages:  số tin mới nhất giữ nguyên văn trong prompt (1 lượt = 2 tin)
+            max_tokens:     độ dài tối đa của summary
+            message_tokens: mỗi tin nhắn đưa vào prompt tóm tắt bị cắt còn ngần này token
+        """
+        self.complete = complete
+        self.counter = counter or TokenCounter()
+        self.keep_messages = keep_messages
+        self.max_tokens = max_tokens
+        self.message_tokens = message_tokens
+        self.session_factory = session_factory
+        self.read_session_factory = read_session_factory
+        self.sessions = sessions  # write-through summary vào session cache
+
+        self._running: Dict[str, asyncio.Task] = {}
+        self._dirty: Set[str] = set()
+        self._after: Dict[str, asyncio.Future] = {}
+        self._llm: Dict[str, dict] = {}
+
+        self.scheduled = 0
+        self.updates = 0
+        self.folded_messages = 0
+        self.skipped = 0
+        self.failures = 0
+        self._durations: List[float] = []
+        self._summary_tokens: List[int] = []
+
+    # ─── Scheduling ──────────────────────────────────────────
+    def schedule(
+        self,
+        conversation_id: str,
+        after: Optional[asyncio.Future] = None,
+        llm: Optional[dict] = None,
+    ) -> None:
+        """
+        Gọi sau khi lưu xong 1 lượt. Không chờ — cập nhật chạy ở background.
+        after: future commit của tin nhắn cuối (write-behind) — chờ nó trước khi đọc DB.
+        llm:   provider / model_name / api_key của lượt chat (None → mặc định của server)
+        """
+        self.scheduled += 1
+        if after is not None:
+            self._after[conversation_id] = after
+        if llm:
+            self._llm[conversation_id] = llm
+        if conversation_id in self._running:
+            # Đang cập nhật → chạy thêm 1 vòng sau khi xong (không chạy song song)
+            self._dirty.add(conversation_id)
+            return
+        self._running[conversation_id] = asyncio.create_task(self._run(conversation_id))
+
+    async def _run(self, conversation_id: str) -> None:
+        try:
+            while True:
+                self._dirty.discard(conversation_id)
+                try:
+                    after = self._after.pop(conversation_id, None)
+                    if after is not None:
+                        await asyncio.shield(after)
+                    await self.update(conversation_id, self._llm.get(conversation_id))
+                except Overloaded:
+                    self.skipped += 1  # nhường slot cho người dùng, lượt sau gộp bù
+                    return
+                except Exception as e:
+                    self.failures += 1
+                    print(f"  [WARN] Conversation summary failed ({conversation_id[:8]}): {e}")
+                    return
+                if conversation_id not in self._dirty:
+                    return
+        finally:
+            self._running.pop(conversation_id, None)
+            self._llm.pop(conversation_id, None)
+
+    # ─── Update ──────────────────────────────────────────────
+    async def update(self, conversation_id: str, llm: Optional[dict] = None) -> bool:
+        """Gộp tin nhắn chưa tóm tắt (trừ lượt mới nhất) vào summary. True nếu đã ghi."""
+        async with self.read_session_factory() as db:
+            summary, upto, messages = await get_unsummarized(db, conversation_id, self.keep_messages)
+        if not messages:
+            return False
+
+        start = time.perf_counter()
+        lines = []
+        for m in messages:
+            role = "Người dùng" if m["role"] == "user" else "Trợ lý"
+            lines.append(f"{role}: {self.counter.truncate(m['content'], self.message_tokens)}")
+        prompt = self.PROMPT.format(
+            max_words=int(self.max_tokens / TokenCounter.VI_TOKENS_PER_WORD),
+            summary=summary or "(chưa có)",
+            messages="\n".join(lines),
+        )
+        new_summary = self.counter.truncate((await self.complete(prompt, **(llm or {}))).strip(), self.max_tokens)
+        if not new_summary:
+            return False
+
+        async with self.session_factory() as db:
+            written = await update_conversation_summary(db, conversation_id, new_summary, upto + len(messages))
+        if written:
+            if self.sessions is not None:
+                self.sessions.set_summary(conversation_id, new_summary, upto + len(messages))
+            self.updates += 1
+            self.folded_messages += len(messages)
+            self._durations = (self._durations + [time.perf_counter() - start])[-256:]
+            self._summary_tokens = (self._summary_tokens + [self.counter.count(new_summary)])[-256:]
+        return written
+
+    def stats(self) -> dict:
+        n = len(self._durations)
+        return {
+            "scheduled": self.scheduled,
+            "updates": self.updates,
+            "folded_messages": self.folded_messages,
+            "skipped_overloaded": self.skipped,
+            "failures": self.failures,
+            "in_progress": len(self._running),
+            "avg_update_ms": round(sum(self._durations) / n * 1000, 1) if n else 0.0,
+            "avg_summary_tokens": round(sum(self._summary_tokens) / n, 1) if n else 0.0,
+        }
@@ -1,12 +1,27 @@
-"""Database module — lưu conversation history bằng SQLite."""
+"""
+Database module — lưu conversation history bằng SQLite.
+
+Async (SQLAlchemy asyncio + aiosqlite): I/O SQLite và fsync chạy trên thread của
+driver, route `async def` không chặn event loop khi disk chậm.
+Storage profile: WAL + pragmas trên mọi connection, 1 connection ghi duy nhất
+(SessionLocal) + pool connection chỉ-đọc (ReadSession), checkpoint WAL định kỳ.
+Session: 1 AsyncSession chỉ-đọc / request qua dependency get_db.
+"""
+import asyncio
+import base64
+import json
+import time
 import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional, Tuple
 
-from sqlalchemy import Column, DateTime, String, Text, create_engine
-from sqlalchemy.orm import DeclarativeBase, Session, sessionmaker
+from sqlalchemy import Column, DateTime, Index, Integer, String, Text, and_, event, func, inspect, or_, select, text, update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import DeclarativeBase
 
 from ..config import settings
+from .message_search import ensure_search_index
 
 
 class Base(DeclarativeBase):
@@ -17,8 +32,11 @@ class Conversation(Base):
     __tablename__ = "conversations"
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)  # list mới nhất trước
     title = Column(String, default="Cuộc hội thoại mới")
+    # Rolling summary: tóm tắt summary_upto tin nhắn đầu tiên của hội thoại
+    summary = Column(Text, default="")
+    summary_upto = Column(Integer, default=0)
 
 
 class Message(Base):
@@ -28,89 +46,373 @@ class Message(Base):
     conversation_id = Column(String, nullable=False)
     role = Column(String, nullable=False)   # "user" | "assistant"
     content = Column(Text, nullable=False)
-    sources = Column(Text, default="")      # JSON string
+    sources = Column(Text, default="")      # JSON list — chỉ nguồn không phải chunk (bảng, FAQ)
+    # Nguồn là chunk của index: chỉ lưu chunk_id (hash nội dung, phân cách bởi ","),
+    # nội dung tra lại từ chunk store khi UI cần. Mỗi nguồn 1 slot theo đúng thứ tự,
+    # slot rỗng = nguồn inline kế tiếp trong sources
+    source_ids = Column(Text, default="")
+    index_version = Column(String, default="")
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # Mọi truy vấn history đều lọc theo hội thoại + sắp theo thời gian
+    # → đọc đuôi hội thoại / phân trang bằng index, không full scan
+    __table_args__ = (
+        Index("ix_messages_conversation_created", "conversation_id", "created_at"),
+    )
+
+
+class ArchivedConversation(Base):
+    """Index của hội thoại đã chuyển ra file archive (zstd JSONL theo tháng)."""
+    __tablename__ = "archived_conversations"
+
+    id = Column(String, primary_key=True)
+    title = Column(String, default="")
+    created_at = Column(DateTime, index=True)
+    last_message_at = Column(DateTime)
+    messages = Column(Integer, default=0)
+    file = Column(String, nullable=False)     # tên file trong thư mục archive, vd 2024-06.jsonl.zst
+    offset = Column(Integer, nullable=False)  # vị trí frame zstd chứa hội thoại trong file
+    length = Column(Integer, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
 
 # ─── DB Setup ────────────────────────────────────────────────
-engine = create_engine(settings.DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(bind=engine)
+def async_url(url: str) -> str:
+    """sqlite:///./chatbot.db → sqlite+aiosqlite:///./chatbot.db (giữ nguyên nếu đã có driver)."""
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+
+def _apply_pragmas(dbapi_conn, pragmas) -> None:
+    cursor = dbapi_conn.cursor()
+    for pragma in pragmas:
+        cursor.execute(f"PRAGMA {pragma}")
+    cursor.close()
+
+
+def storage_pragmas(read_only: bool = False) -> List[str]:
+    """
+    Storage profile cho SQLite, áp dụng trên MỌI connection:
+    - WAL: reader không chặn writer và ngược lại (chỉ writer với writer)
+    - synchronous=NORMAL: với WAL chỉ fsync lúc checkpoint, an toàn khi app crash
+      (mất tối đa transaction cuối nếu mất điện)
+    - mmap + cache lớn: đọc history không qua syscall read
+    - busy_timeout: chờ lock thay vì lỗi "database is locked" ngay
+    - auto_vacuum=INCREMENTAL (connection ghi): trang trống sau khi archive được
+      trả lại bằng PRAGMA incremental_vacuum, không cần VACUUM toàn bộ
+    """
+    pragmas = [] if read_only else [
+        # Phải đặt trước journal_mode / bảng đầu tiên — chỉ có hiệu lực với DB mới,
+        # DB cũ chuyển offline: python -m backend.dev.enable_incremental_vacuum
+        "auto_vacuum=INCREMENTAL",
+    ]
+    pragmas += [
+        "journal_mode=WAL",
+        f"synchronous={settings.DB_SYNCHRONOUS}",
+        f"mmap_size={settings.DB_MMAP_SIZE}",
+        f"cache_size=-{settings.DB_CACHE_SIZE_KB}",
+        f"busy_timeout={settings.DB_BUSY_TIMEOUT_MS}",
+        "temp_store=MEMORY",
+    ]
+    if read_only:
+        pragmas.append("query_only=ON")
+    else:
+        pragmas.append(f"wal_autocheckpoint={settings.DB_WAL_AUTOCHECKPOINT}")
+    return pragmas
+
 
+def create_engines(url: str, read_pool_size: int = 8, tuned: bool = True) -> Tuple[AsyncEngine, AsyncEngine]:
+    """
+    (write_engine, read_engine).
+    SQLite file + tuned: 1 connection ghi duy nhất + pool connection chỉ-đọc (query_only),
+    mỗi connection được áp storage_pragmas. Còn lại: 1 engine dùng chung.
+    """
+    url = async_url(url)
+    in_memory = url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith("sqlite+aiosqlite:"))
+    if not url.startswith("sqlite") or in_memory or not tuned:
+        shared = create_async_engine(url)
+        return shared, shared
 
-def init_db():
-    Base.metadata.create_all(engine)
+    writer = create_async_engine(url, pool_size=1, max_overflow=0, pool_timeout=60)
+    reader = create_async_engine(url, pool_size=read_pool_size, max_overflow=read_pool_size)
+    event.listen(writer.sync_engine, "connect", lambda c, _: _apply_pragmas(c, storage_pragmas()))
+    event.listen(reader.sync_engine, "connect", lambda c, _: _apply_pragmas(c, storage_pragmas(read_only=True)))
+    return writer, reader
+
+
+engine, read_engine = create_engines(settings.DATABASE_URL, settings.DB_READ_POOL_SIZE)
+SessionLocal = async_sessionmaker(engine, expire_on_commit=False)       # ghi
+ReadSession = async_sessionmaker(read_engine, expire_on_commit=False)   # đọc
+
+# SQLite chỉ cho 1 writer: các transaction ghi xếp hàng trên event loop
+# (writer engine cũng chỉ có 1 connection) thay vì busy-wait lẫn nhau
+write_lock = asyncio.Lock()
+
+
+@asynccontextmanager
+async def writing(db: AsyncSession):
+    """
+    Transaction ghi: giữ write_lock đến khi commit xong.
+    Lấy connection TRƯỚC khi chờ lock — người giữ lock không bao giờ phải
+    chờ pool (tránh deadlock khi pool cạn vì các writer đang xếp hàng).
+    """
+    await db.connection()
+    async with write_lock:
+        yield
+        await db.commit()
+
+
+async def init_db():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_migrate)
+        await conn.run_sync(ensure_search_index)
     print("  [INFO] Database initialized.")
 
 
-def get_db() -> Session:
-    db = SessionLocal()
-    try:
+async def close_db():
+    if read_engine is not engine:
+        await checkpoint("TRUNCATE")  # gộp WAL vào file DB chính trước khi tắt
+        await read_engine.dispose()
+    await engine.dispose()
+
+
+# ─── WAL checkpoint ──────────────────────────────────────────
+checkpoint_stats = {"runs": 0, "busy": 0, "wal_pages": 0, "checkpointed_pages": 0, "last_ms": 0.0}
+
+
+async def checkpoint(mode: str = "PASSIVE") -> Optional[tuple]:
+    """PRAGMA wal_checkpoint qua connection ghi. Returns (busy, wal_pages, checkpointed_pages)."""
+    start = time.perf_counter()
+    async with write_lock:
+        async with engine.connect() as conn:
+            row = (await conn.exec_driver_sql(f"PRAGMA wal_checkpoint({mode})")).first()
+    if row is None:
+        return None
+    busy, wal_pages, done = row
+    checkpoint_stats["runs"] += 1
+    checkpoint_stats["busy"] += int(busy)
+    checkpoint_stats["wal_pages"] = wal_pages
+    checkpoint_stats["checkpointed_pages"] = done
+    checkpoint_stats["last_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return busy, wal_pages, done
+
+
+async def checkpoint_loop(interval: float) -> None:
+    """
+    Checkpoint định kỳ (PASSIVE — không chặn reader). Auto-checkpoint của SQLite
+    chạy trong transaction ghi của request; checkpoint nền giữ WAL ngắn, đọc nhanh.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await checkpoint("PASSIVE")
+        except Exception as e:
+            print(f"  [WARN] WAL checkpoint failed: {e}")
+
+
+def storage_stats() -> dict:
+    tuned = read_engine is not engine
+    return {
+        "profile": "wal_split" if tuned else "default",
+        "write_pool": engine.pool.status(),
+        "read_pool": read_engine.pool.status() if tuned else None,
+        "checkpoint": dict(checkpoint_stats),
+    }
+
+
+def _migrate(conn):
+    """create_all không sửa bảng đã có → thêm cột / index mới (DB tạo từ phiên bản cũ)."""
+    insp = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not insp.has_table(table.name):
+            continue
+        indexes = {i["name"] for i in insp.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(conn)
+                print(f"  [INFO] DB migrate: index {index.name}")
+        existing = {c["name"] for c in insp.get_columns(table.name)}
+        for col in table.columns:
+            if col.name in existing:
+                continue
+            ddl = col.type.compile(conn.dialect)
+            default = col.default.arg if col.default is not None and col.default.is_scalar else None
+            clause = f" DEFAULT {default!r}" if default is not None else ""
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {col.name} {ddl}{clause}"))
+            print(f"  [INFO] DB migrate: {table.name}.{col.name}")
+
+
+async def get_db() -> AsyncIterator[AsyncSession]:
+    """Session chỉ-đọc cho route (ghi đi qua write-behind writer / SessionLocal)."""
+    async with ReadSession() as db:
         yield db
-    finally:
-        db.close()
 
 
 # ─── CRUD ────────────────────────────────────────────────────
-def create_conversation(db: Session, title: str = "Cuộc hội thoại mới") -> Conversation:
+async def create_conversation(db: AsyncSession, title: str = "Cuộc hội thoại mới") -> Conversation:
     conv = Conversation(id=str(uuid.uuid4()), title=title)
-    db.add(conv)
-    db.commit()
-    db.refresh(conv)
+    async with writing(db):
+        db.add(conv)
     return conv
 
 
-def save_message(
-    db: Session,
+async def save_message(
+    db: AsyncSession,
     conversation_id: str,
     role: str,
     content: str,
     sources: List[str] = None,
+    source_ids: List[str] = None,
+    index_version: str = "",
 ) -> Message:
-    import json
     msg = Message(
         id=str(uuid.uuid4()),
         conversation_id=conversation_id,
         role=role,
         content=content,
-        sources=json.dumps(sources or [], ensure_ascii=False),
+        sources=encode_sources(sources),
+        source_ids=",".join(source_ids or []),
+        index_version=index_version,
     )
-    db.add(msg)
-    db.commit()
+    async with writing(db):
+        db.add(msg)
     return msg
 
 
-def get_history(db: Session, conversation_id: str, limit: int = 50) -> List[dict]:
-    """Lấy lịch sử hội thoại, trả về format cho ChatEngine."""
-    msgs = (
-        db.query(Message)
-        .filter(Message.conversation_id == conversation_id)
-        .order_by(Message.created_at)
-        .limit(limit)
-        .all()
-    )
-    import json
-    return [
-        {
-            "role": m.role, 
-            "content": m.content, 
-            "sources": json.loads(m.sources) if m.sources else []
-        } for m in msgs
-    ]
+def encode_sources(sources: Optional[List[str]]) -> str:
+    return json.dumps(sources, ensure_ascii=False) if sources else ""
+
+
+def _message_dict(m: Message) -> dict:
+    return {
+        "id": m.id,
+        "role": m.role,
+        "content": m.content,
+        "sources": json.loads(m.sources) if m.sources else [],
+        "source_ids": m.source_ids.split(",") if m.source_ids else [],
+        "index_version": m.index_version or "",
+        "created_at": m.created_at,
+    }
 
 
-def get_all_conversations(db: Session, limit: int = 20) -> List[Conversation]:
-    return (
-        db.query(Conversation)
-        .order_by(Conversation.created_at.desc())
+async def get_history(db: AsyncSession, conversation_id: str, limit: int = 50) -> List[dict]:
+    """Lấy limit tin nhắn MỚI NHẤT (cũ → mới), đọc từ đuôi index."""
+    msgs = (await db.scalars(
+        select(Message)
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.created_at.desc(), Message.id.desc())
         .limit(limit)
-        .all()
+    )).all()
+    return [_message_dict(m) for m in reversed(msgs)]
+
+
+def encode_cursor(m: Message) -> str:
+    raw = json.dumps([m.created_at.isoformat(), m.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Raise ValueError nếu cursor không hợp lệ."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, msg_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), str(msg_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+async def get_messages_page(
+    db: AsyncSession,
+    conversation_id: str,
+    limit: int = 50,
+    before: Optional[str] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Keyset pagination từ mới → cũ: trang đầu = limit tin mới nhất,
+    before = cursor của trang trước để lấy các tin cũ hơn.
+    Chi phí mỗi trang không phụ thuộc trang thứ mấy (không OFFSET).
+
+    Returns: (messages cũ → mới, cursor trang tiếp theo | None nếu hết)
+    """
+    stmt = select(Message).where(Message.conversation_id == conversation_id)
+    if before:
+        created_at, msg_id = decode_cursor(before)
+        stmt = stmt.where(or_(
+            Message.created_at < created_at,
+            and_(Message.created_at == created_at, Message.id < msg_id),
+        ))
+    msgs = (await db.scalars(
+        stmt.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1)
+    )).all()
+    has_more = len(msgs) > limit
+    msgs = msgs[:limit]
+    next_cursor = encode_cursor(msgs[-1]) if has_more else None
+    return [_message_dict(m) for m in reversed(msgs)], next_cursor
+
+
+async def get_session_window(db: AsyncSession, conversation_id: str, window: int = 12) -> Tuple[str, int, int, List[dict]]:
+    """
+    Dữ liệu nạp SessionCache: (summary, summary_upto, tổng số tin, window tin mới nhất).
+    """
+    row = (await db.execute(
+        select(Conversation.summary, Conversation.summary_upto).where(Conversation.id == conversation_id)
+    )).first()
+    summary, upto = (row[0] or "", row[1] or 0) if row else ("", 0)
+    total = await db.scalar(
+        select(func.count()).select_from(Message).where(Message.conversation_id == conversation_id)
     )
+    msgs = (await db.execute(
+        select(Message.role, Message.content)
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(window)
+    )).all()
+    return summary, upto, total, [{"role": role, "content": content} for role, content in reversed(msgs)]
+
+
+async def get_unsummarized(db: AsyncSession, conversation_id: str, keep: int = 2) -> Tuple[str, int, List[dict]]:
+    """
+    Tin nhắn cần gộp vào summary: sau summary_upto, trừ keep tin mới nhất.
+    Returns: (summary hiện tại, summary_upto, messages)
+    """
+    row = (await db.execute(
+        select(Conversation.summary, Conversation.summary_upto).where(Conversation.id == conversation_id)
+    )).first()
+    if row is None:
+        return "", 0, []
+    summary, upto = row[0] or "", row[1] or 0
+    msgs = (await db.execute(
+        select(Message.role, Message.content)
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.created_at, Message.id)
+        .offset(upto)
+    )).all()
+    fold = msgs[:max(len(msgs) - keep, 0)]
+    return summary, upto, [{"role": role, "content": content} for role, content in fold]
+
+
+async def update_conversation_summary(db: AsyncSession, conversation_id: str, summary: str, upto: int) -> bool:
+    """Chỉ ghi khi summary tiến lên (update chạy song song / chậm không ghi đè bản mới hơn)."""
+    async with writing(db):
+        result = await db.execute(
+            update(Conversation)
+            .where(Conversation.id == conversation_id, Conversation.summary_upto < upto)
+            .values(summary=summary, summary_upto=upto)
+        )
+    return bool(result.rowcount)
+
+
+async def get_all_conversations(db: AsyncSession, limit: int = 20) -> List[Conversation]:
+    return (await db.scalars(
+        select(Conversation).order_by(Conversation.created_at.desc()).limit(limit)
+    )).all()
 
 
-def update_conversation_title(db: Session, conversation_id: str, title: str):
-    conv = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+async def update_conversation_title(db: AsyncSession, conversation_id: str, title: str):
+    conv = await db.get(Conversation, conversation_id)
     if conv:
-        conv.title = title
-        db.commit()
-        db.refresh(conv)
+        async with writing(db):
+            conv.title = title
     return conv
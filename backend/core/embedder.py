@@ -16,7 +16,6 @@ from pathlib import Path
 from typing import List, Union
 
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
 
 class EmbeddingEngine:
@@ -25,6 +24,9 @@ class EmbeddingEngine:
     CACHE_DIR = Path(__file__).parent.parent / "data" / "processed"
 
     def __init__(self, model_name: str = DEFAULT_MODEL):
+        # Import lazy: sentence_transformers kéo theo torch (chậm)
+        from sentence_transformers import SentenceTransformer
+
         print(f"  Loading embedding model: {model_name}")
         # Model download 1 lần, cache tại ~/.cache/huggingface
         self.model = SentenceTransformer(model_name)
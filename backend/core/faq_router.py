@@ -0,0 +1,166 @@
+"""
+Module 10: FAQ Intent Router — trả lời ngay các câu hỏi thường gặp.
+
+Phần lớn traffic rơi vào vài chục intent lặp lại (hotline, hạn nộp hồ sơ,
+cơ sở, ký túc xá). Router chạy TRƯỚC HybridRetriever:
+- Câu hỏi mẫu (exemplars) của mọi intent được encode sẵn thành 1 ma trận
+  E [n_exemplars, dim] (đã normalize)
+- Phân loại = 1 phép nhân ma trận-vector: scores = E @ q
+- Điểm cao nhất ≥ threshold VÀ cách intent đứng thứ 2 ≥ margin
+  → trả câu trả lời soạn sẵn, không retrieval, không gọi LLM
+
+File exemplars: data/faq.json. Hot reload: file đổi mtime → encode lại
+trong background thread rồi swap ma trận (request không phải chờ).
+"""
+import json
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+@dataclass
+class FAQMatch:
+    intent: str
+    answer: str
+    sources: List[str]
+    score: float
+
+
+class FAQRouter:
+
+    def __init__(
+        self,
+        embedder,
+        path,
+        threshold: float = 0.82,
+        margin: float = 0.04,
+        reload_interval: float = 5.0,
+    ):
+        self.embedder = embedder
+        self.path = Path(path)
+        self.threshold = threshold
+        self.margin = margin
+        self.reload_interval = reload_interval
+
+        self._lock = threading.Lock()
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._labels = np.zeros(0, dtype=np.int64)   # exemplar → chỉ số intent
+        self._intents: List[dict] = []
+        self._mtime = 0.0
+        self._last_check = 0.0
+        self._reloading = False
+
+        self.version = 0
+        self.lookups = 0
+        self.hits: Dict[str, int] = {}
+        self.near_misses = 0  # khớp trên threshold nhưng không đủ margin
+        self.reload_errors = 0
+
+        self.reload()
+
+    # ─── Load / hot reload ───────────────────────────────────
+    def reload(self) -> bool:
+        """Đọc file + encode exemplars, swap ma trận. Lỗi → giữ bản cũ."""
+        try:
+            mtime = self.path.stat().st_mtime
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            intents = [i for i in data.get("intents", []) if i.get("exemplars") and i.get("answer")]
+            texts, labels = [], []
+            for idx, intent in enumerate(intents):
+                texts.extend(intent["exemplars"])
+                labels.extend([idx] * len(intent["exemplars"]))
+            matrix = (
+                np.asarray(self.embedder.encode(texts), dtype=np.float32)
+                if texts else np.zeros((0, 0), dtype=np.float32)
+            )
+        except Exception as e:
+            self.reload_errors += 1
+            print(f"  [WARN] FAQ reload failed ({self.path.name}): {e}")
+            return False
+
+        with self._lock:
+            self._matrix = matrix
+            self._labels = np.asarray(labels, dtype=np.int64)
+            self._intents = intents
+            self._mtime = mtime
+            self.version += 1
+            for intent in intents:
+                self.hits.setdefault(intent["id"], 0)
+        print(f"  [INFO] FAQ router: {len(intents)} intents, {len(texts)} exemplars (v{self.version})")
+        return True
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval or self._reloading:
+            return
+        self._last_check = now
+        try:
+            changed = self.path.stat().st_mtime != self._mtime
+        except OSError:
+            return
+        if changed:
+            self._reloading = True
+
+            def run():
+                try:
+                    self.reload()
+                finally:
+                    self._reloading = False
+
+            threading.Thread(target=run, name="faq-reload", daemon=True).start()
+
+    # ─── Route ───────────────────────────────────────────────
+    def route(self, q_emb: np.ndarray) -> Optional[FAQMatch]:
+        """
+        Args:
+            q_emb: embedding query đã normalize (dùng chung với semantic cache / retriever)
+        """
+        self._maybe_reload()
+        with self._lock:
+            matrix, labels, intents = self._matrix, self._labels, self._intents
+            self.lookups += 1
+        if not len(matrix):
+            return None
+
+        scores = matrix @ np.asarray(q_emb, dtype=np.float32)
+        best = int(np.argmax(scores))
+        best_score = float(scores[best])
+        if best_score < self.threshold:
+            return None
+
+        # Margin so với intent khác tốt nhất (tránh câu hỏi lưng chừng giữa 2 intent)
+        others = scores[labels != labels[best]]
+        second = float(others.max()) if len(others) else -1.0
+        if best_score - second < self.margin:
+            with self._lock:
+                self.near_misses += 1
+            return None
+
+        intent = intents[labels[best]]
+        with self._lock:
+            self.hits[intent["id"]] = self.hits.get(intent["id"], 0) + 1
+        return FAQMatch(
+            intent=intent["id"],
+            answer=intent["answer"],
+            sources=intent.get("sources", []),
+            score=round(best_score, 4),
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            total_hits = sum(self.hits.values())
+            return {
+                "version": self.version,
+                "intents": len(self._intents),
+                "exemplars": int(len(self._matrix)),
+                "lookups": self.lookups,
+                "hits": total_hits,
+                "hit_rate": round(total_hits / self.lookups, 4) if self.lookups else 0.0,
+                "near_misses": self.near_misses,
+                "reload_errors": self.reload_errors,
+                "by_intent": dict(self.hits),
+            }
@@ -16,12 +16,16 @@ Reciprocal Rank Fusion (RRF):
 
 Paper: "Reciprocal Rank Fusion outperforms Condorcet and individual Rank-Learning Methods"
 """
-from typing import Dict, List, Tuple
+import asyncio
+import time
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 
 from .bm25_retriever import BM25Retriever
 from .embedder import EmbeddingEngine
+from .metrics import metrics
+from .reranker import CrossEncoderReranker
 from .vector_store import VectorStore
 
 
@@ -33,31 +37,98 @@ class HybridRetriever:
         bm25: BM25Retriever,
         embedder: EmbeddingEngine,
         rrf_k: int = 60,
+        reranker: Optional[CrossEncoderReranker] = None,
+        rerank_candidates: int = 15,
+        weights: Tuple[float, float] = (1.0, 1.5),
+        candidate_factor: int = 3,
     ):
+        """
+        Args:
+            weights:          trọng số RRF (dense, sparse); 0 → bỏ hẳn retriever đó
+            candidate_factor: mỗi retriever lấy k * candidate_factor candidate trước fusion
+        """
         self.vs = vector_store
         self.bm25 = bm25
         self.embedder = embedder
         self.rrf_k = rrf_k
-
-    def retrieve(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
+        self.weights = tuple(weights)
+        self.candidate_factor = candidate_factor
+        # Optional: cross-encoder chấm lại top candidates sau fusion
+        self.reranker = reranker
+        self.rerank_candidates = rerank_candidates
+
+    @property
+    def index_version(self) -> str:
+        """Version của index hiện tại — đổi sau mỗi lần ingest."""
+        return self.vs.version
+
+    def retrieve(
+        self,
+        query: str,
+        k: int = 5,
+        q_emb: Optional[np.ndarray] = None,
+    ) -> List[Tuple[str, float]]:
         """
         Hybrid retrieval = Dense + Sparse → Weighted RRF fusion.
-        Tăng trọng số cho Sparse (BM25) để bắt trúng từ khóa/mã ngành.
+        Mặc định tăng trọng số cho Sparse (BM25) để bắt trúng từ khóa/mã ngành.
+
+        q_emb: embedding của query nếu caller đã tính sẵn (tránh encode 2 lần).
+        """
+        fused = self._fuse(query, k, q_emb)
+
+        # 4. Re-rank (nếu bật): ít chunk hơn nhưng liên quan hơn
+        if self.reranker is not None:
+            start = time.perf_counter()
+            reranked = self.reranker.rerank(query, fused[: max(k, self.rerank_candidates)])
+            metrics.observe("rerank", start)
+            return reranked
+
+        return fused[:k]
+
+    async def aretrieve(
+        self,
+        query: str,
+        k: int = 5,
+        q_emb: Optional[np.ndarray] = None,
+    ) -> List[Tuple[str, float]]:
         """
+        retrieve() cho request trên event loop: embed query, FAISS, BM25, fusion và
+        cross-encoder đều là CPU đồng bộ → chạy cả pipeline trong thread pool
+        (1 lần chuyển thread) để không chặn các request khác.
+        """
+        return await asyncio.to_thread(self.retrieve, query, k, q_emb)
+
+    def _fuse(self, query: str, k: int, q_emb: Optional[np.ndarray]) -> List[Tuple[str, float]]:
+        """Dense + Sparse → Weighted RRF, toàn bộ candidate đã sắp theo điểm fusion."""
+        dense_w, sparse_w = self.weights
+        n_candidates = k * self.candidate_factor
+
         # 1. Dense (Semantic)
-        q_emb = self.embedder.encode(query)
-        dense_results = self.vs.search(q_emb, k=k * 3)
+        dense_results = []
+        if dense_w:
+            if q_emb is None:
+                start = time.perf_counter()
+                q_emb = self.embedder.encode(query)
+                metrics.observe("query_embed", start)
+            start = time.perf_counter()
+            dense_results = self.vs.search(q_emb, k=n_candidates)
+            metrics.observe("faiss_search", start)
 
         # 2. Sparse (Keywords)
-        sparse_results = self.bm25.search(query, k=k * 3)
-
-        # 3. Fuse với trọng số: Sparse (1.5) > Dense (1.0)
+        sparse_results = []
+        if sparse_w:
+            start = time.perf_counter()
+            sparse_results = self.bm25.search(query, k=n_candidates)
+            metrics.observe("bm25_search", start)
+
+        # 3. Fuse với trọng số (mặc định Sparse 1.5 > Dense 1.0)
+        start = time.perf_counter()
         fused = self._reciprocal_rank_fusion(
             [dense_results, sparse_results],
-            weights=[1.0, 1.5]
+            weights=[dense_w, sparse_w]
         )
-
-        return fused[:k]
+        metrics.observe("fusion", start)
+        return fused
 
     def retrieve_debug(self, query: str, k: int = 5) -> Dict:
         """
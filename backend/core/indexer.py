@@ -100,7 +100,9 @@ async def build_index_incremental(file_path: str, engine=None):
     new_chunks = chunker.chunk_many(raw_texts)
 
     # Load existing indexer và thêm vào
-    embedder = EmbeddingEngine()
+    # Dùng lại embedder đang chạy của engine (tránh load model lần 2)
+    current = getattr(engine, "retriever", None)
+    embedder = current.embedder if current is not None else EmbeddingEngine()
     new_embeddings = embedder.encode(new_chunks)
 
     vs = VectorStore(dim=embedder.dim)
@@ -118,6 +120,11 @@ async def build_index_incremental(file_path: str, engine=None):
     bm25.save()
 
     retriever = HybridRetriever(vs, bm25, embedder)
+    if current is not None:
+        retriever.reranker = current.reranker
+        retriever.rerank_candidates = current.rerank_candidates
+        retriever.weights = current.weights
+        retriever.candidate_factor = current.candidate_factor
     print(f"  [OK] Added {len(new_chunks)} new chunks")
     return retriever
 
@@ -0,0 +1,454 @@
+"""
+Module 8: LLM Providers
+Client dùng chung (long-lived) cho từng LLM provider.
+
+GeminiProvider:
+- Client riêng cho từng credential (không dùng genai.configure global),
+  quản lý bởi ProviderPool: LRU + hết hạn khi idle
+- SDK google-generativeai là blocking (iterate response chặn thread)
+- Chạy iterator trong thread pool riêng, đẩy token qua asyncio.Queue
+  → event loop không bao giờ bị chặn khi chờ token, các SSE stream khác
+  trên cùng worker không bị ảnh hưởng
+
+OllamaProvider:
+- 1 httpx.AsyncClient duy nhất cho cả app, tạo trong lifespan, đóng khi shutdown
+- Keep-alive + giới hạn connection pool → không trả chi phí TCP handshake mỗi request
+- Timeout theo từng phase (connect / read / write / pool)
+- Retry + exponential backoff khi lỗi kết nối (chỉ trước khi nhận token đầu tiên,
+  nên không bao giờ trả token trùng lặp)
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Iterable, List, Optional, Tuple
+
+import httpx
+
+
+class ThreadBridge:
+    """
+    Cầu nối SDK blocking → asyncio.
+    Thread pool riêng (không dùng default executor của asyncio, vốn chỉ có
+    min(32, cpu+4) thread) để 100+ stream đồng thời không phải xếp hàng.
+    """
+
+    _DONE = object()
+
+    def __init__(self, max_workers: int = 128):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-io")
+        self._lock = threading.Lock()
+        self.active = 0
+        self._prestart()
+
+    def _prestart(self) -> None:
+        """
+        Tạo sẵn toàn bộ thread. ThreadPoolExecutor mặc định tạo thread lazy ngay
+        trong submit() — tức là trên event loop — và Thread.start() phải chờ
+        thread mới giành được GIL: dưới tải, loop bị chặn hàng trăm ms.
+        """
+        barrier = threading.Barrier(self.max_workers + 1)
+        for _ in range(self.max_workers):
+            self._executor.submit(barrier.wait)
+        barrier.wait()
+
+    async def run(self, fn: Callable, *args):
+        """Chạy 1 hàm blocking trong pool, await kết quả."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._counted(fn), *args)
+
+    async def iterate(self, make_iter: Callable[[], Iterable]) -> AsyncIterator:
+        """
+        Iterate 1 iterator blocking trong thread, yield từng phần tử cho asyncio.
+        Consumer dừng sớm (client ngắt kết nối) → thread dừng ở phần tử kế tiếp.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+
+        def post(item, error=None):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+            except RuntimeError:
+                stop.set()  # event loop đã đóng
+
+        def pump():
+            try:
+                for item in make_iter():
+                    if stop.is_set():
+                        return
+                    post(item)
+            except BaseException as e:  # chuyển lỗi sang phía async
+                post(self._DONE, e)
+                return
+            post(self._DONE)
+
+        loop.run_in_executor(self._executor, self._counted(pump))
+        try:
+            while True:
+                item, error = await queue.get()
+                if item is self._DONE:
+                    if error is not None:
+                        raise error
+                    return
+                yield item
+        finally:
+            stop.set()
+
+    def _counted(self, fn: Callable) -> Callable:
+        def wrapper(*args):
+            with self._lock:
+                self.active += 1
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self.active -= 1
+        return wrapper
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"active_threads": self.active, "max_threads": self.max_workers}
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class GeminiProvider:
+    """
+    Mỗi instance có GenerativeServiceClient riêng với api_key của nó
+    (không dùng genai.configure — state global của SDK, các request
+    dùng key khác nhau sẽ ghi đè lẫn nhau).
+    """
+
+    name = "gemini"
+
+    GENERATION_CONFIG = {
+        "temperature": 0.2,
+        "top_p": 0.8,
+        "max_output_tokens": 1024,
+    }
+
+    def __init__(
+        self,
+        api_key: str,
+        model_name: str = "gemini-1.5-flash-latest",
+        bridge: Optional[ThreadBridge] = None,
+        api_endpoint: str = "",
+        transport: str = "",
+    ):
+        from google.ai import generativelanguage as glm
+
+        self._glm = glm
+        client_options = {"api_key": api_key}
+        if api_endpoint:
+            client_options["api_endpoint"] = api_endpoint
+        self.client = glm.GenerativeServiceClient(
+            transport=transport or None,
+            client_options=client_options,
+        )
+        self.model_name = model_name
+        self.bridge = bridge or ThreadBridge()
+
+    def close(self) -> None:
+        """Đóng transport (channel gRPC / session REST) của client."""
+        self.client.transport.close()
+
+    def _request(self, prompt: str):
+        glm = self._glm
+        model = self.model_name if self.model_name.startswith("models/") else f"models/{self.model_name}"
+        return glm.GenerateContentRequest(
+            model=model,
+            contents=[glm.Content(role="user", parts=[glm.Part(text=prompt)])],
+            generation_config=glm.GenerationConfig(**self.GENERATION_CONFIG),
+        )
+
+    @staticmethod
+    def _text(response) -> str:
+        if not response.candidates:
+            return ""
+        return "".join(part.text for part in response.candidates[0].content.parts)
+
+    async def generate(self, prompt: str) -> str:
+        response = await self.bridge.run(self.client.generate_content, self._request(prompt))
+        return self._text(response).strip()
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """Stream không chặn event loop: SDK iterator chạy trong ThreadBridge."""
+        def make_iter():
+            for chunk in self.client.stream_generate_content(self._request(prompt)):
+                text = self._text(chunk)
+                if text:
+                    yield text
+
+        async for text in self.bridge.iterate(make_iter):
+            yield text
+
+
+class ProviderPool:
+    """
+    Pool client theo (provider, model, hash(credential)).
+    - Mỗi credential build client 1 lần, dùng lại an toàn cho request đồng thời
+    - LRU eviction khi vượt max_size, hết hạn khi idle quá idle_ttl giây
+    - Chỉ lưu hash của api_key, không giữ key trong key của pool
+    - Build client (mở channel gRPC) ngoài lock; 2 request cùng miss → giữ bản
+      vào trước, đóng bản thừa
+    - Client bị evict / hết hạn được đóng (close()) sau close_grace giây — stream
+      đang chạy trên client đó có thời gian kết thúc; shutdown đóng tất cả
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str, str, str], object],
+        max_size: int = 64,
+        idle_ttl: float = 900.0,
+        close_grace: float = 300.0,
+    ):
+        self.factory = factory          # (provider, model, api_key) → client
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.close_grace = close_grace
+        self._lock = threading.Lock()
+        self._clients: "OrderedDict[tuple, list]" = OrderedDict()  # key → [client, last_used]
+        self._retired: List[Tuple[object, float]] = []             # (client, lúc bị gỡ khỏi pool)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.closed = 0
+
+    @staticmethod
+    def credential_hash(api_key: str) -> str:
+        return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+    def get(self, provider: str, model: str, api_key: str = ""):
+        key = (provider, model, self.credential_hash(api_key))
+        client = self._lookup(key)
+        if client is not None:
+            return client
+
+        built = self.factory(provider, model, api_key)  # ngoài lock: có thể mất hàng trăm ms
+        now = time.monotonic()
+        with self._lock:
+            self.misses += 1
+            entry = self._clients.get(key)
+            if entry is not None:
+                # Request khác build xong trước → dùng bản đó, bản vừa build bị đóng ngay
+                entry[1] = now
+                self._clients.move_to_end(key)
+                client, to_close = entry[0], [built]
+            else:
+                self._clients[key] = [built, now]
+                while len(self._clients) > self.max_size:
+                    _, (evicted, _) = self._clients.popitem(last=False)
+                    self._retired.append((evicted, now))
+                    self.evictions += 1
+                client, to_close = built, self._reap(now)
+        self._close(to_close)
+        return client
+
+    async def aget(self, provider: str, model: str, api_key: str = ""):
+        """get() cho event loop: hit trả ngay, miss build client trong thread pool."""
+        client = self._lookup((provider, model, self.credential_hash(api_key)))
+        if client is not None:
+            return client
+        return await asyncio.to_thread(self.get, provider, model, api_key)
+
+    def _lookup(self, key: tuple):
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            to_close = self._reap(now)
+            entry = self._clients.get(key)
+            if entry is not None:
+                entry[1] = now
+                self._clients.move_to_end(key)
+                self.hits += 1
+        self._close(to_close)
+        return entry[0] if entry is not None else None
+
+    def _expire(self, now: float) -> None:
+        # OrderedDict theo thứ tự dùng gần nhất → entry cũ nhất ở đầu
+        while self._clients:
+            key, (client, last_used) = next(iter(self._clients.items()))
+            if now - last_used <= self.idle_ttl:
+                break
+            del self._clients[key]
+            self._retired.append((client, now))
+            self.expirations += 1
+
+    def _reap(self, now: float) -> list:
+        """Lấy ra các client đã gỡ khỏi pool quá close_grace (gọi trong lock)."""
+        due = [c for c, at in self._retired if now - at >= self.close_grace]
+        if due:
+            self._retired = [(c, at) for c, at in self._retired if now - at < self.close_grace]
+        return due
+
+    def _close(self, clients: list) -> None:
+        for client in clients:
+            close = getattr(client, "close", None)
+            if close is None:
+                continue
+            try:
+                close()
+            except Exception as e:
+                print(f"  [WARN] Closing pooled LLM client failed: {e}")
+            with self._lock:
+                self.closed += 1
+
+    def close(self) -> None:
+        """Shutdown: đóng mọi client, kể cả client đang chờ hết close_grace."""
+        with self._lock:
+            clients = [entry[0] for entry in self._clients.values()] + [c for c, _ in self._retired]
+            self._clients.clear()
+            self._retired = []
+        self._close(clients)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._clients),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "retired": len(self._retired),
+                "closed": self.closed,
+            }
+
+
+class OllamaProvider:
+
+    name = "ollama"
+
+    # Lỗi ở tầng kết nối — request chưa tới server, retry an toàn
+    RETRYABLE = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+    def __init__(
+        self,
+        base_url: str = "http://localhost:11434",
+        max_connections: int = 20,
+        max_keepalive: int = 10,
+        keepalive_expiry: float = 30.0,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 120.0,
+        write_timeout: float = 10.0,
+        pool_timeout: float = 5.0,
+        max_retries: int = 2,
+        backoff: float = 0.25,
+    ):
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                connect=connect_timeout,
+                read=read_timeout,
+                write=write_timeout,
+                pool=pool_timeout,
+            ),
+        )
+
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+
+    # ─── Public API ──────────────────────────────────────────
+    async def generate(self, prompt: str, model: str, temperature: float = 0.2) -> str:
+        """Sinh toàn bộ câu trả lời (không stream)."""
+        payload = self._payload(prompt, model, temperature, stream=False)
+        async with self._track():
+            resp = await self._with_retry(lambda: self.client.post("/api/generate", json=payload))
+            resp.raise_for_status()
+            return resp.json().get("response", "").strip()
+
+    async def stream(self, prompt: str, model: str, temperature: float = 0.2) -> AsyncIterator[str]:
+        """Stream từng token từ Ollama (NDJSON)."""
+        payload = self._payload(prompt, model, temperature, stream=True)
+        async with self._track():
+            request = self.client.build_request("POST", "/api/generate", json=payload)
+            resp = await self._with_retry(lambda: self.client.send(request, stream=True))
+            try:
+                resp.raise_for_status()
+                async for line in resp.aiter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    token = data.get("response", "")
+                    if token:
+                        yield token
+                    if data.get("done"):
+                        break
+            finally:
+                await resp.aclose()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "base_url": self.base_url,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "max_connections": self.max_connections,
+                "pool_utilization": round(self.in_flight / self.max_connections, 4),
+                "requests": self.requests,
+                "retries": self.retries,
+                "errors": self.errors,
+            }
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    # ─── Internal ────────────────────────────────────────────
+    @staticmethod
+    def _payload(prompt: str, model: str, temperature: float, stream: bool) -> dict:
+        return {
+            "model": model,
+            "prompt": prompt,
+            "stream": stream,
+            "options": {"temperature": temperature},
+        }
+
+    async def _with_retry(self, send):
+        """Retry lỗi kết nối với backoff 0.25s → 0.5s → 1s ..."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await send()
+            except self.RETRYABLE:
+                if attempt == self.max_retries:
+                    raise
+                with self._lock:
+                    self.retries += 1
+                await asyncio.sleep(self.backoff * (2 ** attempt))
+
+    @asynccontextmanager
+    async def _track(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            yield
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
@@ -0,0 +1,351 @@
+"""
+Module 8b: LLM Router — hedged request + failover giữa các provider.
+
+Vấn đề: 1 provider chậm (Gemini nghẽn, Ollama local quá tải) → p99 latency
+kéo dài mà không có đường lui.
+
+Cách làm (stream):
+1. Gửi request tới target đầu tiên (provider chính)
+2. Nếu sau `hedge delay` chưa có token đầu tiên → gửi thêm request tới
+   target kế tiếp (hedge). Stream nào ra token đầu tiên trước thì thắng,
+   stream còn lại bị huỷ ngay.
+3. Target lỗi trước token đầu tiên → chuyển sang target kế tiếp (failover).
+   Sau khi đã yield token thì không đổi target nữa (tránh trả token trùng).
+
+Hedge delay của mỗi target = quantile (mặc định p95) của histogram TTFT
+(time-to-first-token) của chính target đó, kẹp trong [min_delay, max_delay].
+Attempt bị huỷ trước token đầu tiên góp thời gian đã chờ làm mẫu cận dưới.
+Chưa đủ mẫu → dùng default_delay.
+"""
+import asyncio
+import bisect
+import threading
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+
+class LLMUnavailableError(RuntimeError):
+    """Mọi target đều lỗi trước khi trả token đầu tiên."""
+
+
+class LatencyHistogram:
+    """
+    Histogram latency với bucket cố định (giây, tăng dần theo cấp số nhân).
+    O(1) bộ nhớ, quantile xấp xỉ bằng cận trên của bucket.
+    """
+
+    BUCKETS = (
+        0.025, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5, 0.75,
+        1.0, 1.5, 2.0, 3.0, 4.0, 5.0, 7.5, 10.0, 15.0, 30.0, 60.0,
+    )
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # bucket cuối = +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+        return self.buckets[-1]
+
+    def snapshot(self) -> Tuple[tuple, List[int], float, int]:
+        """(buckets, counts theo bucket — phần tử cuối là +Inf, sum, count) để export."""
+        return self.buckets, list(self.counts), self.sum, self.count
+
+
+# tokens/giây của pha decode (dùng LatencyHistogram với bucket tốc độ)
+TOKENS_PER_SECOND_BUCKETS = (1, 2.5, 5, 10, 15, 20, 30, 40, 50, 75, 100, 150, 200, 300, 500, 1000)
+
+
+@dataclass
+class LLMTarget:
+    """1 đích gọi LLM: tên (vd 'ollama:qwen2.5:7b') + hàm stream(prompt)."""
+    name: str
+    stream: Callable[[str], AsyncIterator[str]]
+
+
+class _TargetStats:
+    def __init__(self):
+        self.ttft = LatencyHistogram()
+        self.generation = LatencyHistogram()   # gửi request → token cuối (stream thắng)
+        self.tokens_per_s = LatencyHistogram(TOKENS_PER_SECOND_BUCKETS)
+        self.tokens = 0
+        self.requests = 0
+        self.wins = 0
+        self.hedges = 0       # số lần được gửi làm request hedge
+        self.failovers = 0    # số lần được gửi vì target trước lỗi
+        self.cancelled = 0    # thua cuộc đua, bị huỷ
+        self.errors = 0
+
+
+class _Attempt:
+    """1 request đang chạy: iterator của stream + future chờ token đầu tiên."""
+
+    def __init__(self, target: LLMTarget, prompt: str):
+        self.target = target
+        self.start = time.perf_counter()
+        self.iterator = target.stream(prompt).__aiter__()
+        self.first = asyncio.ensure_future(self.iterator.__anext__())
+
+    async def close(self) -> None:
+        if not self.first.done():
+            self.first.cancel()
+            try:
+                await self.first
+            except BaseException:
+                pass
+        aclose = getattr(self.iterator, "aclose", None)
+        if aclose is not None:
+            try:
+                await aclose()
+            except Exception:
+                pass
+
+
+class LLMRouter:
+
+    def __init__(
+        self,
+        hedging: bool = True,
+        hedge_quantile: float = 0.95,
+        min_delay_ms: float = 250.0,
+        max_delay_ms: float = 4000.0,
+        default_delay_ms: float = 1500.0,
+        min_samples: int = 20,
+        count_tokens: Optional[Callable[[str], int]] = None,
+    ):
+        """
+        Args:
+            count_tokens: đếm token câu trả lời cho tokens/s (mặc định TokenCounter,
+                          bỏ qua lru_cache — câu trả lời hiếm khi lặp lại)
+        """
+        self.hedging = hedging
+        self.hedge_quantile = hedge_quantile
+        self.min_delay = min_delay_ms / 1000.0
+        self.max_delay = max_delay_ms / 1000.0
+        self.default_delay = default_delay_ms / 1000.0
+        self.min_samples = min_samples
+        if count_tokens is None:
+            # Import ở đây: admission / metrics import module này từ routes (lúc bind cổng)
+            from .context_packer import TokenCounter
+            count_tokens = TokenCounter().count.__wrapped__
+        self.count_tokens = count_tokens
+
+        self._lock = threading.Lock()
+        self._targets: Dict[str, _TargetStats] = {}
+        self.requests = 0
+        self.hedged_requests = 0
+        self.failed_requests = 0
+
+    def _stats(self, name: str) -> _TargetStats:
+        with self._lock:
+            if name not in self._targets:
+                self._targets[name] = _TargetStats()
+            return self._targets[name]
+
+    def hedge_delay(self, name: str) -> float:
+        """Thời gian chờ token đầu tiên của target trước khi gửi hedge."""
+        hist = self._stats(name).ttft
+        with self._lock:
+            if hist.count < self.min_samples:
+                return self.default_delay
+            q = hist.quantile(self.hedge_quantile)
+        return min(self.max_delay, max(self.min_delay, q))
+
+    async def stream(self, prompt: str, targets: List[LLMTarget]) -> AsyncIterator[str]:
+        """
+        Stream token từ target nhanh nhất.
+        Args:
+            targets: theo thứ tự ưu tiên — [chính, dự phòng 1, ...]
+        """
+        if not targets:
+            raise LLMUnavailableError("No LLM target configured")
+
+        remaining = list(targets)
+        attempts: Dict[asyncio.Future, _Attempt] = {}
+        errors: List[str] = []
+        winner: Optional[_Attempt] = None
+        first_token = None
+        hedged = False
+
+        def launch(reason: str = "primary") -> _Attempt:
+            attempt = _Attempt(remaining.pop(0), prompt)
+            attempts[attempt.first] = attempt
+            stats = self._stats(attempt.target.name)
+            with self._lock:
+                stats.requests += 1
+                if reason == "hedge":
+                    stats.hedges += 1
+                elif reason == "failover":
+                    stats.failovers += 1
+            return attempt
+
+        with self._lock:
+            self.requests += 1
+        latest = launch()
+
+        try:
+            while winner is None:
+                timeout = None
+                if self.hedging and remaining:
+                    waited = time.perf_counter() - latest.start
+                    timeout = max(0.0, self.hedge_delay(latest.target.name) - waited)
+
+                done, _ = await asyncio.wait(
+                    attempts.keys(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Hết hedge delay mà chưa có token → gửi thêm target kế tiếp
+                    if not hedged:
+                        hedged = True
+                        with self._lock:
+                            self.hedged_requests += 1
+                    latest = launch("hedge")
+                    continue
+
+                for future in done:
+                    attempt = attempts.pop(future)
+                    error = future.exception()
+                    if error is None or isinstance(error, StopAsyncIteration):
+                        if winner is None:
+                            winner = attempt
+                            first_token = None if error else future.result()
+                        else:
+                            attempts[future] = attempt  # đóng cùng các attempt thua
+                        continue
+
+                    stats = self._stats(attempt.target.name)
+                    with self._lock:
+                        stats.errors += 1
+                    errors.append(f"{attempt.target.name}: {type(error).__name__}: {error}")
+                    print(f"  [WARN] LLM target {attempt.target.name} failed: {error}")
+
+                if winner is None and not attempts:
+                    if not remaining:
+                        with self._lock:
+                            self.failed_requests += 1
+                        raise LLMUnavailableError("; ".join(errors))
+                    latest = launch("failover")
+
+            # Huỷ các stream thua cuộc
+            for attempt in attempts.values():
+                self._record_cancelled(attempt)
+                await attempt.close()
+            attempts.clear()
+
+            stats = self._stats(winner.target.name)
+            with self._lock:
+                stats.wins += 1
+                stats.ttft.observe(time.perf_counter() - winner.start)
+
+            if first_token is None:
+                return
+            first_at = time.perf_counter()
+            parts = [first_token]
+            yield first_token
+            try:
+                async for token in winner.iterator:
+                    parts.append(token)
+                    yield token
+            except Exception:
+                with self._lock:
+                    stats.errors += 1
+                raise
+            self._record_generation(stats, winner.start, first_at, parts)
+        finally:
+            # Client ngắt kết nối / lỗi giữa chừng → dọn mọi request còn chạy
+            for attempt in attempts.values():
+                self._record_cancelled(attempt)
+                await attempt.close()
+            if winner is not None:
+                await winner.close()
+
+    def _record_cancelled(self, attempt: _Attempt) -> None:
+        """
+        Attempt bị huỷ trước token đầu tiên: thời gian đã chờ là cận dưới của TTFT.
+        Bỏ mẫu này thì target chậm (chính là target bị hedge) vắng mặt trong histogram
+        → q95 chỉ còn mẫu nhanh, hedge delay tụt dần và hedge ngày càng nhiều.
+        """
+        stats = self._stats(attempt.target.name)
+        with self._lock:
+            stats.cancelled += 1
+            stats.ttft.observe(time.perf_counter() - attempt.start)
+
+    def _record_generation(self, stats: _TargetStats, start: float, first_at: float, parts: List[str]) -> None:
+        """Stream hoàn tất: thời gian sinh + tốc độ decode (sau token đầu tiên)."""
+        end = time.perf_counter()
+        # Token của chunk đầu tới cùng lúc với TTFT → không tính vào tốc độ decode
+        first = self.count_tokens(parts[0])
+        rest = self.count_tokens("".join(parts[1:]))
+        with self._lock:
+            stats.generation.observe(end - start)
+            stats.tokens += first + rest
+            if rest and end > first_at:
+                stats.tokens_per_s.observe(rest / (end - first_at))
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Histogram + counter theo target (bản sao) cho /metrics."""
+        with self._lock:
+            return {
+                name: {
+                    "ttft": s.ttft.snapshot(),
+                    "generation": s.generation.snapshot(),
+                    "tokens_per_s": s.tokens_per_s.snapshot(),
+                    "requests": s.requests,
+                    "errors": s.errors,
+                    "tokens": s.tokens,
+                }
+                for name, s in self._targets.items()
+            }
+
+    def stats(self) -> dict:
+        with self._lock:
+            targets = {
+                name: {
+                    "requests": s.requests,
+                    "wins": s.wins,
+                    "hedges": s.hedges,
+                    "failovers": s.failovers,
+                    "cancelled": s.cancelled,
+                    "errors": s.errors,
+                    "ttft_ms": {
+                        "samples": s.ttft.count,
+                        "p50": self._ms(s.ttft.quantile(0.5)),
+                        "p95": self._ms(s.ttft.quantile(0.95)),
+                        "p99": self._ms(s.ttft.quantile(0.99)),
+                    },
+                    "generation_ms": {
+                        "p50": self._ms(s.generation.quantile(0.5)),
+                        "p95": self._ms(s.generation.quantile(0.95)),
+                    },
+                    "tokens_per_s_p50": s.tokens_per_s.quantile(0.5),
+                }
+                for name, s in self._targets.items()
+            }
+            summary = {
+                "hedging": self.hedging,
+                "requests": self.requests,
+                "hedged_requests": self.hedged_requests,
+                "failed_requests": self.failed_requests,
+            }
+        for name in targets:
+            targets[name]["hedge_delay_ms"] = self._ms(self.hedge_delay(name))
+        return {**summary, "targets": targets}
+
+    @staticmethod
+    def _ms(seconds: Optional[float]) -> Optional[float]:
+        return round(1000 * seconds, 1) if seconds is not None else None
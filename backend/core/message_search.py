@@ -0,0 +1,186 @@
+"""
+Full-text search trên tin nhắn — SQLite FTS5.
+
+- messages_fts: bảng FTS5 contentless (content=''), rowid = messages.rowid.
+  Chỉ lưu index, nội dung đọc lại từ messages → không nhân đôi dung lượng.
+- Trigger INSERT / DELETE / UPDATE trên messages giữ index đồng bộ
+  (write-behind writer, archive... không cần biết tới FTS).
+- Tiếng Việt: tokenizer unicode61 remove_diacritics 2 bỏ dấu thanh / dấu mũ
+  ("điểm" ~ "diem"), riêng "đ" là chữ cái riêng (không phải d + dấu) → gấp
+  đ→d trước khi index và khi tạo câu truy vấn.
+- sort=rank: bm25 trên toàn bộ tập khớp (ORDER BY rank do FTS5 xử lý, trang sâu
+  không mất kết quả). Chi phí tỉ lệ số tin khớp — đo trên 1 triệu tin: từ hiếm
+  <1ms, từ khớp 1/10 số tin ~150ms, từ có trong mọi tin ~1.5s.
+  sort=recent: rowid DESC, FTS5 dừng sớm nhờ LIMIT.
+
+Lưu ý: VACUUM đầy đủ có thể đánh lại rowid của messages → chạy
+rebuild_search_index() sau đó (incremental_vacuum không đổi rowid).
+"""
+import re
+import time
+import unicodedata
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+FTS_TABLE = "messages_fts"
+TOKENIZER = "unicode61 remove_diacritics 2"
+SORTS = ("rank", "recent")
+
+# Biểu thức SQL gấp đ/Đ → d/D (phần dấu còn lại do tokenizer xử lý)
+_FOLD_SQL = "replace(replace({col}, 'đ', 'd'), 'Đ', 'D')"
+
+_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(content, content='', tokenize='{TOKENIZER}')",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.rowid, {_FOLD_SQL.format(col='new.content')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.rowid, {_FOLD_SQL.format(col='old.content')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.rowid, {_FOLD_SQL.format(col='old.content')});
+        INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.rowid, {_FOLD_SQL.format(col='new.content')});
+    END""",
+]
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+
+def ensure_search_index(conn) -> bool:
+    """
+    Tạo bảng FTS + trigger nếu chưa có, backfill tin nhắn cũ (chạy 1 lần khi nâng cấp).
+    conn: Connection đồng bộ (dùng qua run_sync). Returns False nếu không hỗ trợ FTS5.
+    """
+    if conn.dialect.name != "sqlite":
+        return False
+    exists = conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+    ).first() is not None
+    try:
+        for ddl in _DDL:
+            conn.exec_driver_sql(ddl)
+    except Exception as e:
+        print(f"  [WARN] Full-text search disabled (FTS5 unavailable): {e}")
+        return False
+    if not exists:
+        _backfill(conn)
+    return True
+
+
+def rebuild_search_index(conn) -> None:
+    """Xoá và index lại toàn bộ (vd sau VACUUM đầy đủ)."""
+    conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')")
+    _backfill(conn)
+
+
+def optimize_search_index(conn) -> None:
+    """
+    Gộp toàn bộ segment FTS thành 1. Xoá hàng loạt (archive) chỉ ghi thêm tombstone
+    vào segment mới — không gộp thì index phình dù số tin giảm (đo: 25.7MB → 6MB,
+    0.45s với 72k tin). Chi phí tỉ lệ với dữ liệu nóng, hợp với job bảo trì định kỳ.
+    """
+    conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+
+
+def _backfill(conn) -> None:
+    start = time.perf_counter()
+    result = conn.exec_driver_sql(
+        f"INSERT INTO {FTS_TABLE}(rowid, content) SELECT rowid, {_FOLD_SQL.format(col='content')} FROM messages"
+    )
+    if result.rowcount:
+        print(f"  [INFO] Search index: {result.rowcount:,} messages indexed in {time.perf_counter() - start:.1f}s")
+
+
+# ─── Query ───────────────────────────────────────────────────
+def fold(s: str) -> str:
+    """Bỏ dấu + chữ thường, giữ nguyên độ dài (mỗi ký tự → đúng 1 ký tự) để map vị trí về chuỗi gốc."""
+    out = []
+    for ch in s.lower():
+        if ch == "đ":
+            out.append("d")
+            continue
+        base = unicodedata.normalize("NFD", ch)[0]
+        out.append(base if base.isalnum() else ch)
+    return "".join(out)
+
+
+def match_query(query: str) -> str:
+    """
+    Câu người dùng → biểu thức MATCH an toàn: mỗi từ thành 1 phrase trong ngoặc kép
+    (không để cú pháp FTS5 như AND/OR/NEAR/*/: lọt vào), các từ AND với nhau.
+    Không khớp tiền tố: "ngành"* phải quét mọi token bắt đầu bằng "nganh" (chậm ~300 lần).
+    Rỗng nếu không có từ nào.
+    """
+    return " ".join(f'"{t}"' for t in _TERM.findall(fold(query)))
+
+
+def snippet(content: str, query: str, width: int = 160) -> str:
+    """Đoạn quanh từ khoá đầu tiên khớp (so khớp trên bản đã gấp dấu)."""
+    if len(content) <= width:
+        return content
+    folded = fold(content)
+    pos = min((p for p in (folded.find(t) for t in _TERM.findall(fold(query))) if p >= 0), default=0)
+    start = max(0, min(pos - width // 3, len(content) - width))
+    text_ = content[start:start + width]
+    return ("…" if start > 0 else "") + text_ + ("…" if start + width < len(content) else "")
+
+
+async def search_messages(
+    db: AsyncSession,
+    query: str,
+    limit: int = 20,
+    offset: int = 0,
+    sort: str = "rank",
+    role: Optional[str] = None,
+    conversation_id: Optional[str] = None,
+) -> Tuple[List[dict], Optional[int]]:
+    """
+    Tìm tin nhắn theo nội dung. sort=rank xếp hạng bm25 trên mọi tin khớp
+    (toàn bộ DB hoặc 1 hội thoại), sort=recent mới nhất trước.
+    Returns: (kết quả, offset trang tiếp theo | None nếu hết)
+    """
+    if sort not in SORTS:
+        raise ValueError(f"Unknown sort '{sort}' ({' | '.join(SORTS)})")
+    expr = match_query(query)
+    if not expr:
+        return [], None
+
+    filters, params = "", {"expr": expr, "limit": limit + 1, "offset": offset}
+    if role:
+        filters += " AND m.role = :role"
+        params["role"] = role
+    if conversation_id:
+        filters += " AND m.conversation_id = :conversation_id"
+        params["conversation_id"] = conversation_id
+    # rank: FTS5 tự sắp theo bm25 (query plan "INDEX 32:M1"), messages chỉ được
+    # tra theo rowid cho các dòng cần trả; recent: FTS5 duyệt rowid giảm dần và
+    # dừng ở LIMIT. bm25 cần thống kê toàn bộ doclist → sort=recent không tính điểm
+    order, score = ("f.rank", "f.rank") if sort == "rank" else ("f.rowid DESC", "NULL")
+
+    rows = (await db.execute(text(f"""
+        SELECT m.id, m.conversation_id, c.title, m.role, m.content, m.created_at, {score} AS score
+        FROM {FTS_TABLE} AS f
+        JOIN messages AS m ON m.rowid = f.rowid
+        LEFT JOIN conversations AS c ON c.id = m.conversation_id
+        WHERE {FTS_TABLE} MATCH :expr{filters}
+        ORDER BY {order}
+        LIMIT :limit OFFSET :offset
+    """), params)).all()
+
+    has_more = len(rows) > limit
+    results = [
+        {
+            "id": r.id,
+            "conversation_id": r.conversation_id,
+            "conversation_title": r.title,
+            "role": r.role,
+            "snippet": snippet(r.content, query),
+            "created_at": str(r.created_at),
+            # bm25 của FTS5: càng âm càng liên quan
+            "score": round(-float(r.score), 4) if r.score is not None else None,
+        }
+        for r in rows[:limit]
+    ]
+    return results, offset + limit if has_more else None
@@ -0,0 +1,197 @@
+"""
+Metrics — số liệu vận hành dạng Prometheus text (GET /metrics).
+
+- Latency từng stage của 1 lượt chat (query_embed, faiss_search, bm25_search,
+  fusion, rerank, prompt_build): LatencyHistogram bucket cố định, observe() =
+  bisect + vài phép cộng dưới 1 lock, không cấp phát → bật thường trực được.
+  Retrieval chạy trong thread pool nên nhiều thread ghi cùng lúc → cần lock.
+- LLM (TTFT, thời gian sinh, tokens/s, lỗi theo target): histogram sẵn có của
+  LLMRouter, chỉ đọc snapshot lúc scrape.
+- Counter / gauge còn lại (cache hit, admission, index, DB writer) đọc từ
+  stats() của từng component lúc scrape — không thêm chi phí trên đường request.
+"""
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .llm_router import LatencyHistogram
+
+STAGES = ("query_embed", "faiss_search", "bm25_search", "fusion", "rerank", "prompt_build")
+# Stage retrieval / prompt: từ 0.1ms (FAISS trên index nhỏ) tới vài giây
+STAGE_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+INGEST_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+PREFIX = "chatbot"
+
+
+class Metrics:
+
+    def __init__(self):
+        self.stages: Dict[str, LatencyHistogram] = {s: LatencyHistogram(STAGE_BUCKETS) for s in STAGES}
+        self.ingest_jobs: Dict[str, int] = {"success": 0, "error": 0}
+        self.ingest_time = LatencyHistogram(INGEST_BUCKETS)
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, start: float) -> None:
+        """start: time.perf_counter() lúc bắt đầu stage."""
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.stages[stage].observe(elapsed)
+
+    def ingest_done(self, start: float, ok: bool) -> None:
+        self.ingest_jobs["success" if ok else "error"] += 1
+        self.ingest_time.observe(time.perf_counter() - start)
+
+
+metrics = Metrics()
+
+
+# ─── Exposition (text format 0.0.4) ──────────────────────────
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Optional[dict]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _number(v: float) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Writer:
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def family(self, name: str, kind: str, help_: str) -> str:
+        name = f"{PREFIX}_{name}"
+        self.lines.append(f"# HELP {name} {help_}")
+        self.lines.append(f"# TYPE {name} {kind}")
+        return name
+
+    def sample(self, name: str, value, labels: Optional[dict] = None) -> None:
+        self.lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+    def simple(self, name: str, kind: str, help_: str, samples: Iterable[Tuple[Optional[dict], float]]) -> None:
+        samples = list(samples)
+        if not samples:
+            return
+        full = self.family(name, kind, help_)
+        for labels, value in samples:
+            self.sample(full, value, labels)
+
+    def histogram(self, name: str, help_: str, series: Iterable[Tuple[Optional[dict], tuple]]) -> None:
+        """series: (labels, LatencyHistogram.snapshot())."""
+        series = list(series)
+        if not series:
+            return
+        full = self.family(name, "histogram", help_)
+        for labels, (buckets, counts, total, count) in series:
+            labels = labels or {}
+            cumulative = 0
+            for le, n in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += n
+                self.sample(f"{full}_bucket", cumulative, {**labels, "le": le if le == "+Inf" else _number(float(le))})
+            self.sample(f"{full}_sum", float(total), labels)
+            self.sample(f"{full}_count", count, labels)
+
+    def text(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+def render(state) -> str:
+    """Toàn bộ metrics từ app.state (component chưa load xong → bỏ qua family đó)."""
+    w = _Writer()
+    engine = getattr(state, "chat_engine", None)
+    w.simple("engine_ready", "gauge", "1 khi model + index đã load xong", [(None, int(engine is not None))])
+
+    # Stage latency
+    w.histogram("stage_duration_seconds", "Latency từng stage của 1 lượt chat",
+                (({"stage": s}, h.snapshot()) for s, h in metrics.stages.items()))
+
+    if engine is not None:
+        _llm(w, engine)
+        _caches(w, engine, getattr(state, "sessions", None))
+        _index(w, engine.retriever)
+
+    # Ingest
+    w.simple("ingest_jobs_total", "counter", "Số lần ingest tài liệu theo kết quả",
+             (({"status": k}, v) for k, v in metrics.ingest_jobs.items()))
+    w.histogram("ingest_duration_seconds", "Thời gian 1 lần ingest (parse + embed + rebuild index)",
+                [(None, metrics.ingest_time.snapshot())])
+
+    drops = getattr(state, "history_drops", None)
+    if drops is not None:
+        w.simple("history_dropped_messages_total", "counter",
+                 "Tin chưa tóm tắt bị bỏ khỏi prompt vì summary chưa theo kịp", [(None, drops.stats()["messages"])])
+
+    writer = getattr(state, "writer", None)
+    if writer is not None:
+        s = writer.stats()
+        w.simple("db_rows_written_total", "counter", "Số row write-behind đã commit", [(None, s["written"])])
+        w.simple("db_write_failures_total", "counter", "Số row write-behind bị bỏ do lỗi", [(None, s["failed"])])
+        w.simple("db_write_queue", "gauge", "Số row đang chờ ghi", [(None, s["queued"])])
+    return w.text()
+
+
+def _llm(w: _Writer, engine) -> None:
+    targets = engine.router.snapshot()
+    w.histogram("llm_ttft_seconds", "Time-to-first-token theo target (stream thắng)",
+                (({"target": t}, s["ttft"]) for t, s in targets.items()))
+    w.histogram("llm_generation_seconds", "Thời gian sinh trọn câu trả lời theo target",
+                (({"target": t}, s["generation"]) for t, s in targets.items()))
+    w.histogram("llm_tokens_per_second", "Tốc độ decode (token sau chunk đầu tiên / giây)",
+                (({"target": t}, s["tokens_per_s"]) for t, s in targets.items()))
+    w.simple("llm_requests_total", "counter", "Request gửi tới từng target (gồm hedge / failover)",
+             (({"target": t}, s["requests"]) for t, s in targets.items()))
+    w.simple("llm_errors_total", "counter", "Lỗi theo target",
+             (({"target": t}, s["errors"]) for t, s in targets.items()))
+    w.simple("llm_tokens_total", "counter", "Token câu trả lời đã sinh theo target",
+             (({"target": t}, s["tokens"]) for t, s in targets.items()))
+    w.simple("llm_failed_requests_total", "counter", "Lượt chat mà mọi target đều lỗi",
+             [(None, engine.router.stats()["failed_requests"])])
+
+    gates = engine.admission.stats()
+    w.simple("llm_active", "gauge", "Generation đang chạy theo provider",
+             (({"provider": p}, g["active"]) for p, g in gates.items()))
+    w.simple("llm_queue_depth", "gauge", "Request đang chờ slot theo provider",
+             (({"provider": p}, g["queue_depth"]) for p, g in gates.items()))
+    w.simple("llm_rejected_total", "counter", "Request bị từ chối vì quá tải theo provider",
+             [({"provider": p, "reason": r}, g[key]) for p, g in gates.items()
+              for r, key in (("queue_full", "rejected_queue_full"), ("deadline", "dropped_deadline"))])
+    w.histogram("llm_admission_wait_seconds", "Thời gian chờ slot generation theo provider",
+                (({"provider": p}, snap) for p, snap in engine.admission.wait_histograms().items()))
+
+
+def _caches(w: _Writer, engine, sessions) -> None:
+    caches = []
+    if engine.cache is not None:
+        s = engine.cache.stats()
+        caches.append(("semantic", s["hits"], s["misses"]))
+    if sessions is not None:
+        s = sessions.stats()
+        caches.append(("session", s["hits"], s["misses"]))
+    if engine.tables is not None:
+        s = engine.tables.stats()
+        caches.append(("table_fast_path", s["hits"], s["lookups"] - s["hits"]))
+    if engine.faq is not None:
+        s = engine.faq.stats()
+        caches.append(("faq", s["hits"], s["lookups"] - s["hits"]))
+    s = engine.flights.stats()
+    caches.append(("single_flight", s["coalesced"], s["leaders"]))
+    w.simple("cache_hits_total", "counter", "Cache hit theo loại cache", (({"cache": c}, h) for c, h, _ in caches))
+    w.simple("cache_misses_total", "counter", "Cache miss theo loại cache", (({"cache": c}, m) for c, _, m in caches))
+
+
+def _index(w: _Writer, retriever) -> None:
+    vs, bm25 = retriever.vs, retriever.bm25
+    w.simple("index_chunks", "gauge", "Số chunk trong index",
+             [({"index": "faiss"}, vs.index.ntotal), ({"index": "bm25"}, len(bm25.chunks))])
+    w.simple("index_vector_bytes", "gauge", "Dung lượng vector FAISS (ntotal × dim × 4)",
+             [(None, vs.index.ntotal * vs.index.d * 4)])
+    w.simple("index_info", "gauge", "Version index đang phục vụ (đổi sau mỗi lần ingest)",
+             [({"version": retriever.index_version}, 1)])
@@ -4,7 +4,7 @@ Hỗ trợ: PDF, Excel (.xlsx/.xls), Word (.docx), Text (.txt)
 Tự động làm sạch header/footer và chuẩn hóa text tiếng Việt.
 """
 from pathlib import Path
-from typing import List
+from typing import List, Tuple
 import re
 import unicodedata
 
@@ -81,30 +81,36 @@ class ExcelParser:
 
     def parse(self, path: str) -> List[str]:
         """Parse tất cả sheets trong file Excel."""
-        xl = pd.ExcelFile(path)
         all_rows = []
-
-        for sheet in xl.sheet_names:
-            df = pd.read_excel(path, sheet_name=sheet)
-            df = df.dropna(how="all")
-            df = df.ffill().fillna("")
-
+        for sheet, df in self.read_frames(path):
             rows = self._parse_sheet(df, sheet_name=sheet)
             all_rows.extend(rows)
 
         return all_rows
 
-    def _parse_sheet(self, df: pd.DataFrame, sheet_name: str) -> List[str]:
-        rows = []
-
-        def normalize_v(s):
-            if pd.isna(s): return ""
-            return unicodedata.normalize("NFC", str(s).strip())
-
-        # 1. Chuẩn hóa tên cột
+    def read_frames(self, path: str) -> List[Tuple[str, pd.DataFrame]]:
+        """Đọc từng sheet thành DataFrame (giữ nguyên bảng, dùng cho TableIndex)."""
+        xl = pd.ExcelFile(path)
+        frames = []
+        for sheet in xl.sheet_names:
+            df = pd.read_excel(path, sheet_name=sheet)
+            df = df.dropna(how="all")
+            df = df.ffill().fillna("")
+            frames.append((sheet, self.find_header(df)))
+        return frames
+
+    @staticmethod
+    def normalize_value(s) -> str:
+        if pd.isna(s): return ""
+        return unicodedata.normalize("NFC", str(s).strip())
+
+    @classmethod
+    def find_header(cls, df: pd.DataFrame) -> pd.DataFrame:
+        """Chuẩn hóa tên cột + dò header thật sự (bảng có vài dòng tiêu đề phía trên)."""
+        normalize_v = cls.normalize_value
         df.columns = [normalize_v(c) for c in df.columns]
-        
-        # 2. Dò tìm header thật sự (ASCII-based search)
+
+        # ASCII-based search
         def is_major_header(s):
             s_clean = normalize_v(s).lower()
             return "nganh" in s_clean or "major" in s_clean or "tên" in s_clean
@@ -116,6 +122,14 @@ class ExcelParser:
                     df.columns = [normalize_v(v) for v in row]
                     df = df.iloc[i+1:].reset_index(drop=True)
                     break
+        return df
+
+    def _parse_sheet(self, df: pd.DataFrame, sheet_name: str) -> List[str]:
+        rows = []
+        normalize_v = self.normalize_value
+
+        # 1-2. Chuẩn hóa tên cột, dò tìm header thật sự
+        df = self.find_header(df)
 
         # Tìm cột ngành bằng ASCII mờ
         major_col = next((c for c in df.columns if "nganh" in normalize_v(c).lower() or "ngành" in normalize_v(c).lower()), None)
@@ -168,11 +182,22 @@ class CSVParser:
     """Parse CSV -> hỗ trợ cả trường hợp file Excel bị đổi đuôi thành .csv."""
 
     def parse(self, path: str) -> List[str]:
+        df = self.read_frame(path)
+        if df is None:
+            return []
+
+        excel_parser = ExcelParser()
+        return excel_parser._parse_sheet(df, "CSV")
+
+    def read_frame(self, path: str):
+        """Đọc CSV thành DataFrame (None nếu file rỗng)."""
         import pandas as pd
-        
+
         # Kiểm tra magic bytes xem có phải là file Zip (Excel) không
         with open(path, "rb") as f:
             header = f.read(4)
+            if not header:
+                return None
             if header == b"PK\x03\x04":
                 df = pd.read_excel(path)
             else:
@@ -183,9 +208,7 @@ class CSVParser:
         
         df = df.dropna(how="all")
         df.columns = [str(c).strip() for c in df.columns]
-        
-        excel_parser = ExcelParser()
-        return excel_parser._parse_sheet(df, "CSV")
+        return df
 
 
 class TextParser:
@@ -0,0 +1,146 @@
+"""
+Module 6b: Cross-Encoder Re-ranker
+Chấm lại các candidates sau RRF fusion bằng cross-encoder chạy local (CPU).
+
+Bi-encoder (embedding) vs Cross-encoder:
+- Bi-encoder: encode query và chunk riêng → so cosine. Nhanh, kém chính xác hơn.
+- Cross-encoder: đưa cặp (query, chunk) vào cùng 1 lần forward → attention
+  giữa 2 chuỗi → điểm liên quan chính xác hơn, nhưng tốn O(N) forward.
+→ Chỉ dùng cross-encoder cho ~15 candidates đã lọc bởi hybrid retriever,
+  chấm tất cả trong 1 batch, giữ top_n chunk có điểm ≥ min_score.
+
+Kiểm soát latency:
+- Ước lượng thời gian/cặp (EMA) → chỉ chấm số cặp vừa latency budget,
+  các candidate còn lại giữ thứ tự RRF (bị bỏ nếu đặt min_score: chưa chấm thì
+  không biết có qua ngưỡng hay không)
+- rerank() là CPU-bound: caller trên event loop chạy nó trong thread pool
+  (HybridRetriever.aretrieve)
+- Cache điểm theo (query, chunk_id): câu hỏi lặp lại không cần forward lại
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from .vector_store import chunk_id
+
+
+class CrossEncoderReranker:
+
+    DEFAULT_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"  # đa ngôn ngữ, có tiếng Việt
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL,
+        top_n: int = 3,
+        min_score: Optional[float] = None,
+        latency_budget_ms: float = 200.0,
+        batch_size: int = 32,
+        max_length: int = 256,
+        cache_size: int = 4096,
+    ):
+        # Import lazy: sentence_transformers kéo theo torch (chậm)
+        from sentence_transformers import CrossEncoder
+
+        print(f"  Loading reranker model: {model_name}")
+        self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+        self.top_n = top_n
+        self.min_score = min_score
+        self.latency_budget = latency_budget_ms / 1000.0
+        self.batch_size = batch_size
+
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._cache_size = cache_size
+        self._sec_per_pair: Optional[float] = None  # EMA thời gian chấm 1 cặp
+
+        self.calls = 0
+        self.pairs_scored = 0
+        self.cache_hits = 0
+        self.budget_truncations = 0
+        self.total_latency = 0.0
+
+    def rerank(
+        self,
+        query: str,
+        candidates: List[Tuple[str, float]],
+    ) -> List[Tuple[str, float]]:
+        """
+        Args:
+            candidates: [(chunk, rrf_score), ...] theo thứ tự fusion
+        Returns:
+            [(chunk, ce_score), ...] tối đa top_n, sorted desc
+        """
+        if not candidates:
+            return []
+        start = time.perf_counter()
+        q_key = " ".join(query.lower().split())
+
+        scored: List[Tuple[str, float]] = []
+        pending: List[str] = []
+        with self._lock:
+            for chunk, _ in candidates:
+                cached = self._cache.get((q_key, chunk_id(chunk)))
+                if cached is None:
+                    pending.append(chunk)
+                else:
+                    self._cache.move_to_end((q_key, chunk_id(chunk)))
+                    scored.append((chunk, cached))
+                    self.cache_hits += 1
+
+        # Latency budget: chỉ chấm số cặp ước lượng vừa budget (giữ thứ tự RRF)
+        max_pairs = len(pending)
+        if self._sec_per_pair:
+            max_pairs = max(1, int(self.latency_budget / self._sec_per_pair))
+        if len(pending) > max_pairs:
+            self.budget_truncations += 1
+        to_score, unscored = pending[:max_pairs], pending[max_pairs:]
+
+        if to_score:
+            t0 = time.perf_counter()
+            ce_scores = self.model.predict(
+                [(query, chunk) for chunk in to_score],
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+            )
+            per_pair = (time.perf_counter() - t0) / len(to_score)
+            with self._lock:
+                self._sec_per_pair = (
+                    per_pair if self._sec_per_pair is None
+                    else 0.8 * self._sec_per_pair + 0.2 * per_pair
+                )
+                for chunk, score in zip(to_score, ce_scores):
+                    self._cache[(q_key, chunk_id(chunk))] = float(score)
+                    scored.append((chunk, float(score)))
+                while len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+                self.pairs_scored += len(to_score)
+
+        scored.sort(key=lambda x: x[1], reverse=True)
+        if self.min_score is not None:
+            # Luôn giữ ít nhất 1 chunk để LLM có ngữ cảnh
+            scored = scored[:1] + [(c, s) for c, s in scored[1:] if s >= self.min_score]
+
+        # Candidate chưa chấm (vượt budget) xếp sau, điểm thấp hơn mọi chunk đã chấm.
+        # Có min_score → bỏ: không để chunk chưa chấm lọt qua khi chunk đã chấm dưới ngưỡng bị loại
+        results = scored
+        if self.min_score is None:
+            floor = scored[-1][1] if scored else 0.0
+            results = scored + [(c, floor - i - 1) for i, c in enumerate(unscored)]
+
+        with self._lock:
+            self.calls += 1
+            self.total_latency += time.perf_counter() - start
+        return results[: self.top_n]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "pairs_scored": self.pairs_scored,
+                "cache_hits": self.cache_hits,
+                "cache_size": len(self._cache),
+                "budget_truncations": self.budget_truncations,
+                "avg_latency_ms": round(1000 * self.total_latency / self.calls, 2) if self.calls else 0.0,
+                "ms_per_pair": round(1000 * self._sec_per_pair, 3) if self._sec_per_pair else None,
+            }
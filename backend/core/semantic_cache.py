@@ -0,0 +1,195 @@
+"""
+Semantic Answer Cache
+Cache câu trả lời theo độ tương đồng ngữ nghĩa của câu hỏi.
+
+Ý tưởng:
+- Nhiều thí sinh hỏi cùng 1 câu với cách diễn đạt khác nhau
+  ("học phí CNTT bao nhiêu?" ≈ "CNTT học phí thế nào?")
+- Lưu embedding của các query đã trả lời vào 1 FAISS index nhỏ
+- Query mới: tìm query cũ có cosine ≥ threshold VÀ retrieve ra cùng tập chunk
+  → trả lời ngay, không gọi LLM
+
+Invalidate:
+- TTL cho từng entry
+- Evict LRU khi vượt số entry / tổng dung lượng
+- Xoá toàn bộ khi index version đổi (sau ingest tài liệu mới)
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+import faiss
+import numpy as np
+
+from .vector_store import chunk_id
+
+
+def chunk_set_key(chunks: Iterable[str]) -> str:
+    """Key của tập chunk retrieve được — không phụ thuộc thứ tự."""
+    ids = sorted(chunk_id(c) for c in chunks)
+    return hashlib.sha1("|".join(ids).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    query: str
+    answer: str
+    sources: List[str]
+    chunk_key: str
+    created_at: float
+    size: int  # bytes ước lượng (answer + sources)
+
+
+class SemanticCache:
+
+    def __init__(
+        self,
+        threshold: float = 0.92,
+        ttl: float = 3600.0,
+        max_entries: int = 1000,
+        max_bytes: int = 16 * 1024 * 1024,
+        search_k: int = 5,
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.search_k = search_k
+
+        self._lock = threading.Lock()
+        self._index: Optional[faiss.IndexIDMap2] = None
+        self._entries: "OrderedDict[int, CacheEntry]" = OrderedDict()  # LRU order
+        self._next_id = 0
+        self._bytes = 0
+        self._version: Optional[str] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    # ─── Public API ──────────────────────────────────────────
+    def lookup(
+        self,
+        q_emb: np.ndarray,
+        chunk_key: str,
+        index_version: str,
+    ) -> Optional[CacheEntry]:
+        """Tìm câu trả lời đã cache cho query tương tự + cùng tập chunk."""
+        with self._lock:
+            self._check_version(index_version)
+            if self._index is None or self._index.ntotal == 0:
+                self.misses += 1
+                return None
+
+            q = self._as_row(q_emb)
+            k = min(self.search_k, self._index.ntotal)
+            scores, ids = self._index.search(q, k)
+
+            now = time.time()
+            for score, entry_id in zip(scores[0], ids[0]):
+                if entry_id == -1 or score < self.threshold:
+                    break
+                entry = self._entries.get(int(entry_id))
+                if entry is None:
+                    continue
+                if now - entry.created_at > self.ttl:
+                    self._remove(int(entry_id))
+                    self.expirations += 1
+                    continue
+                if entry.chunk_key != chunk_key:
+                    continue
+                self._entries.move_to_end(int(entry_id))
+                self.hits += 1
+                return entry
+
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        q_emb: np.ndarray,
+        query: str,
+        answer: str,
+        sources: List[str],
+        chunk_key: str,
+        index_version: str,
+    ) -> None:
+        if not answer:
+            return
+        with self._lock:
+            self._check_version(index_version)
+            q = self._as_row(q_emb)
+            if self._index is None:
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(q.shape[1]))
+
+            entry_id = self._next_id
+            self._next_id += 1
+            size = len(answer.encode("utf-8")) + sum(len(s.encode("utf-8")) for s in sources)
+            self._index.add_with_ids(q, np.array([entry_id], dtype="int64"))
+            self._entries[entry_id] = CacheEntry(
+                query=query,
+                answer=answer,
+                sources=list(sources),
+                chunk_key=chunk_key,
+                created_at=time.time(),
+                size=size,
+            )
+            self._bytes += size
+            self._evict()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "index_version": self._version,
+            }
+
+    # ─── Internal ────────────────────────────────────────────
+    @staticmethod
+    def _as_row(q_emb: np.ndarray) -> np.ndarray:
+        return np.ascontiguousarray(q_emb.reshape(1, -1), dtype="float32")
+
+    def _check_version(self, index_version: str) -> None:
+        """Index đổi (ingest tài liệu mới) → mọi câu trả lời cũ có thể sai."""
+        if self._version != index_version:
+            if self._entries:
+                self.invalidations += 1
+            self._clear()
+            self._version = index_version
+
+    def _clear(self) -> None:
+        self._index = None
+        self._entries.clear()
+        self._bytes = 0
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        self._bytes -= entry.size
+        self._index.remove_ids(np.array([entry_id], dtype="int64"))
+
+    def _evict(self) -> None:
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
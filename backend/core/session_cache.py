@@ -0,0 +1,220 @@
+"""
+Session cache — cửa sổ hội thoại "nóng" trong RAM, write-through.
+
+Mỗi lượt chat đọc lại history từ SQLite dù worker vừa xử lý lượt trước vài
+giây trước đó. Cache giữ cho mỗi hội thoại gần đây:
+- summary + summary_upto (rolling summary)
+- total: tổng số tin nhắn; messages: window tin nhắn mới nhất (role, content)
+→ đủ để dựng (summary, tin chưa tóm tắt) cho prompt mà không đọc DB.
+
+Write-through: writer cập nhật cache ngay khi enqueue message, conversation
+memory cập nhật summary. LRU, giới hạn theo tổng bytes.
+Chỉ cache hội thoại đã nạp đủ (load từ DB hoặc vừa tạo) — không bao giờ
+dựng cửa sổ từ 1 phần dữ liệu.
+"""
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+MESSAGE_OVERHEAD = 120  # bytes ước lượng cho dict + str object mỗi tin nhắn
+ENTRY_OVERHEAD = 400
+
+class HistoryDrops:
+    """
+    Tin chưa tóm tắt vượt limit của prompt (summary không theo kịp, vd LLM tóm tắt
+    lỗi liên tục) → tin cũ nhất bị bỏ khỏi prompt. Đếm cho stats / metrics, không
+    im lặng; log 1 lần mỗi hội thoại (không spam log trên đường request).
+    """
+
+    MAX_WARNED = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._warned: "OrderedDict[str, None]" = OrderedDict()
+        self.prompts = 0
+        self.messages = 0
+
+    def note(self, conversation_id: str, unsummarized: int, limit: int) -> None:
+        """Gọi mỗi lần dựng history cho prompt."""
+        dropped = unsummarized - limit
+        if dropped <= 0:
+            return
+        with self._lock:
+            self.prompts += 1
+            self.messages += dropped
+            first = conversation_id not in self._warned
+            if first:
+                self._warned[conversation_id] = None
+                if len(self._warned) > self.MAX_WARNED:
+                    self._warned.popitem(last=False)
+        if first:
+            print(f"  [WARN] Conversation {conversation_id[:8]}: {dropped} unsummarized messages "
+                  f"left out of the prompt (summary is behind)")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"prompts": self.prompts, "messages": self.messages}
+
+
+def prompt_tail(upto: int, total: int, messages: List[dict], limit: int) -> List[dict]:
+    """Tin nhắn chưa tóm tắt (tối đa limit) từ cửa sổ messages = các tin mới nhất của hội thoại."""
+    tail = min(limit, total - upto, len(messages))
+    return [dict(m) for m in list(messages)[-tail:]] if tail > 0 else []
+
+
+class _Session:
+    __slots__ = ("summary", "upto", "total", "messages", "nbytes")
+
+    def __init__(self, summary: str, upto: int, total: int, messages, window: int):
+        self.summary = summary
+        self.upto = upto
+        self.total = total
+        self.messages = deque(messages, maxlen=window)
+        self.nbytes = 0
+
+
+class SessionCache:
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        window: int = 12,
+        has_pending: Optional[Callable[[str], bool]] = None,
+        drops: Optional[HistoryDrops] = None,
+    ):
+        """
+        Args:
+            window:      số tin nhắn mới nhất giữ mỗi hội thoại (≥ HISTORY_WINDOW của prompt)
+            has_pending: hội thoại còn row chưa commit (write-behind) → không cache
+                         kết quả đọc DB vì có thể thiếu tin nhắn
+            drops:       đếm tin chưa tóm tắt bị bỏ khỏi prompt (dùng chung với route)
+        """
+        self.max_bytes = max_bytes
+        self.window = window
+        self.has_pending = has_pending
+        self.drops = drops or HistoryDrops()
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Session]" = OrderedDict()
+        self._loading: Dict[str, int] = {}  # conv_id → số lần ghi trong lúc đang load từ DB
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_loads = 0
+
+    # ─── Đọc ─────────────────────────────────────────────────
+    def prompt_history(self, conversation_id: str, limit: int) -> Optional[Tuple[str, List[dict]]]:
+        """(summary, tin chưa tóm tắt — tối đa limit) hoặc None nếu miss."""
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(conversation_id)
+            self.hits += 1
+            summary, upto, total, messages = entry.summary, entry.upto, entry.total, list(entry.messages)
+        self.drops.note(conversation_id, total - upto, limit)
+        return summary, prompt_tail(upto, total, messages, limit)
+
+    def begin_load(self, conversation_id: str) -> None:
+        """Gọi trước khi đọc DB — ghi xen giữa lúc load sẽ làm kết quả load bị bỏ."""
+        with self._lock:
+            self._loading.setdefault(conversation_id, 0)
+
+    def put(self, conversation_id: str, summary: str, upto: int, total: int, messages: List[dict]) -> None:
+        """Nạp cửa sổ đọc từ DB (sau begin_load)."""
+        with self._lock:
+            writes = self._loading.pop(conversation_id, 0)
+            if writes or (self.has_pending and self.has_pending(conversation_id)):
+                self.stale_loads += 1
+                return
+            if conversation_id in self._entries:
+                return
+            self._insert(conversation_id, _Session(summary, upto, total, messages, self.window))
+
+    # ─── Write-through ───────────────────────────────────────
+    def create(self, conversation_id: str) -> None:
+        """Hội thoại mới: cửa sổ rỗng là đầy đủ."""
+        with self._lock:
+            self._insert(conversation_id, _Session("", 0, 0, [], self.window))
+
+    def append(self, conversation_id: str, role: str, content: str) -> None:
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                if conversation_id in self._loading:
+                    self._loading[conversation_id] += 1
+                return
+            if len(entry.messages) == entry.messages.maxlen:
+                self.bytes -= self._message_bytes(entry.messages[0])
+                entry.nbytes -= self._message_bytes(entry.messages[0])
+            message = {"role": role, "content": content}
+            entry.messages.append(message)
+            entry.total += 1
+            size = self._message_bytes(message)
+            entry.nbytes += size
+            self.bytes += size
+            self._entries.move_to_end(conversation_id)
+            self._evict()
+
+    def set_summary(self, conversation_id: str, summary: str, upto: int) -> None:
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                if conversation_id in self._loading:
+                    self._loading[conversation_id] += 1
+                return
+            if upto <= entry.upto:
+                return
+            delta = len(summary.encode("utf-8")) - len(entry.summary.encode("utf-8"))
+            entry.summary, entry.upto = summary, upto
+            entry.nbytes += delta
+            self.bytes += delta
+            self._evict()
+
+    def invalidate(self, conversation_id: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(conversation_id, None)
+            if entry is not None:
+                self.bytes -= entry.nbytes
+            if conversation_id in self._loading:
+                self._loading[conversation_id] += 1
+
+    # ─── Nội bộ ──────────────────────────────────────────────
+    @staticmethod
+    def _message_bytes(message: dict) -> int:
+        return len(message["content"].encode("utf-8")) + MESSAGE_OVERHEAD
+
+    def _insert(self, conversation_id: str, entry: _Session) -> None:
+        old = self._entries.pop(conversation_id, None)
+        if old is not None:
+            self.bytes -= old.nbytes
+        entry.nbytes = (
+            ENTRY_OVERHEAD + len(entry.summary.encode("utf-8"))
+            + sum(self._message_bytes(m) for m in entry.messages)
+        )
+        self._entries[conversation_id] = entry
+        self.bytes += entry.nbytes
+        self._evict()
+
+    def _evict(self) -> None:
+        while self.bytes > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self.bytes -= entry.nbytes
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "stale_loads": self.stale_loads,
+                "history_dropped": self.drops.stats(),
+            }
@@ -0,0 +1,176 @@
+"""
+Module 8c: Single-flight — gộp các request chat giống hệt nhau đang chạy đồng thời.
+
+Giờ cao điểm (vd ngay sau khi công bố điểm chuẩn) hàng chục người hỏi cùng
+1 câu cùng lúc → mỗi request gọi LLM riêng. Single-flight:
+- Request đầu tiên với 1 key (leader) chạy generation trong background task
+- Các request cùng key tới sau (follower) subscribe vào generation đó
+- Follower tới giữa chừng được replay lại phần token đã sinh (prefix),
+  sau đó nhận tiếp token mới → mọi subscriber nhận cùng 1 chuỗi token
+- Khi mọi subscriber đã ngắt kết nối (aclose / bị huỷ) → huỷ generation
+"""
+import asyncio
+import hashlib
+import json
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+
+def flight_key(*parts) -> str:
+    """Key ổn định từ các thành phần (query đã chuẩn hoá, context, model, ...)."""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class _Flight:
+    def __init__(self):
+        self.tokens: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def notify(self) -> None:
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class Subscription:
+    """
+    Iterator token của 1 subscriber: replay prefix đã sinh, sau đó nhận token mới.
+
+    Subscriber được đếm ngay từ subscribe(). Không dùng async generator: generator
+    chưa từng chạy thì aclose() không vào finally → subscriber bị bỏ ngang trước
+    token đầu tiên (lưu DB lỗi, client ngắt trước khi stream bắt đầu) không bao giờ
+    được trừ, generation chạy tới cuối và giữ slot admission. aclose() ở đây luôn
+    huỷ đăng ký (idempotent); iterate hết / lỗi / bị huỷ cũng tự huỷ đăng ký.
+    """
+
+    def __init__(self, owner: "SingleFlight", key: str, flight: _Flight):
+        self._owner = owner
+        self._key = key
+        self._flight = flight
+        self._i = 0
+        self._closed = False
+
+    def __aiter__(self) -> "Subscription":
+        return self
+
+    async def __anext__(self) -> str:
+        flight = self._flight
+        if self._closed:
+            raise StopAsyncIteration
+        try:
+            while self._i >= len(flight.tokens):
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    raise StopAsyncIteration
+                await flight.changed.wait()
+        except BaseException:
+            self._release()
+            raise
+        self._i += 1
+        return flight.tokens[self._i - 1]
+
+    async def aclose(self) -> None:
+        self._release()
+
+    def _release(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._owner._unsubscribe(self._key, self._flight)
+
+
+class SingleFlight:
+    """enabled=False: mỗi request chạy generation riêng (vẫn qua task, không gộp)."""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._flights: Dict[str, _Flight] = {}
+        self.requests = 0
+        self.leaders = 0
+        self.coalesced = 0
+        self.replayed_tokens = 0
+        self.max_subscribers = 0
+
+    def in_flight(self, key: str) -> bool:
+        return self.enabled and key in self._flights
+
+    def subscribe(
+        self,
+        key: str,
+        produce: Callable[[], AsyncIterator[str]],
+        on_done: Optional[Callable[[], None]] = None,
+    ) -> Tuple[Subscription, bool]:
+        """
+        Đăng ký vào generation của key (tạo mới nếu chưa có).
+        Generation chạy trong task riêng: subscriber ngắt kết nối không làm
+        dừng generation của các subscriber khác.
+
+        Args:
+            key:     request cùng key dùng chung 1 generation
+            produce: tạo async iterator token (chỉ được gọi bởi leader)
+            on_done: leader — gọi khi task generation kết thúc (xong, lỗi, hay bị huỷ
+                     kể cả trước khi produce kịp chạy), vd trả slot admission
+        Returns:
+            (Subscription, is_leader) — caller phải aclose() khi bỏ ngang (xem Subscription)
+        """
+        self.requests += 1
+        flight = self._flights.get(key) if self.enabled else None
+        leader = flight is None
+        if leader:
+            flight = _Flight()
+            if self.enabled:
+                self._flights[key] = flight
+            flight.task = asyncio.create_task(self._run(key, flight, produce))
+            if on_done is not None:
+                flight.task.add_done_callback(lambda _: on_done())
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+            self.replayed_tokens += len(flight.tokens)
+
+        flight.subscribers += 1
+        self.max_subscribers = max(self.max_subscribers, flight.subscribers)
+        return Subscription(self, key, flight), leader
+
+    def _unsubscribe(self, key: str, flight: _Flight) -> None:
+        flight.subscribers -= 1
+        if flight.subscribers == 0 and not flight.done:
+            # Không còn ai nghe → huỷ generation
+            flight.task.cancel()
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    async def _run(self, key: str, flight: _Flight, produce) -> None:
+        try:
+            async for token in produce():
+                flight.tokens.append(token)
+                flight.notify()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            flight.notify()
+            # Flight xong thì gỡ khỏi registry: request sau sẽ đi qua semantic cache
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "coalescing_ratio": round(self.coalesced / self.requests, 4) if self.requests else 0.0,
+            "replayed_tokens": self.replayed_tokens,
+            "in_flight": len(self._flights),
+            "max_subscribers": self.max_subscribers,
+        }
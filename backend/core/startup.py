@@ -0,0 +1,65 @@
+"""
+Startup tracker — theo dõi quá trình load model/index chạy nền.
+
+Server bind cổng ngay lập tức, các bước nặng (import thư viện, load
+SentenceTransformer, unpickle FAISS/BM25) chạy trong background thread.
+Tracker ghi lại thời gian từng phase để /api/health/ready trả về.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class StartupTracker:
+    """Trạng thái khởi động: starting → loading → ready | failed."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+        self.status = "starting"
+        self.current_phase: Optional[str] = None
+        self.phases: Dict[str, float] = {}   # phase → giây
+        self.error: Optional[str] = None
+        self.ready_after: Optional[float] = None
+
+    @contextmanager
+    def phase(self, name: str):
+        """Đo thời gian 1 phase: `with tracker.phase("load_embedder"): ...`"""
+        with self._lock:
+            self.status = "loading"
+            self.current_phase = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.phases[name] = round(elapsed, 3)
+                self.current_phase = None
+            print(f"  [STARTUP] {name}: {elapsed:.2f}s")
+
+    def mark_ready(self) -> None:
+        with self._lock:
+            self.status = "ready"
+            self.ready_after = round(time.perf_counter() - self._t0, 3)
+
+    def mark_failed(self, error: BaseException) -> None:
+        with self._lock:
+            self.status = "failed"
+            self.error = f"{type(error).__name__}: {error}"
+
+    @property
+    def is_ready(self) -> bool:
+        return self.status == "ready"
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "status": self.status,
+                "current_phase": self.current_phase,
+                "phases": dict(self.phases),
+                "ready_after": self.ready_after,
+                "uptime": round(time.perf_counter() - self._t0, 3),
+                "error": self.error,
+            }
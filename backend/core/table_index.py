@@ -0,0 +1,370 @@
+"""
+Module 9: Table Index — fast path cho câu hỏi tra cứu bảng (điểm chuẩn, học phí).
+
+Phần lớn câu hỏi là tra cứu chính xác: "điểm chuẩn CNTT 2024 cơ sở HN",
+"học phí ATTT khóa 2023". Đi qua embedding + hybrid search + LLM vừa chậm
+vừa có rủi ro LLM đọc nhầm số. Thay vào đó:
+- Giữ nguyên bảng (score.csv, tuition_fees.csv, Excel upload) trong index
+  dạng cột (column → list giá trị) + inverted index theo ngành / năm / cơ sở
+- Matcher nhẹ: nhận diện loại câu hỏi (điểm chuẩn / học phí), ngành
+  (tên đầy đủ, viết tắt, mã ngành), năm, cơ sở — tất cả so khớp không dấu
+- Khớp chắc chắn (đúng 1 ngành, ≤ MAX_ROWS dòng) → trả lời ngay kèm nguồn,
+  không chắc → None để ChatEngine đi đường RAG như bình thường
+"""
+import re
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+SCORE = "score"
+TUITION = "tuition"
+
+# Viết tắt hay gặp → tên ngành (không dấu)
+ABBREVIATIONS = {
+    "cntt": "cong nghe thong tin",
+    "attt": "an toan thong tin",
+    "khmt": "khoa hoc may tinh",
+    "ktdl": "ky thuat du lieu",
+    "dtvt": "dien tu vien thong",
+    "qtkd": "quan tri kinh doanh",
+    "tmdt": "thuong mai dien tu",
+    "mmt": "mang may tinh",
+    "clc": "chat luong cao",
+}
+
+CAMPUSES = {
+    "HN": ("ha noi", "hn", "bvh", "mien bac", "phia bac"),
+    "HCM": ("ho chi minh", "hcm", "tphcm", "sai gon", "bvs", "mien nam", "phia nam"),
+}
+
+INTENT_WORDS = {
+    TUITION: ("hoc phi", "muc thu", "tien hoc", "bao nhieu tien", "dong tien"),
+    SCORE: ("diem chuan", "diem trung tuyen", "diem dau vao", "diem xet tuyen",
+            "bao nhieu diem", "lay diem"),
+}
+
+# Câu hỏi so sánh / giải thích → cần LLM
+SKIP_WORDS = ("so sanh", "chenh lech", "tai sao", "vi sao", "khac nhau", "du doan", "xu huong")
+
+_YEAR = re.compile(r"\b(20\d\d)\b")
+
+
+def fold(text: str) -> str:
+    """Bỏ dấu tiếng Việt + lowercase + chỉ giữ chữ/số: 'Điểm chuẩn' → 'diem chuan'."""
+    text = unicodedata.normalize("NFD", str(text)).replace("đ", "d").replace("Đ", "D")
+    text = "".join(c for c in text if unicodedata.category(c) != "Mn").lower()
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text).split())
+
+
+def expand_abbreviations(folded: str) -> str:
+    return " ".join(ABBREVIATIONS.get(w, w) for w in folded.split())
+
+
+@dataclass
+class TableAnswer:
+    answer: str
+    sources: List[str]
+    kind: str
+    rows: int
+
+
+class TableIndex:
+
+    MAX_ROWS = 4  # khớp nhiều hơn → câu hỏi chưa đủ cụ thể, để RAG xử lý
+
+    COLUMNS = ("kind", "majors", "code", "year", "campus", "program", "group",
+               "value", "unit", "note", "source")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.columns: Dict[str, list] = {c: [] for c in self.COLUMNS}
+        self._postings: Dict[str, Dict[str, Set[int]]] = {
+            "kind": {}, "major": {}, "year": {}, "campus": {},
+        }
+        self.aliases: Dict[str, str] = {}        # alias không dấu → tên ngành chuẩn (không dấu)
+        self.display_names: Dict[str, str] = {}  # tên chuẩn không dấu → tên hiển thị
+        self.tables: List[str] = []
+
+        self.lookups = 0
+        self.hits = 0
+        self.total_latency = 0.0
+
+    # ─── Build ───────────────────────────────────────────────
+    @classmethod
+    def from_directory(cls, data_dir) -> "TableIndex":
+        index = cls()
+        for path in sorted(Path(data_dir).iterdir()):
+            if path.suffix.lower() in {".csv", ".xlsx", ".xls"}:
+                try:
+                    index.add_file(str(path))
+                except Exception as e:
+                    print(f"  [WARN] Table index: skip {path.name}: {e}")
+        print(f"  [INFO] Table index: {len(index)} rows from {len(index.tables)} tables")
+        return index
+
+    def add_file(self, path: str, source: Optional[str] = None) -> int:
+        """Thêm bảng từ file CSV/Excel. Returns: số dòng điểm chuẩn / học phí đã index."""
+        from .parser import CSVParser, ExcelParser
+
+        source = source or Path(path).name
+        if Path(path).suffix.lower() == ".csv":
+            df = CSVParser().read_frame(path)
+            frames = [] if df is None else [("", df)]
+        else:
+            frames = ExcelParser().read_frames(path)
+
+        added = 0
+        for sheet, df in frames:
+            name = f"{source}#{sheet}" if sheet and len(frames) > 1 else source
+            added += self.add_frame(df, name)
+        return added
+
+    def add_frame(self, df, source: str) -> int:
+        cols = self._detect_columns(list(df.columns))
+        if "major" not in cols and "code" not in cols:
+            return 0
+
+        kind = TUITION if "tuition" in cols else SCORE if ("score" in cols or cols.get("year_columns")) else None
+        added = 0
+        with self._lock:
+            for i, row in enumerate(df.to_dict("records")):
+                majors = self._register_majors(row, cols)
+                if kind is None or not majors:
+                    continue  # bảng danh mục ngành: chỉ lấy alias (mã ↔ tên)
+
+                base = {
+                    "kind": kind,
+                    "majors": majors,
+                    "code": self._cell(row, cols.get("code")),
+                    "campus": self._campus(self._cell(row, cols.get("campus"))),
+                    "program": self._cell(row, cols.get("program")),
+                    "group": self._cell(row, cols.get("group")),
+                    "unit": self._cell(row, cols.get("unit")),
+                    "note": self._cell(row, cols.get("note")),
+                    "source": f"{source}, dòng {i + 2}",
+                }
+                if cols.get("year_columns"):
+                    # Bảng dạng rộng: mỗi cột năm là 1 giá trị
+                    for year, col in cols["year_columns"].items():
+                        value = self._cell(row, col)
+                        if value and value not in {"-", "0"}:
+                            self._append({**base, "year": year, "value": value})
+                            added += 1
+                else:
+                    value = self._cell(row, cols.get("tuition") or cols.get("score"))
+                    year = _YEAR.search(self._cell(row, cols.get("year")))
+                    if value:
+                        self._append({**base, "year": year.group(1) if year else "", "value": value})
+                        added += 1
+            if added:
+                self.tables.append(source)
+        return added
+
+    def _detect_columns(self, columns: List[str]) -> dict:
+        cols: dict = {"year_columns": {}}
+        for col in columns:
+            f = fold(col)
+            if re.fullmatch(r"(diem chuan |diem |nam )?20\d\d", f):
+                cols["year_columns"][f[-4:]] = col
+            elif "ma nganh" in f or f in {"ma", "code", "ma xet tuyen"}:
+                cols.setdefault("code", col)
+            elif "chi tiet nganh" in f or "ten nganh" in f or f in {"nganh", "major", "chuyen nganh"}:
+                cols["major"] = col if "chi tiet" in f else cols.get("major", col)
+            elif "nhom nganh" in f:
+                cols.setdefault("group", col)
+            elif "hoc phi" in f or "muc thu" in f or "tuition" in f:
+                cols.setdefault("tuition", col)
+            elif "diem" in f or "score" in f:
+                cols.setdefault("score", col)
+            elif f in {"nam", "year", "khoa", "nam tuyen sinh"}:
+                cols.setdefault("year", col)
+            elif "co so" in f or "campus" in f:
+                cols.setdefault("campus", col)
+            elif "he dao tao" in f or "chuong trinh" in f or "phuong thuc" in f:
+                cols.setdefault("program", col)
+            elif "don vi" in f:
+                cols.setdefault("unit", col)
+            elif "ghi chu" in f:
+                cols.setdefault("note", col)
+        return cols
+
+    def _register_majors(self, row: dict, cols: dict) -> List[str]:
+        """Tách ô ngành ('CNTT, An toàn thông tin, ...') → tên chuẩn, đăng ký alias."""
+        raw = self._cell(row, cols.get("major"))
+        code = fold(self._cell(row, cols.get("code")))
+        majors = []
+        for part in raw.split(","):
+            display = re.sub(r"\(.*?\)", "", part).strip()
+            canonical = expand_abbreviations(fold(display))
+            if not canonical or canonical in {"tat ca", "nan"}:
+                continue
+            if canonical.startswith("nganh "):
+                canonical = canonical[len("nganh "):]
+            self.display_names.setdefault(canonical, display)
+            self.aliases.setdefault(canonical, canonical)
+            majors.append(canonical)
+        if code and majors:
+            self.aliases.setdefault(code, majors[0])
+            self.aliases.setdefault(code.split()[0], majors[0])  # '7480201 clc' → '7480201'
+        for abbr, full in ABBREVIATIONS.items():
+            if full in majors:
+                self.aliases.setdefault(abbr, full)
+        return majors
+
+    def _append(self, record: dict) -> None:
+        idx = len(self.columns["kind"])
+        for col in self.COLUMNS:
+            self.columns[col].append(record[col])
+        self._postings["kind"].setdefault(record["kind"], set()).add(idx)
+        self._postings["year"].setdefault(record["year"], set()).add(idx)
+        self._postings["campus"].setdefault(record["campus"], set()).add(idx)
+        for major in record["majors"]:
+            self._postings["major"].setdefault(major, set()).add(idx)
+
+    @staticmethod
+    def _cell(row: dict, col: Optional[str]) -> str:
+        if col is None:
+            return ""
+        value = row.get(col, "")
+        if value is None or str(value).lower() == "nan":
+            return ""
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return unicodedata.normalize("NFC", str(value).strip())
+
+    @staticmethod
+    def _campus(text: str) -> str:
+        f = fold(text)
+        for campus, words in CAMPUSES.items():
+            if any(re.search(rf"\b{w}\b", f) for w in words):
+                return campus
+        return ""
+
+    def __len__(self) -> int:
+        return len(self.columns["kind"])
+
+    # ─── Lookup ──────────────────────────────────────────────
+    def lookup(self, query: str) -> Optional[TableAnswer]:
+        start = time.perf_counter()
+        with self._lock:
+            answer = self._match(query)
+            self.lookups += 1
+            self.hits += answer is not None
+            self.total_latency += time.perf_counter() - start
+        return answer
+
+    def _match(self, query: str) -> Optional[TableAnswer]:
+        if not len(self):
+            return None
+        q = expand_abbreviations(fold(query))
+        if any(w in q for w in SKIP_WORDS):
+            return None
+
+        kinds = [k for k, words in INTENT_WORDS.items() if any(w in q for w in words)]
+        if len(kinds) != 1 or kinds[0] not in self._postings["kind"]:
+            return None
+        kind = kinds[0]
+
+        # Ngành: alias khớp nguyên từ, chỉ xét ngành có dữ liệu loại này;
+        # bỏ alias nằm trong alias dài hơn cũng khớp ('dien tu' ⊂ 'dien tu vien thong')
+        with_data = self._postings["major"]
+        matched = [
+            a for a in self.aliases
+            if re.search(rf"\b{re.escape(a)}\b", q)
+            and with_data.get(self.aliases[a], set()) & self._postings["kind"][kind]
+        ]
+        matched = [a for a in matched if not any(a != b and a in b for b in matched)]
+        majors = {self.aliases[a] for a in matched}
+        if len(majors) != 1:
+            return None
+        major = majors.pop()
+
+        years = set(_YEAR.findall(q))
+        if len(years) > 1:
+            return None
+        campus = self._campus(q)
+
+        rows = self._postings["kind"][kind] & self._postings["major"].get(major, set())
+        if years:
+            rows &= self._postings["year"].get(years.pop(), set())
+        if campus:
+            # Dòng không ghi cơ sở áp dụng cho cả 2 cơ sở
+            rows &= self._postings["campus"].get(campus, set()) | self._postings["campus"].get("", set())
+        # Hệ đào tạo / phương thức được nhắc tới (vd "hệ CLC") → chỉ giữ các dòng đó
+        programs = {self.columns["program"][i] for i in rows}
+        wanted = {p for p in programs if self._program_key(p) and self._program_key(p) in q}
+        if wanted:
+            rows = {i for i in rows if self.columns["program"][i] in wanted}
+        elif any(w in q for w in ("chat luong cao", "dinh huong ung dung", "song bang")):
+            return None  # hỏi hệ cụ thể nhưng bảng không có dòng tương ứng
+        if not rows:
+            return None
+
+        if not _YEAR.search(q):
+            # Không hỏi năm → lấy năm mới nhất cho từng chương trình / cơ sở
+            latest: Dict[tuple, int] = {}
+            for i in rows:
+                key = (self.columns["program"][i], self.columns["campus"][i])
+                if key not in latest or self.columns["year"][i] > self.columns["year"][latest[key]]:
+                    latest[key] = i
+            rows = set(latest.values())
+
+        if len(rows) > self.MAX_ROWS:
+            return None
+        rows = sorted(rows, key=lambda i: (self.columns["program"][i], self.columns["year"][i]))
+        return self._render(kind, major, rows)
+
+    @staticmethod
+    def _program_key(program: str) -> str:
+        """'Hệ Chất lượng cao' → 'chat luong cao' (phần phân biệt của tên hệ)."""
+        return re.sub(r"^(he|chuong trinh|dao tao|phuong thuc)\s+", "", fold(program))
+
+    def _render(self, kind: str, major: str, rows: List[int]) -> TableAnswer:
+        c = self.columns
+        name = self.display_names.get(major, major)
+        lines = []
+        for i in rows:
+            parts = []
+            if c["program"][i]:
+                parts.append(c["program"][i])
+            if c["year"][i]:
+                parts.append(f"khóa {c['year'][i]}" if kind == TUITION else f"năm {c['year'][i]}")
+            if c["campus"][i]:
+                parts.append("cơ sở Hà Nội" if c["campus"][i] == "HN" else "cơ sở TP.HCM")
+            value = self._format_value(c["value"][i])
+            unit = f" {c['unit'][i]}" if c["unit"][i] else ""
+            note = f" ({c['note'][i]})" if c["note"][i] else ""
+            lines.append(f"- {', '.join(parts)}: **{value}{unit}**{note}")
+
+        title = "Học phí" if kind == TUITION else "Điểm chuẩn"
+        code = next((c["code"][i] for i in rows if c["code"][i]), "")
+        header = f"{title} ngành {name}" + (f" (mã {code})" if code else "") + ":"
+        sources = [f"{c['source'][i]}: {self._row_text(i)}" for i in rows]
+        answer = "\n".join([header, *lines, "", "Nguồn: " + "; ".join(dict.fromkeys(c["source"][i] for i in rows))])
+        return TableAnswer(answer=answer, sources=sources, kind=kind, rows=len(rows))
+
+    def _row_text(self, i: int) -> str:
+        c = self.columns
+        fields = [c["program"][i], c["group"][i], ", ".join(self.display_names.get(m, m) for m in c["majors"][i]),
+                  c["year"][i], c["campus"][i], f"{c['value'][i]} {c['unit'][i]}".strip(), c["note"][i]]
+        return " | ".join(f for f in fields if f)
+
+    @staticmethod
+    def _format_value(value: str) -> str:
+        """1010000 → 1.010.000 (giữ nguyên điểm số thập phân như 26.5)."""
+        return f"{int(value):,}".replace(",", ".") if value.isdigit() and len(value) > 4 else value
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rows": len(self),
+                "tables": list(self.tables),
+                "aliases": len(self.aliases),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                "avg_latency_ms": round(1000 * self.total_latency / self.lookups, 3) if self.lookups else 0.0,
+            }
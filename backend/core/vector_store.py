@@ -7,19 +7,27 @@ Kiến thức AI cần nắm:
 - IP = Inner Product, với normalized vectors → = cosine similarity
 - search() trả về top-k vectors gần nhất trong O(log N) trung bình
 """
+import hashlib
 import json
 import pickle
+import time
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import faiss
 import numpy as np
 
 
+def chunk_id(text: str) -> str:
+    """ID ổn định của 1 chunk = hash nội dung (không đổi khi rebuild index)."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
 class VectorStore:
 
     INDEX_PATH = Path(__file__).parent.parent / "data" / "processed" / "faiss.index"
     CHUNKS_PATH = Path(__file__).parent.parent / "data" / "processed" / "chunks.pkl"
+    VERSION_PATH = Path(__file__).parent.parent / "data" / "processed" / "index_version.txt"
 
     def __init__(self, dim: int = 768):
         self.dim = dim
@@ -27,12 +35,17 @@ class VectorStore:
         # Dùng IndexIVFFlat nếu corpus > 100k docs (nhanh hơn, gần đúng)
         self.index = faiss.IndexFlatIP(dim)
         self.chunks: List[str] = []
+        # Đổi mỗi khi nội dung index thay đổi → cache phía trên tự invalidate
+        self.version = "empty"
+        self._positions: Optional[Dict[str, int]] = None  # chunk_id → vị trí, dựng lười
 
     def add(self, embeddings: np.ndarray, chunks: List[str]) -> None:
         """Thêm embeddings và chunks tương ứng vào index."""
         assert len(embeddings) == len(chunks), "embeddings và chunks phải cùng số lượng"
         self.index.add(embeddings.astype("float32"))
         self.chunks.extend(chunks)
+        self.version = f"{int(time.time())}-{self.index.ntotal}"
+        self._positions = None
         print(f"  Added {len(chunks)} chunks. Total: {self.index.ntotal}")
 
     def search(self, query_embedding: np.ndarray, k: int = 5) -> List[Tuple[str, float]]:
@@ -60,6 +73,7 @@ class VectorStore:
         faiss.write_index(self.index, str(self.INDEX_PATH))
         with open(self.CHUNKS_PATH, "wb") as f:
             pickle.dump(self.chunks, f)
+        self.VERSION_PATH.write_text(self.version, encoding="utf-8")
         print(f"  VectorStore saved. ({self.index.ntotal} vectors)")
 
     def load(self) -> None:
@@ -67,8 +81,23 @@ class VectorStore:
         self.index = faiss.read_index(str(self.INDEX_PATH))
         with open(self.CHUNKS_PATH, "rb") as f:
             self.chunks = pickle.load(f)
+        self._positions = None
+        if self.VERSION_PATH.exists():
+            self.version = self.VERSION_PATH.read_text(encoding="utf-8").strip()
+        else:
+            # Index build trước khi có version file → dùng mtime
+            self.version = f"{int(self.INDEX_PATH.stat().st_mtime)}-{self.index.ntotal}"
         print(f"  VectorStore loaded. ({self.index.ntotal} vectors)")
 
+    def get_chunks(self, ids: List[str]) -> Dict[str, Optional[str]]:
+        """chunk_id → nội dung (None nếu chunk không còn trong index hiện tại)."""
+        if self._positions is None:
+            self._positions = {chunk_id(c): i for i, c in enumerate(self.chunks)}
+        return {
+            cid: self.chunks[self._positions[cid]] if cid in self._positions else None
+            for cid in ids
+        }
+
     @property
     def is_empty(self) -> bool:
         return self.index.ntotal == 0
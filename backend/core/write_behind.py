@@ -0,0 +1,229 @@
+"""
+Write-behind persistence — gom ghi message / conversation thành group commit.
+
+Trước đây mỗi lượt chat = 2-3 lần commit riêng (create_conversation,
+save_message user, save_message assistant) → mỗi lần 1 fsync, các writer
+xếp hàng sau nhau. Writer nền:
+- Request chỉ đẩy row vào queue (id + created_at gán ngay lúc enqueue → thứ tự giữ nguyên)
+- 1 task nền gom mọi row tới trong flush_interval (tối đa max_batch) rồi ghi
+  trong 1 transaction → 1 fsync cho cả batch
+- Durability: "flush" = chờ batch chứa row được commit rồi mới trả lời;
+  "async" = fire-and-forget (nhanh nhất, mất tối đa 1 batch nếu process chết)
+- Queue FIFO: commit của 1 row đảm bảo mọi row enqueue trước nó đã được commit
+- Shutdown: drain() ghi hết queue trước khi đóng DB
+- Write-through SessionCache ngay lúc enqueue (lượt sau đọc được, kể cả khi chưa commit)
+"""
+import asyncio
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .database import Conversation, Message, SessionLocal, encode_sources, writing
+from .session_cache import SessionCache
+
+DURABILITY_FLUSH = "flush"
+DURABILITY_ASYNC = "async"
+
+
+class MessageWriter:
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        durability: str = DURABILITY_FLUSH,
+        flush_interval: float = 0.01,
+        max_batch: int = 256,
+        max_queue: int = 10000,
+        sessions: Optional[SessionCache] = None,
+    ):
+        if durability not in (DURABILITY_FLUSH, DURABILITY_ASYNC):
+            raise ValueError(f"Unknown durability '{durability}' (flush | async)")
+        self.session_factory = session_factory
+        self.durability = durability
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.sessions = sessions
+        self._pending: Dict[str, int] = {}  # conversation_id → số row chưa commit
+
+        self.enqueued = 0
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self.max_batch_seen = 0
+        self._batch_sizes: deque = deque(maxlen=1000)
+        self._commit_ms: deque = deque(maxlen=1000)
+
+    # ─── Lifecycle ───────────────────────────────────────────
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="db-writer")
+
+    async def drain(self) -> None:
+        """Ngừng nhận row mới, commit hết phần còn trong queue rồi dừng task."""
+        if self._task is None or self._closing:
+            return
+        self._closing = True
+        await self._queue.put(None)
+        await self._task
+        print(f"  [INFO] DB writer drained ({self.written} rows, {self.batches} batches)")
+
+    # ─── API cho routes ──────────────────────────────────────
+    async def create_conversation(self, title: str = "Cuộc hội thoại mới", durable: Optional[bool] = None) -> Conversation:
+        conv = Conversation(id=str(uuid.uuid4()), title=title, created_at=datetime.utcnow(), summary="", summary_upto=0)
+        committed = await self._submit(conv)
+        if self.sessions is not None:
+            self.sessions.create(conv.id)
+        await self._wait(committed, durable)
+        return conv
+
+    async def save_message(
+        self,
+        conversation_id: str,
+        role: str,
+        content: str,
+        sources: List[str] = None,
+        durable: Optional[bool] = None,
+        source_ids: List[str] = None,
+        index_version: str = "",
+    ) -> asyncio.Future:
+        """
+        Returns: future hoàn thành khi row đã được commit (đã xong nếu durable) —
+        dùng để chờ trước khi đọc lại (vd cập nhật summary hội thoại).
+        """
+        msg = Message(
+            id=str(uuid.uuid4()),
+            conversation_id=conversation_id,
+            role=role,
+            content=content,
+            sources=encode_sources(sources),
+            source_ids=",".join(source_ids or []),
+            index_version=index_version,
+            created_at=datetime.utcnow(),
+        )
+        committed = await self._submit(msg)
+        if self.sessions is not None:
+            self.sessions.append(conversation_id, role, content)
+        await self._wait(committed, durable)
+        return committed
+
+    async def _submit(self, row) -> asyncio.Future:
+        if self._closing or self._task is None:
+            raise RuntimeError("DB writer is not running")
+        committed = asyncio.get_running_loop().create_future()
+        await self._queue.put((row, committed))  # queue đầy → backpressure
+        self.enqueued += 1
+        cid = self._conversation_id(row)
+        self._pending[cid] = self._pending.get(cid, 0) + 1
+        return committed
+
+    @staticmethod
+    def _conversation_id(row) -> str:
+        return row.conversation_id if isinstance(row, Message) else row.id
+
+    def has_pending(self, conversation_id: str) -> bool:
+        return conversation_id in self._pending
+
+    def _settle(self, row) -> None:
+        cid = self._conversation_id(row)
+        left = self._pending.get(cid, 1) - 1
+        if left > 0:
+            self._pending[cid] = left
+        else:
+            self._pending.pop(cid, None)
+
+    async def _wait(self, committed: asyncio.Future, durable: Optional[bool]) -> None:
+        if durable is None:
+            durable = self.durability == DURABILITY_FLUSH
+        if durable:
+            # shield: client ngắt kết nối không huỷ future dùng chung của batch
+            await asyncio.shield(committed)
+
+    # ─── Background loop ─────────────────────────────────────
+    async def _run(self) -> None:
+        stop = False
+        while not stop:
+            item = await self._queue.get()
+            if item is None:
+                break
+            # Gom thêm các row tới trong cửa sổ flush_interval
+            if self.flush_interval > 0 and self._queue.qsize() < self.max_batch:
+                await asyncio.sleep(self.flush_interval)
+            batch = [item]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            await self._commit(batch)
+
+    async def _commit(self, batch) -> None:
+        start = time.perf_counter()
+        try:
+            async with self.session_factory() as db:
+                async with writing(db):
+                    db.add_all(row for row, _ in batch)
+        except Exception as e:
+            print(f"  [WARN] DB writer: batch of {len(batch)} failed ({e}), retrying row by row")
+            await self._commit_each(batch)
+            return
+
+        self.batches += 1
+        self.written += len(batch)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        self._batch_sizes.append(len(batch))
+        self._commit_ms.append((time.perf_counter() - start) * 1000)
+        for row, committed in batch:
+            self._settle(row)
+            if not committed.done():
+                committed.set_result(None)
+
+    async def _commit_each(self, batch) -> None:
+        """Batch lỗi → ghi từng row, để 1 row hỏng không làm mất cả batch."""
+        for row, committed in batch:
+            try:
+                async with self.session_factory() as db:
+                    async with writing(db):
+                        db.add(row)
+                self.written += 1
+                if not committed.done():
+                    committed.set_result(None)
+            except Exception as e:
+                self.failed += 1
+                if self.sessions is not None:
+                    self.sessions.invalidate(self._conversation_id(row))  # cache có row không có trong DB
+                print(f"  [WARN] DB writer: dropped {type(row).__name__} {row.id}: {e}")
+                if not committed.done():
+                    committed.set_exception(e)
+                    committed.exception()  # fire-and-forget: không ai await → tránh log "never retrieved"
+            finally:
+                self._settle(row)
+
+    def stats(self) -> dict:
+        sizes = np.array(self._batch_sizes) if self._batch_sizes else None
+        commits = np.array(self._commit_ms) if self._commit_ms else None
+        return {
+            "durability": self.durability,
+            "queued": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+            "batch_size": {
+                "avg": round(float(sizes.mean()), 2) if sizes is not None else 0.0,
+                "p95": int(np.percentile(sizes, 95)) if sizes is not None else 0,
+                "max": self.max_batch_seen,
+            },
+            "commit_ms": {
+                "p50": round(float(np.percentile(commits, 50)), 2) if commits is not None else 0.0,
+                "p95": round(float(np.percentile(commits, 95)), 2) if commits is not None else 0.0,
+                "p99": round(float(np.percentile(commits, 99)), 2) if commits is not None else 0.0,
+            },
+        }
@@ -0,0 +1 @@
+# dev tools package
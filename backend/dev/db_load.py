@@ -0,0 +1,188 @@
+"""
+DB load test — throughput chat khi disk chậm: session đồng bộ (cũ) vs async (aiosqlite)
+vs write-behind (group commit, durability flush / async).
+
+Mỗi "lượt chat" giả lập đúng phần persistence của /api/chat/stream:
+    get_session_window → save user → stream token (LLM giả, asyncio.sleep) → save assistant
+Disk chậm được giả lập bằng độ trễ mỗi lần commit (--fsync-ms), chạy trên thread
+thực hiện I/O: mode sync → chặn event loop; mode async → chặn thread của aiosqlite.
+
+Đo: turns/s, latency mỗi lượt, khoảng cách giữa 2 token (stream có bị khựng
+khi loop bị chặn không) và độ trễ event loop.
+
+Chạy:
+    python -m backend.dev.db_load --turns 300 --concurrency 50 --fsync-ms 30
+    python -m backend.dev.db_load --modes async,writer,writer_async
+"""
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.core.database import Base, Conversation, Message, get_session_window, save_message
+from backend.core.write_behind import DURABILITY_ASYNC, DURABILITY_FLUSH, MessageWriter
+from backend.dev.stream_load import loop_lag_monitor, percentile
+
+
+def slow_commits(sync_engine, delay: float) -> None:
+    @event.listens_for(sync_engine, "commit")
+    def _fsync(conn):
+        time.sleep(delay)
+
+
+# ─── Sync (legacy): Session đồng bộ gọi thẳng trong async route ─────
+def sync_prompt_history(db, conv_id, limit=6):
+    upto = db.scalar(select(Conversation.summary_upto).where(Conversation.id == conv_id)) or 0
+    total = db.scalar(select(func.count()).select_from(Message).where(Message.conversation_id == conv_id))
+    return db.execute(
+        select(Message.role, Message.content)
+        .where(Message.conversation_id == conv_id)
+        .order_by(Message.created_at.desc())
+        .limit(max(min(limit, total - upto), 0))
+    ).all()
+
+
+def sync_save(db, conv_id, role, content):
+    db.add(Message(id=str(uuid.uuid4()), conversation_id=conv_id, role=role, content=content, sources="[]"))
+    db.commit()
+
+
+async def fake_stream(tokens: int, gap: float, gaps: list):
+    last = time.perf_counter()
+    for _ in range(tokens):
+        await asyncio.sleep(gap)
+        now = time.perf_counter()
+        gaps.append(now - last)
+        last = now
+        yield "x"
+
+
+async def run_mode(mode: str, path: Path, conv_ids, args) -> dict:
+    if mode == "sync":
+        engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+        slow_commits(engine, args.fsync_ms / 1000)
+        Session = sessionmaker(bind=engine)
+    else:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        slow_commits(engine.sync_engine, args.fsync_ms / 1000)
+        Session = async_sessionmaker(engine, expire_on_commit=False)
+    writer = None
+    if mode.startswith("writer"):
+        writer = MessageWriter(
+            Session,
+            durability=DURABILITY_ASYNC if mode == "writer_async" else DURABILITY_FLUSH,
+            flush_interval=args.flush_ms / 1000,
+        )
+        writer.start()
+
+    sem = asyncio.Semaphore(args.concurrency)
+    latencies, gaps, lags, errors = [], [], [], 0
+    stop = asyncio.Event()
+
+    async def turn(i: int):
+        nonlocal errors
+        conv_id = conv_ids[i % len(conv_ids)]
+        async with sem:
+            start = time.perf_counter()
+            try:
+                if mode == "sync":
+                    with Session() as db:
+                        sync_prompt_history(db, conv_id)
+                        sync_save(db, conv_id, "user", f"câu hỏi {i}")
+                    answer = "".join([t async for t in fake_stream(args.tokens, args.token_gap, gaps)])
+                    with Session() as db:
+                        sync_save(db, conv_id, "assistant", answer)
+                elif writer is not None:
+                    async with Session() as db:
+                        await get_session_window(db, conv_id, window=6)
+                    await writer.save_message(conv_id, "user", f"câu hỏi {i}")
+                    answer = "".join([t async for t in fake_stream(args.tokens, args.token_gap, gaps)])
+                    await writer.save_message(conv_id, "assistant", answer)
+                else:
+                    async with Session() as db:
+                        await get_session_window(db, conv_id, window=6)
+                        await save_message(db, conv_id, "user", f"câu hỏi {i}")
+                    answer = "".join([t async for t in fake_stream(args.tokens, args.token_gap, gaps)])
+                    async with Session() as db:
+                        await save_message(db, conv_id, "assistant", answer)
+            except Exception as e:
+                errors += 1
+                print(f"  [WARN] turn {i}: {e}")
+            latencies.append(time.perf_counter() - start)
+
+    monitor = asyncio.create_task(loop_lag_monitor(lags, stop))
+    t0 = time.perf_counter()
+    await asyncio.gather(*(turn(i) for i in range(args.turns)))
+    elapsed = time.perf_counter() - t0
+    if writer is not None:
+        await writer.drain()
+        elapsed_drained = time.perf_counter() - t0
+    stop.set()
+    await monitor
+    if mode == "sync":
+        engine.dispose()
+    else:
+        await engine.dispose()
+
+    ms = lambda values, p: round(percentile(values, p) * 1000, 1)
+    report = {
+        "mode": mode,
+        "turns": args.turns,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 2),
+        "turns_per_s": round(args.turns / elapsed, 2),
+        "turn_ms": {"p50": ms(latencies, 50), "p95": ms(latencies, 95), "p99": ms(latencies, 99)},
+        "token_gap_ms": {"p50": ms(gaps, 50), "p99": ms(gaps, 99), "max": ms(gaps, 100)},
+        "loop_lag_ms": {"p99": ms(lags, 99), "max": ms(lags, 100)},
+    }
+    if writer is not None:
+        report["drained_s"] = round(elapsed_drained, 2)
+        report["writer"] = writer.stats()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync vs async conversation store under slow disk")
+    parser.add_argument("--turns", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--conversations", type=int, default=100)
+    parser.add_argument("--fsync-ms", type=float, default=30.0, help="Độ trễ giả lập mỗi commit")
+    parser.add_argument("--tokens", type=int, default=40)
+    parser.add_argument("--token-gap", type=float, default=0.02)
+    parser.add_argument("--flush-ms", type=float, default=10.0)
+    parser.add_argument("--modes", default="sync,async,writer,writer_async")
+    args = parser.parse_args()
+
+    reports = []
+    for mode in args.modes.split(","):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "load.db"
+            engine = create_engine(f"sqlite:///{path}")
+            Base.metadata.create_all(engine)
+            conv_ids = [str(uuid.uuid4()) for _ in range(args.conversations)]
+            with sessionmaker(bind=engine)() as db:
+                db.add_all(Conversation(id=cid, title="load") for cid in conv_ids)
+                db.commit()
+            engine.dispose()
+            reports.append(asyncio.run(run_mode(mode, path, conv_ids, args)))
+
+    for r in reports:
+        print(f"{r['mode']:12} {r['turns_per_s']:>7} turns/s  errors={r['errors']:<3} "
+              f"turn p95={r['turn_ms']['p95']:>8}ms  token gap p99={r['token_gap_ms']['p99']:>7}ms  "
+              f"loop lag max={r['loop_lag_ms']['max']:>7}ms")
+    print(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
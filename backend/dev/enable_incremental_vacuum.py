@@ -0,0 +1,90 @@
+"""
+Chuyển DB cũ sang auto_vacuum=INCREMENTAL — bước offline, chạy 1 lần khi server đã dừng.
+
+DB tạo trước khi bật storage profile có auto_vacuum=NONE: job archive xoá tin nhắn
+nhưng không trả được trang trống cho OS. Đổi chế độ cần VACUUM toàn bộ (ghi lại
+cả file, giữ khoá ghi suốt thời gian đó) và VACUUM có thể đánh lại rowid của
+messages → dựng lại index FTS. Không làm trong job archive để lượt chat không bị
+chặn; sau khi chuyển, job chỉ chạy PRAGMA incremental_vacuum từng bước nhỏ.
+
+Chạy:
+    python -m backend.dev.enable_incremental_vacuum --db ./chatbot.db
+"""
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import create_engine
+
+from backend.core.message_search import FTS_TABLE, rebuild_search_index
+from backend.dev.migrate_sources import db_size
+
+MODES = {0: "NONE", 1: "FULL", 2: "INCREMENTAL"}
+
+
+def auto_vacuum_mode(path: Path) -> int:
+    conn = sqlite3.connect(path)
+    mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    conn.close()
+    return mode
+
+
+def enable_incremental(path: Path) -> dict:
+    """auto_vacuum=INCREMENTAL + VACUUM, rồi dựng lại index FTS (nếu có)."""
+    start = time.perf_counter()
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("VACUUM")
+    has_fts = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+    ).fetchone() is not None
+    conn.close()
+    vacuum_s = time.perf_counter() - start
+
+    if has_fts:
+        engine = create_engine(f"sqlite:///{path}")
+        with engine.begin() as c:
+            rebuild_search_index(c)
+        engine.dispose()
+    return {
+        "vacuum_s": round(vacuum_s, 2),
+        "fts_rebuild_s": round(time.perf_counter() - start - vacuum_s, 2) if has_fts else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the database to auto_vacuum=INCREMENTAL (server stopped)")
+    parser.add_argument("--db", default="./chatbot.db")
+    args = parser.parse_args()
+
+    path = Path(args.db)
+    if not path.exists():
+        sys.exit(f"[ERROR] {path} not found")
+    mode = auto_vacuum_mode(path)
+    if mode == 2:
+        print(f"[INFO] {path} already uses auto_vacuum=INCREMENTAL, nothing to do")
+        return
+
+    before = db_size(path)
+    print(f"[INFO] Converting {path} (auto_vacuum={MODES.get(mode, mode)}, {before / 1e6:.1f} MB)...")
+    timings = enable_incremental(path)
+    after = db_size(path)
+    report = {
+        "auto_vacuum": MODES[auto_vacuum_mode(path)],
+        "db_bytes_before": before,
+        "db_bytes_after": after,
+        **timings,
+    }
+    print(f"DB size: {before / 1e6:.1f} MB → {after / 1e6:.1f} MB")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Fake LLM server — giả lập Ollama + Gemini REST API để test/benchmark
+không cần GPU hay API key.
+
+Trả về câu trả lời cố định, tách thành từng token với độ trễ cấu hình được:
+  --ttft         thời gian chờ trước token đầu tiên (giây)
+  --token-delay  khoảng cách giữa các token (giây)
+  --fail-rate    tỉ lệ request trả lỗi 500 (test retry / failover)
+  --slow-rate    tỉ lệ request bị chậm (giả lập tail latency, test hedging)
+  --slow-ttft    thời gian chờ token đầu tiên của request chậm (giây)
+
+Chạy:
+    python -m backend.dev.fake_llm --port 11435
+    OLLAMA_BASE_URL=http://127.0.0.1:11435 uvicorn backend.main:app
+    GEMINI_API_ENDPOINT=http://127.0.0.1:11435 GEMINI_TRANSPORT=rest uvicorn backend.main:app
+"""
+import argparse
+import asyncio
+import json
+import random
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+ANSWER = (
+    "Theo thông tin tuyển sinh, ngành Công nghệ thông tin (mã ngành 7480201) "
+    "tại cơ sở Hà Nội có chỉ tiêu 500 sinh viên, xét tuyển các tổ hợp A00, A01, D01. "
+    "Bạn có thể liên hệ hotline 024.3756.2186 để được tư vấn thêm."
+)
+
+
+class FakeLLMConfig:
+    ttft: float = 0.2
+    token_delay: float = 0.02
+    fail_rate: float = 0.0
+    slow_rate: float = 0.0
+    slow_ttft: float = 3.0
+    answer: str = ANSWER
+
+
+config = FakeLLMConfig()
+app = FastAPI(title="Fake LLM")
+
+
+def _tokens(text: str):
+    words = text.split(" ")
+    return [w + (" " if i < len(words) - 1 else "") for i, w in enumerate(words)]
+
+
+def _should_fail() -> bool:
+    return config.fail_rate > 0 and random.random() < config.fail_rate
+
+
+def _ttft() -> float:
+    if config.slow_rate > 0 and random.random() < config.slow_rate:
+        return config.slow_ttft
+    return config.ttft
+
+
+# ─── Ollama API ──────────────────────────────────────────────
+@app.get("/api/tags")
+def ollama_tags():
+    return {"models": [{"name": "fake:latest"}]}
+
+
+@app.post("/api/generate")
+async def ollama_generate(request: Request):
+    body = await request.json()
+    model = body.get("model", "fake")
+    if _should_fail():
+        return JSONResponse(status_code=500, content={"error": "fake failure"})
+
+    if not body.get("stream", True):
+        await asyncio.sleep(_ttft() + config.token_delay * len(_tokens(config.answer)))
+        return {"model": model, "response": config.answer, "done": True}
+
+    async def ndjson():
+        await asyncio.sleep(_ttft())
+        for i, tok in enumerate(_tokens(config.answer)):
+            if i:
+                await asyncio.sleep(config.token_delay)
+            yield json.dumps({"model": model, "response": tok, "done": False}, ensure_ascii=False) + "\n"
+        yield json.dumps({"model": model, "response": "", "done": True}) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+# ─── Gemini REST API (v1beta) ────────────────────────────────
+def _gemini_chunk(text: str, finish: bool = False) -> dict:
+    candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+    if finish:
+        candidate["finishReason"] = "STOP"
+    return {"candidates": [candidate]}
+
+
+@app.post("/v1beta/models/{model}:generateContent")
+async def gemini_generate(model: str):
+    if _should_fail():
+        return JSONResponse(status_code=500, content={"error": {"code": 500, "message": "fake failure"}})
+    await asyncio.sleep(_ttft() + config.token_delay * len(_tokens(config.answer)))
+    return _gemini_chunk(config.answer, finish=True)
+
+
+@app.post("/v1beta/models/{model}:streamGenerateContent")
+async def gemini_stream(model: str):
+    """SDK (transport=rest) đọc response dạng JSON array stream: [{..}, {..}]"""
+    if _should_fail():
+        return JSONResponse(status_code=500, content={"error": {"code": 500, "message": "fake failure"}})
+
+    async def json_array():
+        await asyncio.sleep(_ttft())
+        tokens = _tokens(config.answer)
+        yield "["
+        for i, tok in enumerate(tokens):
+            if i:
+                await asyncio.sleep(config.token_delay)
+                yield ","
+            yield json.dumps(_gemini_chunk(tok, finish=i == len(tokens) - 1), ensure_ascii=False)
+        yield "]"
+
+    return StreamingResponse(json_array(), media_type="application/json")
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake LLM server (Ollama + Gemini API)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--ttft", type=float, default=config.ttft)
+    parser.add_argument("--token-delay", type=float, default=config.token_delay)
+    parser.add_argument("--fail-rate", type=float, default=config.fail_rate)
+    parser.add_argument("--slow-rate", type=float, default=config.slow_rate)
+    parser.add_argument("--slow-ttft", type=float, default=config.slow_ttft)
+    args = parser.parse_args()
+
+    config.ttft = args.ttft
+    config.token_delay = args.token_delay
+    config.fail_rate = args.fail_rate
+    config.slow_rate = args.slow_rate
+    config.slow_ttft = args.slow_ttft
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Hedge benchmark — so sánh TTFT khi chỉ dùng 1 provider vs LLMRouter (hedge + failover)
+trên 2 fake LLM server chạy local.
+
+Chạy:
+    # primary: 10% request chậm 3s, 5% lỗi 500
+    python -m backend.dev.fake_llm --port 11435 --slow-rate 0.1 --slow-ttft 3 --fail-rate 0.05 &
+    # fallback: ổn định nhưng chậm hơn primary một chút
+    python -m backend.dev.fake_llm --port 11436 --ttft 0.35 &
+    python -m backend.dev.hedge_bench --primary http://127.0.0.1:11435 --fallback http://127.0.0.1:11436 -n 200
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT))
+
+from backend.core.llm_providers import OllamaProvider
+from backend.core.llm_router import LLMRouter, LLMTarget
+from backend.dev.stream_load import percentile
+
+
+async def one_request(router: LLMRouter, targets, prompt: str) -> dict:
+    start = time.perf_counter()
+    ttft = None
+    try:
+        async for _ in router.stream(prompt, targets):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+    except Exception:
+        return {"ok": False, "ttft": None, "total": time.perf_counter() - start}
+    return {"ok": True, "ttft": ttft or 0.0, "total": time.perf_counter() - start}
+
+
+async def run_mode(name: str, router: LLMRouter, targets, args) -> dict:
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async def guarded():
+        async with sem:
+            return await one_request(router, targets, "Học phí ngành CNTT?")
+
+    results = await asyncio.gather(*[guarded() for _ in range(args.n)])
+    ttfts = [r["ttft"] for r in results if r["ok"]]
+    ms = lambda v: round(1000 * v, 1)
+    return {
+        "mode": name,
+        "requests": args.n,
+        "errors": sum(not r["ok"] for r in results),
+        "ttft_ms": {"p50": ms(percentile(ttfts, 50)), "p95": ms(percentile(ttfts, 95)),
+                    "p99": ms(percentile(ttfts, 99)), "max": ms(max(ttfts) if ttfts else 0)},
+        "router": router.stats(),
+    }
+
+
+async def run(args) -> list:
+    primary = OllamaProvider(args.primary, max_connections=args.concurrency * 2, max_retries=0)
+    fallback = OllamaProvider(args.fallback, max_connections=args.concurrency * 2, max_retries=0)
+    targets = [
+        LLMTarget("primary", lambda p: primary.stream(p, args.model)),
+        LLMTarget("fallback", lambda p: fallback.stream(p, args.model)),
+    ]
+    try:
+        reports = [
+            await run_mode("primary_only", LLMRouter(hedging=False), targets[:1], args),
+            await run_mode("failover", LLMRouter(hedging=False), targets, args),
+        ]
+        router = LLMRouter(hedging=True, min_samples=args.warmup, default_delay_ms=args.default_delay_ms)
+        # Warmup: thu thập histogram TTFT để tính hedge delay
+        await run_mode("warmup", router, targets, argparse.Namespace(n=args.warmup, concurrency=args.concurrency))
+        reports.append(await run_mode("hedged", router, targets, args))
+    finally:
+        await primary.aclose()
+        await fallback.aclose()
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hedged LLM request benchmark")
+    parser.add_argument("--primary", default="http://127.0.0.1:11435")
+    parser.add_argument("--fallback", default="http://127.0.0.1:11436")
+    parser.add_argument("--model", default="fake")
+    parser.add_argument("-n", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--default-delay-ms", type=float, default=1500.0)
+    args = parser.parse_args()
+
+    reports = asyncio.run(run(args))
+    for r in reports:
+        t = r["ttft_ms"]
+        print(f"{r['mode']:14} errors={r['errors']:<4} ttft p50={t['p50']:>7} p95={t['p95']:>7} "
+              f"p99={t['p99']:>7} max={t['max']:>7}")
+    print(json.dumps(reports[-1]["router"], ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
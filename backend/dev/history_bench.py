@@ -0,0 +1,157 @@
+"""
+History benchmark — độ trễ đọc history mỗi lượt chat trên DB hàng triệu tin nhắn.
+
+Sinh DB SQLite riêng (không đụng chatbot.db): N tin nhắn rải đều trên M hội thoại,
+xen kẽ theo thời gian như traffic thật. Đo p50/p95/p99 cho:
+- prompt_history: summary + tin chưa tóm tắt (đường nóng mỗi lượt chat)
+- page_latest:    trang đầu /conversations/{id}/messages
+- page_older:     trang kế tiếp theo cursor (keyset)
+- legacy_asc50:   truy vấn cũ (ORDER BY created_at ASC LIMIT 50)
+với index (conversation_id, created_at) và — nếu --compare — sau khi DROP index.
+
+Chạy:
+    python -m backend.dev.history_bench --messages 2000000 --conversations 100000 --compare
+"""
+import argparse
+import asyncio
+import json
+import random
+import sqlite3
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from backend.core.database import Base, Message, get_messages_page, get_session_window
+from backend.dev.stream_load import percentile
+
+INDEX = "ix_messages_conversation_created"
+
+
+def populate(path: Path, n_messages: int, n_conversations: int, batch: int = 100_000, content=None) -> None:
+    """content(i, role, rng) → nội dung tin nhắn thứ i (mặc định: 2 câu cố định)."""
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    start = datetime(2024, 1, 1)
+    conv_ids = [str(uuid.uuid4()) for _ in range(n_conversations)]
+    conn.executemany(
+        "INSERT INTO conversations (id, created_at, title, summary, summary_upto) VALUES (?, ?, ?, '', 0)",
+        ((cid, start.isoformat(" "), "bench") for cid in conv_ids),
+    )
+    rng = random.Random(0)
+    answer = "Điểm chuẩn ngành Công nghệ thông tin cơ sở Hà Nội năm 2024 là 26.4 điểm. " * 4
+    t0 = time.perf_counter()
+    for offset in range(0, n_messages, batch):
+        rows = []
+        for i in range(offset, min(offset + batch, n_messages)):
+            ts = (start + timedelta(milliseconds=i * 50)).isoformat(" ", "microseconds")
+            role = "user" if i % 2 == 0 else "assistant"
+            if content is not None:
+                text_ = content(i, role, rng)
+            else:
+                text_ = "Cho mình hỏi điểm chuẩn CNTT?" if role == "user" else answer
+            rows.append((str(uuid.uuid4()), rng.choice(conv_ids), role, text_, "[]", ts))
+        conn.executemany(
+            "INSERT INTO messages (id, conversation_id, role, content, sources, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.commit()
+        print(f"  inserted {min(offset + batch, n_messages):,}/{n_messages:,} ({time.perf_counter() - t0:.1f}s)")
+    conn.close()
+
+
+async def timed(fn, samples):
+    latencies = []
+    for arg in samples:
+        t = time.perf_counter()
+        await fn(arg)
+        latencies.append((time.perf_counter() - t) * 1000)
+    return {p: round(percentile(latencies, int(p[1:])), 3) for p in ("p50", "p95", "p99")}
+
+
+async def run(path: Path, conv_ids, label: str) -> dict:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    Session = async_sessionmaker(engine)
+    report = {"mode": label}
+    async with Session() as db:
+        cursors = {}
+
+        async def prompt_history(cid):
+            await get_session_window(db, cid, window=6)
+
+        async def page_latest(cid):
+            cursors[cid] = (await get_messages_page(db, cid, limit=10))[1]
+
+        async def page_older(cid):
+            if cursors.get(cid):
+                await get_messages_page(db, cid, limit=10, before=cursors[cid])
+
+        async def legacy_asc50(cid):
+            (await db.scalars(
+                select(Message).where(Message.conversation_id == cid).order_by(Message.created_at).limit(50)
+            )).all()
+
+        for name, fn in [("prompt_history", prompt_history), ("page_latest", page_latest),
+                         ("page_older", page_older), ("legacy_asc50", legacy_asc50)]:
+            report[name] = await timed(fn, conv_ids)
+    await engine.dispose()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversation history latency benchmark")
+    parser.add_argument("--db", default="/tmp/history_bench.db")
+    parser.add_argument("--messages", type=int, default=2_000_000)
+    parser.add_argument("--conversations", type=int, default=100_000)
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--rebuild", action="store_true", help="Xoá và sinh lại DB")
+    parser.add_argument("--compare", action="store_true", help="Đo thêm khi không có index")
+    args = parser.parse_args()
+
+    path = Path(args.db)
+    if args.rebuild and path.exists():
+        path.unlink()
+    if not path.exists():
+        populate(path, args.messages, args.conversations)
+
+    conn = sqlite3.connect(path)
+    total = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    conv_ids = [r[0] for r in conn.execute(
+        "SELECT id FROM conversations ORDER BY random() LIMIT ?", (args.samples,)
+    )]
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {INDEX} ON messages (conversation_id, created_at)")
+    conn.commit()
+    print(f"DB: {path} — {total:,} messages, {len(conv_ids)} sampled conversations")
+
+    reports = [asyncio.run(run(path, conv_ids, "indexed"))]
+    if args.compare:
+        conn.execute(f"DROP INDEX {INDEX}")
+        conn.commit()
+        # Full scan mỗi truy vấn → ít mẫu hơn cho nhanh
+        reports.append(asyncio.run(run(path, conv_ids[:max(10, len(conv_ids) // 20)], "no_index")))
+        conn.execute(f"CREATE INDEX {INDEX} ON messages (conversation_id, created_at)")
+        conn.commit()
+    conn.close()
+
+    for r in reports:
+        print(f"\n[{r['mode']}] latency ms")
+        for name in ("prompt_history", "page_latest", "page_older", "legacy_asc50"):
+            t = r[name]
+            print(f"  {name:15} p50={t['p50']:>9} p95={t['p95']:>9} p99={t['p99']:>9}")
+    print(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
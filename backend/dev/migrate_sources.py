@@ -0,0 +1,172 @@
+"""
+Migration: messages.sources (JSON text của tối đa 3 chunk) → source_ids + index_version.
+
+Mỗi nguồn có trong chunk store hiện tại được thay bằng chunk_id (16 ký tự hex),
+nguồn không tìm thấy (dòng bảng, FAQ, chunk của index cũ) giữ nguyên text.
+Sau khi chuyển: VACUUM để trả lại dung lượng (rowid có thể đổi → index FTS
+được dựng lại), rồi in báo cáo trước / sau: kích thước DB và latency đọc history.
+
+Chạy:
+    python -m backend.dev.migrate_sources --db ./chatbot.db            # chunk store từ data/processed
+    python -m backend.dev.migrate_sources --synthetic 200000            # DB giả lập để đo
+"""
+import argparse
+import asyncio
+import json
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from backend.core.database import encode_sources, get_history, get_messages_page
+from backend.core.message_search import ensure_search_index, rebuild_search_index
+from backend.core.vector_store import VectorStore, chunk_id
+from backend.dev.history_bench import populate
+from backend.dev.stream_load import percentile
+
+
+def migrate(path: Path, chunks: Dict[str, str], version: str, batch: int = 5000) -> dict:
+    """Chuyển các dòng chưa migrate; chạy lại an toàn (bỏ qua dòng đã có source_ids)."""
+    counts = {"rows": 0, "chunk_refs": 0, "kept_inline": 0}
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    last = 0
+    while True:
+        rows = conn.execute(
+            "SELECT rowid, sources FROM messages WHERE rowid > ? AND sources NOT IN ('', '[]') "
+            "AND (source_ids IS NULL OR source_ids = '') ORDER BY rowid LIMIT ?",
+            (last, batch),
+        ).fetchall()
+        if not rows:
+            break
+        updates = []
+        for rowid, raw in rows:
+            try:
+                sources = json.loads(raw)
+            except ValueError:
+                continue
+            ids = [chunk_id(s) for s in sources]
+            inline = [s for s, cid in zip(sources, ids) if cid not in chunks]
+            refs = [cid if cid in chunks else "" for cid in ids]  # slot rỗng = nguồn inline kế tiếp
+            n_refs = len(ids) - len(inline)
+            counts["chunk_refs"] += n_refs
+            counts["kept_inline"] += len(inline)
+            updates.append((encode_sources(inline), ",".join(refs) if n_refs else "", version if n_refs else "", rowid))
+        conn.executemany("UPDATE messages SET sources = ?, source_ids = ?, index_version = ? WHERE rowid = ?", updates)
+        conn.commit()
+        counts["rows"] += len(updates)
+        last = rows[-1][0]
+    conn.close()
+    return counts
+
+
+def compact(path: Path) -> None:
+    """VACUUM trả dung lượng cho OS; rowid messages có thể đổi → dựng lại index FTS."""
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM")
+    conn.close()
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as c:
+        rebuild_search_index(c)
+    engine.dispose()
+
+
+def db_size(path: Path) -> int:
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    page_size, pages = conn.execute("PRAGMA page_size").fetchone()[0], conn.execute("PRAGMA page_count").fetchone()[0]
+    conn.close()
+    return page_size * pages
+
+
+async def read_latency(path: Path, conv_ids) -> dict:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    Session = async_sessionmaker(engine)
+    report = {}
+    async with Session() as db:
+        for name, fn in [("get_history", lambda cid: get_history(db, cid)),
+                         ("page_latest", lambda cid: get_messages_page(db, cid, limit=50))]:
+            latencies = []
+            for cid in conv_ids:
+                t = time.perf_counter()
+                await fn(cid)
+                latencies.append((time.perf_counter() - t) * 1000)
+            report[name] = {p: round(percentile(latencies, int(p[1:])), 3) for p in ("p50", "p95", "p99")}
+    await engine.dispose()
+    return report
+
+
+def synthetic(path: Path, n_messages: int, n_conversations: int, n_chunks: int = 2000) -> Dict[str, str]:
+    """DB giả lập: mỗi câu trả lời lưu 3 chunk (~700 ký tự) dạng JSON như trước migration."""
+    rng = random.Random(0)
+    words = "điểm chuẩn học phí ngành công nghệ thông tin xét tuyển tổ hợp chỉ tiêu năm học bổng cơ sở".split()
+    corpus = [" ".join(rng.choice(words) for _ in range(150)) + f" [{i}]" for i in range(n_chunks)]
+    populate(path, n_messages, n_conversations)
+    conn = sqlite3.connect(path)
+    rowids = [r[0] for r in conn.execute("SELECT rowid FROM messages WHERE role = 'assistant'")]
+    conn.executemany(
+        "UPDATE messages SET sources = ? WHERE rowid = ?",
+        ((json.dumps(rng.sample(corpus, 3), ensure_ascii=False), rowid) for rowid in rowids),
+    )
+    conn.commit()
+    conn.close()
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as c:
+        ensure_search_index(c)  # như DB thật (FTS có sẵn) — compact() dựng lại index này
+    engine.dispose()
+    return {chunk_id(c): c for c in corpus}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate message sources to chunk ids")
+    parser.add_argument("--db", help="DB cần migrate (mặc định: DB giả lập)")
+    parser.add_argument("--synthetic", type=int, default=200_000, help="Số tin nhắn của DB giả lập")
+    parser.add_argument("--conversations", type=int, default=4000, help="Số hội thoại của DB giả lập")
+    parser.add_argument("--samples", type=int, default=300)
+    parser.add_argument("--no-vacuum", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.db:
+            path = Path(args.db)
+            vs = VectorStore()
+            vs.load()
+            chunks, version = {chunk_id(c): c for c in vs.chunks}, vs.version
+        else:
+            path = Path(tmp) / "sources.db"
+            chunks, version = synthetic(path, args.synthetic, args.conversations), "synthetic"
+
+        conn = sqlite3.connect(path)
+        conv_ids = [r[0] for r in conn.execute(
+            "SELECT id FROM conversations ORDER BY random() LIMIT ?", (args.samples,)
+        )]
+        conn.close()
+
+        before = {"db_bytes": db_size(path), **asyncio.run(read_latency(path, conv_ids))}
+        t = time.perf_counter()
+        counts = migrate(path, chunks, version)
+        if not args.no_vacuum:
+            compact(path)
+        elapsed = round(time.perf_counter() - t, 1)
+        after = {"db_bytes": db_size(path), **asyncio.run(read_latency(path, conv_ids))}
+
+    report = {"migrated": counts, "migration_s": elapsed, "before": before, "after": after}
+    print(f"DB size: {before['db_bytes'] / 1e6:.1f} MB → {after['db_bytes'] / 1e6:.1f} MB")
+    for name in ("get_history", "page_latest"):
+        print(f"  {name:12} p50 {before[name]['p50']}ms → {after[name]['p50']}ms   "
+              f"p95 {before[name]['p95']}ms → {after[name]['p95']}ms")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Retention simulation — bảng nóng qua 1 mùa tuyển sinh: có / không có archive job.
+
+Mỗi ngày giả lập: --per-day hội thoại mới (mỗi hội thoại --turns lượt hỏi đáp)
+được ghi vào DB, rồi (mode archive) chạy ConversationArchiver.run_once với
+đồng hồ giả lập. Mỗi --every ngày đo: số dòng bảng nóng, kích thước file DB,
+latency list conversations / prompt history / search.
+
+Chạy:
+    python -m backend.dev.retention_sim --days 150 --per-day 300 --retention-days 30
+"""
+import argparse
+import asyncio
+import json
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT))
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from backend.core.archive import ConversationArchiver
+from backend.core.database import Base, create_engines, get_all_conversations, get_session_window
+from backend.core.message_search import ensure_search_index, search_messages
+from backend.dev.stream_load import percentile
+
+START = datetime(2025, 3, 1)
+ANSWER = "Theo đề án tuyển sinh, điểm chuẩn ngành Công nghệ thông tin năm trước là 26.4 điểm. " * 6
+
+
+def insert_day(path: Path, day: datetime, per_day: int, turns: int, rng) -> list:
+    conn = sqlite3.connect(path)
+    conv_ids, rows = [], []
+    for i in range(per_day):
+        cid = str(uuid.uuid4())
+        t = day + timedelta(seconds=rng.randrange(80_000))
+        conv_ids.append((cid, t.isoformat(" ")))
+        for j in range(turns * 2):
+            role = "user" if j % 2 == 0 else "assistant"
+            content = f"Cho mình hỏi học phí ngành {rng.randrange(40)}?" if role == "user" else ANSWER
+            rows.append((str(uuid.uuid4()), cid, role, content, "",
+                         (t + timedelta(seconds=30 * j)).isoformat(" ", "microseconds")))
+    conn.executemany(
+        "INSERT INTO conversations (id, created_at, title, summary, summary_upto) VALUES (?, ?, 'sim', '', 0)",
+        conv_ids,
+    )
+    conn.executemany(
+        "INSERT INTO messages (id, conversation_id, role, content, sources, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    conn.commit()
+    conn.close()
+    return [cid for cid, _ in conv_ids]
+
+
+async def measure(ReadSession, recent_ids, samples: int) -> dict:
+    out = {}
+    async with ReadSession() as db:
+        for name, fn in [
+            ("list_conversations", lambda cid: get_all_conversations(db)),
+            ("prompt_history", lambda cid: get_session_window(db, cid, window=6)),
+            ("search", lambda cid: search_messages(db, "học phí ngành 7", sort="recent")),
+        ]:
+            latencies = []
+            for cid in recent_ids[:samples]:
+                t = time.perf_counter()
+                await fn(cid)
+                latencies.append((time.perf_counter() - t) * 1000)
+            out[name] = {"p50": round(percentile(latencies, 50), 3), "p99": round(percentile(latencies, 99), 3)}
+    return out
+
+
+async def simulate(mode: str, path: Path, args) -> list:
+    writer, reader = create_engines(f"sqlite:///{path}", read_pool_size=2)
+    async with writer.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(ensure_search_index)
+    WriteSession = async_sessionmaker(writer, expire_on_commit=False)
+    ReadSession = async_sessionmaker(reader, expire_on_commit=False)
+    archiver = ConversationArchiver(
+        path.parent / f"archive-{mode}", retention_days=args.retention_days,
+        session_factory=WriteSession, read_session_factory=ReadSession, engine=writer,
+    )
+    rng = random.Random(0)
+    timeline = []
+    for d in range(args.days):
+        day = START + timedelta(days=d)
+        recent = insert_day(path, day, args.per_day, args.turns, rng)
+        run = await archiver.run_once(now=day + timedelta(days=1)) if mode == "archive" else None
+        if (d + 1) % args.every == 0:
+            conn = sqlite3.connect(path)
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            point = {
+                "day": d + 1,
+                "conversations": conn.execute("SELECT count(*) FROM conversations").fetchone()[0],
+                "messages": conn.execute("SELECT count(*) FROM messages").fetchone()[0],
+                "db_mb": round(path.stat().st_size / 1e6, 1),
+                **await measure(ReadSession, recent, args.samples),
+            }
+            conn.close()
+            if run is not None:
+                point["archive_run_ms"] = run["ms"]
+            timeline.append(point)
+            print(f"  [{mode:7}] day {point['day']:>3}: {point['messages']:>8,} msgs  {point['db_mb']:>7} MB  "
+                  f"history p50={point['prompt_history']['p50']}ms  search p50={point['search']['p50']}ms")
+    await reader.dispose()
+    await writer.dispose()
+    return timeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot-table size over an admissions season")
+    parser.add_argument("--days", type=int, default=150)
+    parser.add_argument("--per-day", type=int, default=300)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--retention-days", type=int, default=30)
+    parser.add_argument("--every", type=int, default=15)
+    parser.add_argument("--samples", type=int, default=100)
+    parser.add_argument("--modes", default="none,archive")
+    args = parser.parse_args()
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in args.modes.split(","):
+            path = Path(tmp) / f"{mode}.db"
+            report[mode] = asyncio.run(simulate(mode, path, args))
+        archive_dir = Path(tmp) / "archive-archive"
+        if archive_dir.exists():
+            report["archive_files_mb"] = round(sum(f.stat().st_size for f in archive_dir.iterdir()) / 1e6, 2)
+            shutil.rmtree(archive_dir)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
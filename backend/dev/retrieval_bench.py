@@ -0,0 +1,405 @@
+"""
+Retrieval benchmark — micro-benchmark tầng retrieval trên corpus giả lập 1k → 1M chunk.
+
+Corpus tiếng Việt giả lập (tất định theo --seed): âm tiết ghép phụ âm đầu + vần
++ dấu thanh, phân bố Zipf như văn bản thật, xen thuật ngữ tuyển sinh / mã ngành.
+Câu truy vấn = đoạn 4–8 từ cắt từ chunk ngẫu nhiên (BM25 luôn có kết quả).
+Embedding: HashingEmbedder (feature hashing, không cần model / mạng) thay cho
+EmbeddingEngine — đo chi phí index/search, không đo chất lượng. --model để
+dùng 1 model sentence-transformers nhỏ đã có trong cache.
+
+Mỗi kích thước chạy 2 process riêng (peak RSS không lẫn giữa các pha):
+- build: embed, VectorStore.add, BM25Retriever.build, save (thời gian, chunk/s, dung lượng)
+- query: VectorStore.load, BM25Retriever.load, rồi p50/p95/p99 + QPS cho
+  VectorStore.search, BM25Retriever.search, HybridRetriever.retrieve
+BM25 (rank_bm25, thuần Python) giữ 1 dict / chunk: quá --bm25-max chunk thì bỏ
+qua BM25 + hybrid (ghi "skipped" trong báo cáo) để không OOM máy đo.
+
+Báo cáo JSON (commit git, môi trường, tham số) — so sánh giữa 2 commit bằng --compare.
+
+Chạy:
+    python -m backend.dev.retrieval_bench --output retrieval.json
+    python -m backend.dev.retrieval_bench --sizes 1000 10000 --compare retrieval_main.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Union
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT))
+
+import numpy as np
+
+from backend.core.bm25_retriever import BM25Retriever
+from backend.core.hybrid_retriever import HybridRetriever
+from backend.core.vector_store import VectorStore
+from backend.dev.stream_load import percentile
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+ONSETS = ["", "b", "c", "ch", "d", "đ", "g", "gi", "h", "k", "kh", "l", "m", "n", "ng", "nh",
+          "ph", "qu", "r", "s", "t", "th", "tr", "v", "x"]
+RHYMES = ["a", "ai", "an", "ang", "anh", "ao", "at", "ay", "e", "em", "en", "i", "ia", "in", "inh",
+          "o", "oa", "oan", "oi", "on", "ong", "u", "ua", "uc", "ung", "uy", "uyên", "ương", "ươc",
+          "ơi", "ơn", "ân", "âu", "ôi", "ông", "ư", "ưa", "ưng", "iêu", "iên", "ươi"]
+TONES = "̣̀́̃̉"  # huyền, sắc, ngã, hỏi, nặng (combining)
+TERMS = ["tuyển sinh", "điểm chuẩn", "học phí", "chỉ tiêu", "xét tuyển", "tổ hợp", "ngành",
+         "công nghệ thông tin", "an toàn thông tin", "điện tử viễn thông", "học bổng",
+         "ký túc xá", "cơ sở Hà Nội", "cơ sở TP.HCM", "chương trình đào tạo"]
+
+
+def vocabulary(size: int, rng: np.random.Generator) -> List[str]:
+    """Từ 1–2 âm tiết, có dấu thanh, + thuật ngữ tuyển sinh và mã ngành 7xxxxxx."""
+    import unicodedata
+
+    def syllable() -> str:
+        s = rng.choice(ONSETS) + rng.choice(RHYMES)
+        if rng.random() < 0.8:
+            s += rng.choice(list(TONES))
+        return unicodedata.normalize("NFC", s)
+
+    words = set(TERMS) | {f"74{rng.integers(10000, 99999)}" for _ in range(size // 50)}
+    while len(words) < size:
+        words.add(syllable() if rng.random() < 0.6 else f"{syllable()} {syllable()}")
+    return sorted(words)
+
+
+def make_corpus(n: int, words: int, seed: int = 0, vocab_size: int = 20_000) -> List[str]:
+    """n chunk ~words từ, tần suất từ theo Zipf (s=1.1)."""
+    rng = np.random.default_rng(seed)
+    vocab = np.array(vocabulary(vocab_size, rng), dtype=object)
+    rng.shuffle(vocab)
+    weights = 1.0 / np.arange(1, len(vocab) + 1) ** 1.1
+    weights /= weights.sum()
+    chunks = []
+    for start in range(0, n, 10_000):
+        ids = rng.choice(len(vocab), size=(min(10_000, n - start), words), p=weights)
+        chunks.extend(" ".join(vocab[row]) + "." for row in ids)
+    return chunks
+
+
+def make_queries(chunks: List[str], n: int, seed: int = 0) -> List[str]:
+    rng = np.random.default_rng(seed + 1)
+    queries = []
+    for i in rng.integers(0, len(chunks), size=n):
+        tokens = chunks[i].rstrip(".").split()
+        length = int(rng.integers(4, 9))
+        start = int(rng.integers(0, max(1, len(tokens) - length)))
+        queries.append(" ".join(tokens[start:start + length]))
+    return queries
+
+
+class HashingEmbedder:
+    """
+    Stand-in cho EmbeddingEngine (cùng encode()): feature hashing từng từ vào
+    dim chiều với dấu ±1, chuẩn hoá L2. Tất định, không cần model hay mạng.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self._buckets: Dict[str, int] = {}  # từ → bucket có dấu (±(idx+1))
+
+    def _bucket(self, word: str) -> int:
+        b = self._buckets.get(word)
+        if b is None:
+            h = zlib.crc32(word.encode("utf-8"))
+            b = (h % self.dim + 1) * (1 if h & 0x80000000 else -1)
+            self._buckets[word] = b
+        return b
+
+    def encode(
+        self,
+        texts: Union[str, List[str]],
+        batch_size: int = 32,
+        normalize: bool = True,
+    ) -> np.ndarray:
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+        rows, buckets = [], []
+        for i, t in enumerate(texts):
+            bs = [self._bucket(w) for w in t.lower().split()]
+            buckets.extend(bs)
+            rows.extend([i] * len(bs))
+        buckets = np.array(buckets, dtype=np.int64)
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        np.add.at(out, (np.array(rows, dtype=np.int64), np.abs(buckets) - 1), np.sign(buckets).astype("float32"))
+        if normalize:
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out[0] if single else out
+
+
+def make_embedder(args):
+    if args.model:
+        from backend.core.embedder import EmbeddingEngine
+        return EmbeddingEngine(args.model)
+    return HashingEmbedder(args.dim)
+
+
+# ─── Đo ──────────────────────────────────────────────────────
+def peak_rss_mb() -> float:
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)  # Linux: KB
+
+
+def timed(fn) -> float:
+    t = time.perf_counter()
+    fn()
+    return time.perf_counter() - t
+
+
+def latency(fn, queries, warmup: int = 5) -> dict:
+    """p50/p95/p99 (ms) + QPS tuần tự 1 luồng."""
+    for q in queries[:warmup]:
+        fn(q)
+    latencies = []
+    start = time.perf_counter()
+    for q in queries:
+        t = time.perf_counter()
+        fn(q)
+        latencies.append((time.perf_counter() - t) * 1000)
+    total = time.perf_counter() - start
+    return {
+        **{f"{p}_ms": round(percentile(latencies, int(p[1:])), 3) for p in ("p50", "p95", "p99")},
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "qps": round(len(queries) / total, 1),
+    }
+
+
+def paths(workdir: Path, vs: VectorStore, bm25: BM25Retriever) -> None:
+    """Trỏ save/load vào thư mục tạm (không đụng data/processed)."""
+    vs.INDEX_PATH = workdir / "faiss.index"
+    vs.CHUNKS_PATH = workdir / "chunks.pkl"
+    vs.VERSION_PATH = workdir / "index_version.txt"
+    bm25.SAVE_PATH = workdir / "bm25.pkl"
+
+
+def phase_build(args, workdir: Path) -> dict:
+    report = {}
+    t = time.perf_counter()
+    chunks = make_corpus(args.size, args.words, args.seed)
+    queries = make_queries(chunks, args.queries, args.seed)
+    report["corpus_s"] = round(time.perf_counter() - t, 2)
+    (workdir / "queries.json").write_text(json.dumps(queries, ensure_ascii=False), encoding="utf-8")
+
+    embedder = make_embedder(args)
+    vs, bm25 = VectorStore(dim=args.dim if not args.model else embedder.dim), BM25Retriever()
+    paths(workdir, vs, bm25)
+
+    embed_s = add_s = 0.0
+    for start in range(0, len(chunks), args.batch):
+        batch = chunks[start:start + args.batch]
+        t = time.perf_counter()
+        emb = embedder.encode(batch)
+        embed_s += time.perf_counter() - t
+        add_s += timed(lambda: vs.add(emb, batch))
+    report["embed"] = {"seconds": round(embed_s, 2), "chunks_per_s": round(len(chunks) / embed_s, 1)}
+    report["vector_build"] = {"seconds": round(add_s, 3), "chunks_per_s": round(len(chunks) / add_s, 1)}
+    save_s = timed(vs.save)
+    report["vector_build"]["rss_mb"] = peak_rss_mb()
+
+    if args.size <= args.bm25_max:
+        seconds = timed(lambda: bm25.build(chunks))
+        report["bm25_build"] = {"seconds": round(seconds, 2), "chunks_per_s": round(len(chunks) / seconds, 1)}
+        save_s += timed(bm25.save)
+    else:
+        report["bm25_build"] = {"skipped": f"size > --bm25-max ({args.bm25_max})"}
+
+    report["save_s"] = round(save_s, 2)
+    report["disk_bytes"] = {
+        p.name: p.stat().st_size for p in (vs.INDEX_PATH, vs.CHUNKS_PATH, bm25.SAVE_PATH) if p.exists()
+    }
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def phase_query(args, workdir: Path) -> dict:
+    report = {"rss_baseline_mb": peak_rss_mb()}
+    queries = json.loads((workdir / "queries.json").read_text(encoding="utf-8"))
+    embedder = make_embedder(args)
+    vs, bm25 = VectorStore(dim=args.dim), BM25Retriever()
+    paths(workdir, vs, bm25)
+    has_bm25 = bm25.SAVE_PATH.exists()
+
+    report["vector_load"] = {"seconds": round(timed(vs.load), 3), "rss_mb": peak_rss_mb()}
+    if has_bm25:
+        report["bm25_load"] = {"seconds": round(timed(bm25.load), 3), "rss_mb": peak_rss_mb()}
+
+    q_embs = {q: embedder.encode(q) for q in queries}
+    report["query_embed"] = latency(embedder.encode, queries)
+    report["vector_search"] = latency(lambda q: vs.search(q_embs[q], k=args.k * 3), queries)
+    if has_bm25:
+        report["bm25_search"] = latency(lambda q: bm25.search(q, k=args.k * 3), queries)
+        hybrid = HybridRetriever(vs, bm25, embedder)
+        report["hybrid_retrieve"] = latency(lambda q: hybrid.retrieve(q, k=args.k), queries)
+    else:
+        report["bm25_search"] = report["hybrid_retrieve"] = {"skipped": "no BM25 index for this size"}
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+# ─── Điều phối ───────────────────────────────────────────────
+WORKER_ARGS = ("dim", "words", "queries", "k", "seed", "batch", "bm25_max", "model")
+
+
+def run_phase(phase: str, size: int, workdir: Path, args) -> dict:
+    """Chạy 1 pha trong process con; lỗi / bị OOM-kill → ghi lỗi vào báo cáo."""
+    cmd = [sys.executable, "-m", "backend.dev.retrieval_bench", "--phase", phase,
+           "--size", str(size), "--workdir", str(workdir)]
+    for name in WORKER_ARGS:
+        value = getattr(args, name)
+        if value is not None:
+            cmd += [f"--{name.replace('_', '-')}", str(value)]
+    proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True)
+    out = workdir / f"{phase}.json"
+    if proc.returncode != 0 or not out.exists():
+        tail = (proc.stderr or proc.stdout).strip().splitlines()[-1:] or [""]
+        print(f"  [WARN] {phase} @ {size:,} failed (exit {proc.returncode}): {tail[0]}")
+        return {"error": f"exit {proc.returncode}: {tail[0]}"}
+    return json.loads(out.read_text(encoding="utf-8"))
+
+
+def git_commit() -> dict:
+    def git(*cmd):
+        try:
+            return subprocess.run(["git", *cmd], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def environment() -> dict:
+    import faiss
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "faiss": getattr(faiss, "__version__", "unknown"),
+        "faiss_threads": faiss.omp_get_max_threads(),
+    }
+
+
+# ─── So sánh ─────────────────────────────────────────────────
+HIGHER_IS_BETTER = ("qps", "chunks_per_s")
+
+
+def flatten(d: dict, prefix: str = "") -> Dict[str, float]:
+    out = {}
+    for key, value in d.items():
+        name = f"{prefix}/{key}" if prefix else key
+        if isinstance(value, dict):
+            out.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[name] = float(value)
+    return out
+
+
+def compare(old: dict, new: dict, threshold: float) -> List[dict]:
+    """Mọi chỉ số có ở cả 2 báo cáo; regression = xấu đi quá threshold (tỉ lệ)."""
+    a, b = flatten(old["sizes"]), flatten(new["sizes"])
+    rows = []
+    for name in sorted(a.keys() & b.keys(), key=lambda n: (int(n.split("/")[0]), n)):
+        if not a[name]:
+            continue
+        change = (b[name] - a[name]) / a[name]
+        worse = -change if name.rsplit("/", 1)[-1] in HIGHER_IS_BETTER else change
+        rows.append({"metric": name, "old": a[name], "new": b[name],
+                     "change": round(change, 4), "regression": worse > threshold})
+    return rows
+
+
+def print_comparison(rows: List[dict], old: dict, new: dict) -> None:
+    print(f"\nCompare {(old['meta'].get('git') or {}).get('commit', '?')[:10]} → "
+          f"{(new['meta'].get('git') or {}).get('commit', '?')[:10]}")
+    for r in rows:
+        if r["metric"].endswith(("_ms", "qps", "seconds", "peak_rss_mb", "chunks_per_s")):
+            flag = "  << REGRESSION" if r["regression"] else ""
+            print(f"  {r['metric']:45} {r['old']:>12.3f} → {r['new']:>12.3f}  ({r['change']:+.1%}){flag}")
+
+
+def summary(size: int, result: dict) -> str:
+    q = result.get("query", {})
+    parts = [f"{size:>9,}"]
+    for name in ("vector_search", "bm25_search", "hybrid_retrieve"):
+        stats = q.get(name, {})
+        parts.append(f"{name} p50 {stats['p50_ms']}ms / {stats['qps']} qps" if "p50_ms" in stats else f"{name} -")
+    return "  ".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval micro-benchmarks on synthetic corpora")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--dim", type=int, default=384, help="Số chiều của HashingEmbedder")
+    parser.add_argument("--model", help="Model sentence-transformers nhỏ (đã cache) thay cho HashingEmbedder")
+    parser.add_argument("--words", type=int, default=100, help="Số từ mỗi chunk")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch", type=int, default=10_000, help="Số chunk mỗi lần embed + add")
+    parser.add_argument("--bm25-max", type=int, default=200_000, help="Bỏ qua BM25 / hybrid trên kích thước này")
+    parser.add_argument("--output", help="Ghi báo cáo JSON ra file")
+    parser.add_argument("--compare", help="Báo cáo cũ để so sánh")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Ngưỡng regression (tỉ lệ)")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    # Nội bộ: process con của từng pha
+    parser.add_argument("--phase", choices=("build", "query"), help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase:
+        workdir = Path(args.workdir)
+        with contextlib.redirect_stdout(io.StringIO()):  # print() của VectorStore / BM25
+            result = phase_build(args, workdir) if args.phase == "build" else phase_query(args, workdir)
+        (workdir / f"{args.phase}.json").write_text(json.dumps(result), encoding="utf-8")
+        return
+
+    report = {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "git": git_commit(),
+            "environment": environment(),
+            "params": {name: getattr(args, name) for name in WORKER_ARGS},
+            "embedder": args.model or f"hashing-{args.dim}",
+        },
+        "sizes": {},
+    }
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            t = time.perf_counter()
+            result = {"build": run_phase("build", size, Path(tmp), args)}
+            if "error" not in result["build"]:
+                result["query"] = run_phase("query", size, Path(tmp), args)
+        report["sizes"][str(size)] = result
+        print(f"{summary(size, result)}  ({time.perf_counter() - t:.0f}s)", flush=True)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"Report: {args.output}")
+    else:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    if args.compare:
+        old = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        rows = compare(old, report, args.threshold)
+        print_comparison(rows, old, report)
+        regressions = [r for r in rows if r["regression"]]
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%}")
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Search benchmark — tìm kiếm toàn văn trên hàng triệu tin nhắn: FTS5 vs LIKE scan.
+
+Sinh DB riêng (populate của history_bench) với nội dung đa dạng: câu hỏi ghép
+từ ngành / chủ đề / năm, một số từ hiếm. Đo:
+- backfill: thời gian index toàn bộ tin nhắn cũ (lần nâng cấp đầu tiên)
+- search_messages cho từ hiếm / trung bình / phổ biến, sort=rank và sort=recent
+- like_scan: cách làm cũ (content LIKE '%...%' trên bảng messages), ít mẫu
+
+Chạy:
+    python -m backend.dev.search_bench --messages 2000000 --conversations 100000
+"""
+import argparse
+import asyncio
+import json
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from backend.core.message_search import ensure_search_index, match_query, search_messages
+from backend.dev.history_bench import populate
+from backend.dev.stream_load import percentile
+
+MAJORS = ["Công nghệ thông tin", "Điện tử viễn thông", "An toàn thông tin", "Kế toán", "Marketing",
+          "Quản trị kinh doanh", "Đa phương tiện", "Khoa học máy tính", "Kỹ thuật dữ liệu", "Fintech"]
+TOPICS = ["điểm chuẩn", "học phí", "chỉ tiêu", "phương thức xét tuyển", "học bổng",
+          "ký túc xá", "tổ hợp môn", "chương trình đào tạo", "cơ hội việc làm", "hồ sơ nhập học"]
+RARE = ["hoãn nghĩa vụ quân sự", "chuyển cơ sở", "bảo lưu kết quả", "miễn giảm học phí"]
+
+QUERIES = {
+    "rare": ["nghia vu quan su", "bảo lưu", "chuyen co so"],
+    "medium": ["ky tuc xa", "học bổng fintech", "to hop mon ke toan"],
+    "common": ["điểm chuẩn", "nganh", "cong nghe thong tin"],
+}
+
+
+def content(i: int, role: str, rng) -> str:
+    major, topic = rng.choice(MAJORS), rng.choice(TOPICS)
+    if role == "user":
+        if rng.random() < 0.001:
+            return f"Cho em hỏi về {rng.choice(RARE)} với ạ?"
+        return f"Cho mình hỏi {topic} ngành {major} năm {rng.choice((2023, 2024, 2025))}?"
+    return f"{topic.capitalize()} ngành {major} được cập nhật trên cổng tuyển sinh. " * 3
+
+
+async def timed(calls, repeat: int) -> dict:
+    """Latency (ms) từng lời gọi, mỗi lời gọi lặp repeat lần."""
+    latencies = []
+    for _ in range(repeat):
+        for call in calls:
+            t = time.perf_counter()
+            await call()
+            latencies.append((time.perf_counter() - t) * 1000)
+    return {p: round(percentile(latencies, int(p[1:])), 3) for p in ("p50", "p95", "p99")}
+
+
+async def run(path: Path, args) -> dict:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    Session = async_sessionmaker(engine)
+    report = {}
+    async with Session() as db:
+        for bucket, queries in QUERIES.items():
+            for sort in ("rank", "recent"):
+                calls = [lambda q=q, sort=sort: search_messages(db, q, limit=20, sort=sort) for q in queries]
+                report[f"{bucket}/{sort}"] = await timed(calls, args.repeat)
+            # trang thứ 5 (offset 80) — chi phí OFFSET trên kết quả đã xếp hạng
+            calls = [lambda q=q: search_messages(db, q, limit=20, offset=80) for q in queries]
+            report[f"{bucket}/rank_page5"] = await timed(calls, args.repeat)
+        like = lambda: db.execute(text(
+            "SELECT id FROM messages WHERE content LIKE :p ORDER BY created_at DESC LIMIT 20"
+        ), {"p": "%bảo lưu%"})
+        report["like_scan/rare"] = await timed([like], max(3, args.repeat // 10))
+        counts = {}
+        for bucket, queries in QUERIES.items():
+            r = await db.execute(text("SELECT count(*) FROM messages_fts WHERE messages_fts MATCH :q"),
+                                 {"q": match_query(queries[0])})
+            counts[bucket] = r.scalar()
+        report["matches"] = counts
+    await engine.dispose()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full-text search benchmark")
+    parser.add_argument("--db", default="/tmp/search_bench.db")
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--conversations", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--rebuild", action="store_true", help="Xoá và sinh lại DB")
+    args = parser.parse_args()
+
+    path = Path(args.db)
+    if args.rebuild and path.exists():
+        path.unlink()
+    backfill_s = None
+    if not path.exists():
+        populate(path, args.messages, args.conversations, content=content)
+        engine = create_engine(f"sqlite:///{path}")
+        t = time.perf_counter()
+        with engine.begin() as conn:
+            ensure_search_index(conn)
+        backfill_s = round(time.perf_counter() - t, 1)
+        engine.dispose()
+
+    conn = sqlite3.connect(path)
+    total = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    conn.close()
+    print(f"DB: {path} — {total:,} messages" + (f", backfill {backfill_s}s" if backfill_s else ""))
+
+    report = asyncio.run(run(path, args))
+    report["messages"] = total
+    report["backfill_s"] = backfill_s
+    for name, t in report.items():
+        if isinstance(t, dict) and "p50" in t:
+            print(f"  {name:22} p50={t['p50']:>9}ms p95={t['p95']:>9}ms p99={t['p99']:>9}ms")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
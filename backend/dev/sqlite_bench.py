@@ -0,0 +1,128 @@
+"""
+SQLite storage benchmark — đọc/ghi đồng thời: profile mặc định vs WAL + reader/writer split.
+
+- default:   rollback journal, synchronous=FULL, 1 engine dùng chung cho đọc và ghi
+- wal_split: storage_pragmas (WAL, synchronous=NORMAL, mmap, cache, busy_timeout),
+             1 connection ghi + pool connection chỉ-đọc
+
+Workload trong --duration giây trên DB đã có sẵn dữ liệu (sinh bằng history_bench):
+- --writers coroutine liên tục save_message (mỗi lần 1 commit, như trước write-behind)
+- --readers coroutine liên tục list conversations + đọc trang tin nhắn mới nhất
+Đo: reads/s, writes/s, latency p50/p95/p99, số lỗi (vd "database is locked").
+
+Chạy:
+    python -m backend.dev.sqlite_bench --messages 200000 --conversations 20000 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT))
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from backend.core.database import (
+    create_engines,
+    get_all_conversations,
+    get_messages_page,
+    save_message,
+)
+from backend.dev.history_bench import populate
+from backend.dev.stream_load import percentile
+
+
+async def run_profile(profile: str, path: Path, conv_ids, args) -> dict:
+    writer_engine, reader_engine = create_engines(
+        f"sqlite:///{path}", read_pool_size=args.readers, tuned=profile == "wal_split",
+    )
+    WriteSession = async_sessionmaker(writer_engine, expire_on_commit=False)
+    ReadSession = async_sessionmaker(reader_engine, expire_on_commit=False)
+
+    reads, writes = [], []
+    errors = {"read": 0, "write": 0}
+    deadline = time.perf_counter() + args.duration
+    rng = random.Random(1)
+
+    async def reader():
+        while time.perf_counter() < deadline:
+            t = time.perf_counter()
+            try:
+                async with ReadSession() as db:
+                    await get_all_conversations(db)
+                    await get_messages_page(db, rng.choice(conv_ids), limit=20)
+                reads.append(time.perf_counter() - t)
+            except Exception:
+                errors["read"] += 1
+
+    async def writer():
+        while time.perf_counter() < deadline:
+            t = time.perf_counter()
+            try:
+                async with WriteSession() as db:
+                    await save_message(db, rng.choice(conv_ids), "user", "Cho mình hỏi học phí ngành CNTT?")
+                writes.append(time.perf_counter() - t)
+            except Exception:
+                errors["write"] += 1
+
+    await asyncio.gather(*[reader() for _ in range(args.readers)], *[writer() for _ in range(args.writers)])
+    journal = None
+    async with writer_engine.connect() as conn:
+        journal = (await conn.exec_driver_sql("PRAGMA journal_mode")).scalar()
+    await reader_engine.dispose()
+    await writer_engine.dispose()
+
+    ms = lambda values, p: round(percentile(values, p) * 1000, 2)
+    return {
+        "profile": profile,
+        "journal_mode": journal,
+        "reads_per_s": round(len(reads) / args.duration, 1),
+        "writes_per_s": round(len(writes) / args.duration, 1),
+        "read_ms": {"p50": ms(reads, 50), "p95": ms(reads, 95), "p99": ms(reads, 99)},
+        "write_ms": {"p50": ms(writes, 50), "p95": ms(writes, 95), "p99": ms(writes, 99)},
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite storage profile benchmark")
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--conversations", type=int, default=20_000)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--dir", default=".", help="Thư mục đặt DB (nên cùng disk với DB thật)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        seed = Path(tmp) / "seed.db"
+        populate(seed, args.messages, args.conversations)
+        conn = sqlite3.connect(seed)
+        conv_ids = [r[0] for r in conn.execute("SELECT id FROM conversations")]
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_messages_conversation_created ON messages (conversation_id, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_conversations_created_at ON conversations (created_at)")
+        conn.commit()
+        conn.close()
+
+        reports = []
+        for profile in ("default", "wal_split"):
+            path = Path(tmp) / f"{profile}.db"
+            shutil.copy(seed, path)  # cùng dữ liệu cho cả 2 profile
+            reports.append(asyncio.run(run_profile(profile, path, conv_ids, args)))
+
+    for r in reports:
+        print(f"{r['profile']:10} ({r['journal_mode']:6}) reads/s={r['reads_per_s']:>8} "
+              f"read p99={r['read_ms']['p99']:>8}ms  writes/s={r['writes_per_s']:>7} "
+              f"write p99={r['write_ms']['p99']:>8}ms  errors={r['errors']}")
+    print(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Stream load test — N stream đồng thời trực tiếp vào LLM provider.
+
+Đo time-to-first-token (TTFT), inter-token latency (ITL), độ trễ event loop
+(loop lag — nếu stream chặn loop, lag tăng vọt) và thống kê pool.
+Dùng cùng fake server (backend.dev.fake_llm) để chạy offline.
+
+Chạy:
+    python -m backend.dev.fake_llm --port 11435 &
+    python -m backend.dev.stream_load --provider ollama --url http://127.0.0.1:11435 -n 100
+    python -m backend.dev.stream_load --provider gemini --url http://127.0.0.1:11435 -n 100
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT))
+
+from backend.core.llm_providers import GeminiProvider, OllamaProvider, ThreadBridge
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[idx]
+
+
+async def one_stream(provider, model, prompt):
+    start = time.perf_counter()
+    ttft = None
+    gaps = []
+    last = start
+    stream = provider.stream(prompt, model) if isinstance(provider, OllamaProvider) else provider.stream(prompt)
+    async for _ in stream:
+        now = time.perf_counter()
+        if ttft is None:
+            ttft = now - start
+        else:
+            gaps.append(now - last)
+        last = now
+    return ttft or 0.0, gaps, time.perf_counter() - start
+
+
+async def loop_lag_monitor(lags: list, stop: asyncio.Event, interval: float = 0.01):
+    """Heartbeat mỗi 10ms — độ trễ so với lịch = thời gian loop bị chặn."""
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - t0 - interval)
+
+
+def build_provider(args):
+    if args.provider == "ollama":
+        return OllamaProvider(args.url, max_connections=args.max_connections)
+    if args.provider == "gemini":
+        return GeminiProvider(
+            "fake-key", args.model, bridge=ThreadBridge(max(args.n, 1)),
+            api_endpoint=args.url, transport="rest",
+        )
+    raise ValueError(f"Unknown provider '{args.provider}'")
+
+
+async def run(args) -> dict:
+    provider = build_provider(args)
+    lags: list = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(loop_lag_monitor(lags, stop))
+    try:
+        start = time.perf_counter()
+        results = await asyncio.gather(*[
+            one_stream(provider, args.model, "Học phí ngành CNTT?") for _ in range(args.n)
+        ])
+        wall = time.perf_counter() - start
+        if isinstance(provider, OllamaProvider):
+            stats = provider.stats()
+        else:
+            stats = provider.bridge.stats()
+    finally:
+        stop.set()
+        await monitor
+        if isinstance(provider, OllamaProvider):
+            await provider.aclose()
+        else:
+            provider.bridge.shutdown()
+
+    ttfts = [r[0] for r in results]
+    gaps = [g for r in results for g in r[1]]
+    ms = lambda v: round(1000 * v, 2)
+    return {
+        "provider": args.provider,
+        "streams": args.n,
+        "wall_s": round(wall, 3),
+        "ttft_ms": {"p50": ms(percentile(ttfts, 50)), "p95": ms(percentile(ttfts, 95)),
+                    "p99": ms(percentile(ttfts, 99)), "max": ms(max(ttfts))},
+        "itl_ms": {"p50": ms(percentile(gaps, 50)), "p95": ms(percentile(gaps, 95)),
+                   "p99": ms(percentile(gaps, 99)), "stdev": ms(statistics.pstdev(gaps) if gaps else 0)},
+        "loop_lag_ms": {"p50": ms(percentile(lags, 50)), "p99": ms(percentile(lags, 99)),
+                        "max": ms(max(lags) if lags else 0)},
+        "pool": stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent LLM stream load test")
+    parser.add_argument("--provider", default="ollama", choices=["ollama", "gemini"])
+    parser.add_argument("--url", default="http://127.0.0.1:11435")
+    parser.add_argument("--model", default="fake")
+    parser.add_argument("-n", type=int, default=100, help="Số stream đồng thời")
+    parser.add_argument("--max-connections", type=int, default=100)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Rerank evaluation — prompt tokens tiết kiệm được vs chất lượng câu trả lời.
+
+So sánh 2 cấu hình trên bộ câu hỏi có nhãn (eval/questions.json):
+  - baseline: HybridRetriever, RRF top-k → prompt
+  - rerank:   HybridRetriever + CrossEncoderReranker (top_n, min_score)
+
+Chỉ số:
+  - prompt_tokens: số token prompt (median / mean)
+  - support:       tỉ lệ câu hỏi mà ngữ cảnh đưa vào LLM chứa đủ gold facts
+  - answer_acc:    (--generate) tỉ lệ câu trả lời LLM chứa đáp án đúng
+  - rerank_ms:     latency thêm của cross-encoder
+
+Chạy:
+    python -m backend.eval.rerank_eval --top-n 3 --min-score 0
+    python -m backend.eval.rerank_eval --generate --output rerank_report.json
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT))
+
+from backend.config import settings
+from backend.core.bm25_retriever import BM25Retriever
+from backend.core.chat_engine import ChatEngine, PromptBuilder
+from backend.core.embedder import EmbeddingEngine
+from backend.core.hybrid_retriever import HybridRetriever
+from backend.core.reranker import CrossEncoderReranker
+from backend.core.vector_store import VectorStore
+
+
+QUESTIONS_PATH = Path(__file__).parent / "questions.json"
+
+
+def contains_all(text: str, needles) -> bool:
+    text = text.lower()
+    return all(n.lower() in text for n in needles)
+
+
+def contains_any(text: str, needles) -> bool:
+    text = text.lower()
+    return any(n.lower() in text for n in needles)
+
+
+def evaluate(retriever, questions, k, budget, engine=None) -> dict:
+    builder = PromptBuilder()
+    rows = []
+    for q in questions:
+        t0 = time.perf_counter()
+        results = retriever.retrieve(q["question"], k=k)
+        retrieve_ms = 1000 * (time.perf_counter() - t0)
+
+        prompt, usage, _ = builder.build_packed(q["question"], results, None, budget)
+        row = {
+            "question": q["question"],
+            "prompt_tokens": usage["total"],
+            "chunks": len(results),
+            "supported": contains_all(prompt, q["gold"]),
+            "retrieve_ms": round(retrieve_ms, 2),
+        }
+        if engine is not None:
+            engine.retriever = retriever
+            answer = asyncio.run(engine.chat(q["question"], k=k))["answer"]
+            row["answer_correct"] = contains_any(answer, q["answer"])
+        rows.append(row)
+
+    tokens = [r["prompt_tokens"] for r in rows]
+    summary = {
+        "prompt_tokens_median": statistics.median(tokens),
+        "prompt_tokens_mean": round(statistics.mean(tokens), 1),
+        "support": round(sum(r["supported"] for r in rows) / len(rows), 4),
+        "retrieve_ms_median": round(statistics.median(r["retrieve_ms"] for r in rows), 2),
+    }
+    if engine is not None:
+        summary["answer_acc"] = round(sum(r["answer_correct"] for r in rows) / len(rows), 4)
+    return {"summary": summary, "rows": rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate cross-encoder reranking")
+    parser.add_argument("--questions", default=str(QUESTIONS_PATH))
+    parser.add_argument("--k", type=int, default=5, help="Top-k baseline (RRF)")
+    parser.add_argument("--candidates", type=int, default=settings.RERANKER_CANDIDATES)
+    parser.add_argument("--top-n", type=int, default=settings.RERANKER_TOP_N)
+    parser.add_argument("--min-score", type=float, default=settings.RERANKER_MIN_SCORE)
+    parser.add_argument("--model", default=settings.RERANKER_MODEL)
+    parser.add_argument("--budget", type=int, default=None,
+                        help="Token budget cho prompt (mặc định: không giới hạn)")
+    parser.add_argument("--generate", action="store_true",
+                        help="Gọi LLM để đo answer accuracy (tốn quota)")
+    parser.add_argument("--output", default=None, help="Ghi report JSON")
+    args = parser.parse_args()
+
+    questions = json.loads(Path(args.questions).read_text(encoding="utf-8"))
+
+    embedder = EmbeddingEngine(settings.EMBEDDING_MODEL)
+    vs = VectorStore(dim=embedder.dim)
+    bm25 = BM25Retriever()
+    vs.load()
+    bm25.load()
+
+    engine = None
+    if args.generate:
+        engine = ChatEngine(
+            HybridRetriever(vs, bm25, embedder),
+            api_key=settings.GEMINI_API_KEY,
+            provider=settings.LLM_PROVIDER,
+            model_name=settings.OLLAMA_MODEL if settings.LLM_PROVIDER == "ollama" else "gemini-1.5-flash-latest",
+        )
+
+    baseline = evaluate(HybridRetriever(vs, bm25, embedder), questions, args.k, args.budget, engine)
+
+    reranker = CrossEncoderReranker(
+        args.model, top_n=args.top_n, min_score=args.min_score,
+        latency_budget_ms=10_000,  # eval: chấm đủ mọi candidate
+    )
+    reranked_retriever = HybridRetriever(
+        vs, bm25, embedder, reranker=reranker, rerank_candidates=args.candidates,
+    )
+    reranked = evaluate(reranked_retriever, questions, args.k, args.budget, engine)
+    reranked["summary"]["reranker"] = reranker.stats()
+
+    b, r = baseline["summary"], reranked["summary"]
+    saved = 1 - r["prompt_tokens_median"] / b["prompt_tokens_median"]
+    print("\n" + "=" * 60)
+    print(f"{'':22}{'baseline':>12}{'rerank':>12}")
+    print(f"{'prompt tokens (p50)':22}{b['prompt_tokens_median']:>12}{r['prompt_tokens_median']:>12}")
+    print(f"{'context support':22}{b['support']:>12.2%}{r['support']:>12.2%}")
+    if engine is not None:
+        print(f"{'answer accuracy':22}{b['answer_acc']:>12.2%}{r['answer_acc']:>12.2%}")
+    print(f"{'retrieve ms (p50)':22}{b['retrieve_ms_median']:>12}{r['retrieve_ms_median']:>12}")
+    print(f"\nPrompt tokens saved: {saved:.1%}")
+    print("=" * 60)
+
+    if args.output:
+        report = {"config": vars(args), "baseline": baseline, "rerank": reranked,
+                  "prompt_tokens_saved": round(saved, 4)}
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"[INFO] Report saved: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Retrieval evaluation — sweep cấu hình retrieval, chất lượng vs latency / dung lượng index.
+
+Nhãn (eval/retrieval_labels.json, dựng từ questions.json + data/raw bằng --build-labels):
+mỗi câu hỏi có gold = các cụm phải cùng xuất hiện, passages = đoạn tài liệu gốc
+chứa chúng. Chunk "đúng" = chunk chứa đủ mọi cụm gold → nhãn không phụ thuộc
+cách chunk, so được mọi chunker với nhau.
+
+Sweep:
+  - chunker: fixed:<size>:<overlap> | sentence_window:<window> | semantic:<threshold>
+  - index:   flat (IndexFlatIP) | hnsw | ivf
+  - weights: trọng số RRF dense:sparse (0 → bỏ retriever đó)
+  - depth:   candidate_factor (mỗi retriever lấy k * depth candidate)
+
+Chỉ số @k: recall (tỉ lệ câu hỏi có chunk đúng trong top-k), MRR, nDCG (gain nhị phân),
+coverage (tỉ lệ câu hỏi mà index có ít nhất 1 chunk đúng — trần của chunker),
+retrieve_ms p50/p95 mỗi query (không tính encode query), index_bytes (FAISS + BM25 + chunks).
+--min-recall: chọn cấu hình rẻ nhất (p50 thấp nhất, rồi index nhỏ nhất) đạt ngưỡng.
+
+Chạy:
+    python -m backend.eval.retrieval_eval --build-labels
+    python -m backend.eval.retrieval_eval --min-recall 0.9 --output retrieval_eval.json
+    python -m backend.eval.retrieval_eval --embedder hashing      # offline, không cần model
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import pickle
+import re
+import sys
+import time
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(ROOT))
+
+import faiss
+
+from backend.config import settings
+from backend.core.bm25_retriever import BM25Retriever
+from backend.core.chunker import get_chunker
+from backend.core.hybrid_retriever import HybridRetriever
+from backend.core.parser import DocumentParser
+from backend.core.vector_store import VectorStore
+from backend.dev.stream_load import percentile
+
+
+QUESTIONS_PATH = Path(__file__).parent / "questions.json"
+LABELS_PATH = Path(__file__).parent / "retrieval_labels.json"
+RAW_DIR = Path(__file__).parent.parent / "data" / "raw"
+
+CHUNKERS = ["fixed:64:16", "fixed:128:32", "fixed:256:50", "fixed:256:0",
+            "sentence_window:1", "sentence_window:2", "semantic:0.5"]
+INDEXES = ["flat", "hnsw", "ivf"]
+WEIGHTS = ["1:0", "0:1", "1:1", "1:1.5", "1:2"]
+DEPTHS = [1, 2, 3, 5]
+
+
+def normalize(text: str) -> str:
+    """So khớp gold: NFC, chữ thường, gộp khoảng trắng (chunker nối từ bằng 1 dấu cách)."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text).lower()).strip()
+
+
+def is_relevant(chunk: str, gold: List[str]) -> bool:
+    chunk = normalize(chunk)
+    return all(normalize(g) in chunk for g in gold)
+
+
+# ─── Nhãn ────────────────────────────────────────────────────
+def parse_raw(raw_dir: Path) -> List[str]:
+    with contextlib.redirect_stdout(io.StringIO()):
+        return DocumentParser().parse_directory(str(raw_dir))
+
+
+def build_labels(questions: List[dict], docs: List[str]) -> List[dict]:
+    """Gắn mỗi câu hỏi với các đoạn gốc chứa đủ gold; câu không tìm thấy → bỏ (có cảnh báo)."""
+    labels = []
+    for q in questions:
+        passages = [d for d in docs if is_relevant(d, q["gold"])]
+        if not passages:
+            print(f"  [WARN] No passage in data/raw contains {q['gold']} — skipped: {q['question']}")
+            continue
+        labels.append({"question": q["question"], "gold": q["gold"], "passages": passages})
+    return labels
+
+
+# ─── Dựng index cho 1 cấu hình ───────────────────────────────
+def make_chunker(spec: str, embedder):
+    name, *params = spec.split(":")
+    if name == "fixed":
+        size, overlap = (int(p) for p in params)
+        return get_chunker("fixed", size=size, overlap=overlap)
+    if name == "sentence_window":
+        return get_chunker("sentence_window", window=int(params[0]))
+    if name == "semantic":
+        return get_chunker("semantic", embedder=embedder, threshold=float(params[0]))
+    raise ValueError(f"Unknown chunker spec '{spec}'")
+
+
+def make_index(kind: str, dim: int, embeddings):
+    """Index FAISS rỗng (đã train nếu cần) cho VectorStore.index."""
+    if kind == "flat":
+        return faiss.IndexFlatIP(dim)
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efSearch = 64
+        return index
+    if kind == "ivf":
+        nlist = max(1, int(math.sqrt(len(embeddings))))
+        index = faiss.IndexIVFFlat(faiss.IndexFlatIP(dim), dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(embeddings.astype("float32"))
+        index.nprobe = max(1, nlist // 4)
+        return index
+    raise ValueError(f"Unknown index type '{kind}' (flat | hnsw | ivf)")
+
+
+def build(chunks: List[str], embeddings, kind: str, dim: int):
+    vs, bm25 = VectorStore(dim=dim), BM25Retriever()
+    vs.index = make_index(kind, dim, embeddings)
+    with contextlib.redirect_stdout(io.StringIO()):
+        vs.add(embeddings, chunks)
+        bm25.build(chunks)
+    index_bytes = (
+        faiss.serialize_index(vs.index).nbytes
+        + len(pickle.dumps(bm25.bm25))
+        + len(pickle.dumps(chunks))
+    )
+    return vs, bm25, index_bytes
+
+
+# ─── Chỉ số ──────────────────────────────────────────────────
+def score(ranked: List[str], gold: List[str], k: int, n_relevant: int) -> Dict[str, float]:
+    hits = [is_relevant(c, gold) for c in ranked[:k]]
+    first = next((i for i, h in enumerate(hits) if h), None)
+    dcg = sum(1 / math.log2(i + 2) for i, h in enumerate(hits) if h)
+    idcg = sum(1 / math.log2(i + 2) for i in range(min(k, n_relevant)))
+    return {
+        "recall": 1.0 if first is not None else 0.0,
+        "mrr": 1 / (first + 1) if first is not None else 0.0,
+        "ndcg": dcg / idcg if idcg else 0.0,
+    }
+
+
+def evaluate(retriever: HybridRetriever, labels, q_embs, n_relevant: List[int], k: int) -> dict:
+    """n_relevant: số chunk đúng của từng câu hỏi trong index (IDCG + coverage)."""
+    totals = {"recall": 0.0, "mrr": 0.0, "ndcg": 0.0}
+    latencies = []
+    for label, q_emb, n in zip(labels, q_embs, n_relevant):
+        t = time.perf_counter()
+        results = retriever.retrieve(label["question"], k=k, q_emb=q_emb)
+        latencies.append((time.perf_counter() - t) * 1000)
+        for name, value in score([c for c, _ in results], label["gold"], k, n).items():
+            totals[name] += value
+    n = len(labels)
+    return {
+        **{f"{name}@{k}": round(v / n, 4) for name, v in totals.items()},
+        "coverage": round(sum(c > 0 for c in n_relevant) / n, 4),
+        "retrieve_ms_p50": round(percentile(latencies, 50), 3),
+        "retrieve_ms_p95": round(percentile(latencies, 95), 3),
+    }
+
+
+def parse_weights(spec: str):
+    dense, sparse = (float(w) for w in spec.split(":"))
+    return dense, sparse
+
+
+def pick(rows: List[dict], metric: str, bar: float) -> Optional[dict]:
+    """Cấu hình rẻ nhất đạt ngưỡng: p50 thấp nhất, rồi index nhỏ nhất."""
+    passing = [r for r in rows if r[metric] >= bar]
+    return min(passing, key=lambda r: (r["retrieve_ms_p50"], r["index_bytes"])) if passing else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep retrieval configurations on labeled questions")
+    parser.add_argument("--questions", default=str(QUESTIONS_PATH))
+    parser.add_argument("--labels", default=str(LABELS_PATH))
+    parser.add_argument("--raw-dir", default=str(RAW_DIR))
+    parser.add_argument("--build-labels", action="store_true", help="Dựng lại file nhãn từ questions + data/raw rồi thoát")
+    parser.add_argument("--chunkers", nargs="+", default=CHUNKERS)
+    parser.add_argument("--indexes", nargs="+", default=INDEXES, choices=INDEXES)
+    parser.add_argument("--weights", nargs="+", default=WEIGHTS, help="dense:sparse")
+    parser.add_argument("--depths", type=int, nargs="+", default=DEPTHS, help="candidate_factor")
+    parser.add_argument("--k", type=int, default=settings.TOP_K)
+    parser.add_argument("--embedder", default=settings.EMBEDDING_MODEL,
+                        help="Tên model sentence-transformers, hoặc 'hashing' (offline, chỉ đo pipeline)")
+    parser.add_argument("--min-recall", type=float, default=0.9, help="Ngưỡng recall@k để chọn cấu hình")
+    parser.add_argument("--top", type=int, default=15, help="Số dòng in ra")
+    parser.add_argument("--output", default=None, help="Ghi report JSON")
+    args = parser.parse_args()
+
+    docs = parse_raw(Path(args.raw_dir))
+    if args.build_labels:
+        questions = json.loads(Path(args.questions).read_text(encoding="utf-8"))
+        labels = build_labels(questions, docs)
+        Path(args.labels).write_text(json.dumps(labels, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"[INFO] {len(labels)}/{len(questions)} questions labeled → {args.labels}")
+        return
+    labels = json.loads(Path(args.labels).read_text(encoding="utf-8"))
+
+    if args.embedder == "hashing":
+        from backend.dev.retrieval_bench import HashingEmbedder
+        embedder = HashingEmbedder()
+    else:
+        from backend.core.embedder import EmbeddingEngine
+        embedder = EmbeddingEngine(args.embedder)
+    q_embs = embedder.encode([l["question"] for l in labels])
+
+    rows = []
+    for spec in args.chunkers:
+        chunks = list(dict.fromkeys(make_chunker(spec, embedder).chunk_many(docs)))  # như indexer
+        if not chunks:
+            print(f"  [WARN] {spec}: no chunks, skipped")
+            continue
+        embeddings = embedder.encode(chunks)
+        n_relevant = [sum(is_relevant(c, l["gold"]) for c in chunks) for l in labels]
+        for kind in args.indexes:
+            vs, bm25, index_bytes = build(chunks, embeddings, kind, embeddings.shape[1])
+            for w in args.weights:
+                for depth in args.depths:
+                    retriever = HybridRetriever(vs, bm25, embedder, weights=parse_weights(w), candidate_factor=depth)
+                    rows.append({
+                        "chunker": spec, "index": kind, "weights": w, "depth": depth,
+                        "chunks": len(chunks), "index_bytes": index_bytes,
+                        **evaluate(retriever, labels, q_embs, n_relevant, args.k),
+                    })
+        print(f"  [INFO] {spec}: {len(chunks)} chunks, {len(args.indexes) * len(args.weights) * len(args.depths)} configs")
+
+    metric = f"recall@{args.k}"
+    rows.sort(key=lambda r: (-r[metric], -r[f"mrr@{args.k}"], r["retrieve_ms_p50"]))
+    best = pick(rows, metric, args.min_recall)
+
+    print("\n" + "=" * 104)
+    print(f"{'chunker':20}{'index':>6}{'w d:s':>8}{'depth':>6}{'chunks':>7}"
+          f"{metric:>11}{'MRR':>7}{'nDCG':>7}{'cover':>7}{'p50 ms':>9}{'p95 ms':>9}{'index KB':>10}")
+    for r in rows[:args.top]:
+        print(f"{r['chunker']:20}{r['index']:>6}{r['weights']:>8}{r['depth']:>6}{r['chunks']:>7}"
+              f"{r[metric]:>11.2%}{r[f'mrr@{args.k}']:>7.3f}{r[f'ndcg@{args.k}']:>7.3f}{r['coverage']:>7.0%}"
+              f"{r['retrieve_ms_p50']:>9.3f}{r['retrieve_ms_p95']:>9.3f}{r['index_bytes'] / 1024:>10.0f}")
+    print("=" * 104)
+    if best:
+        print(f"Cheapest config with {metric} ≥ {args.min_recall:.0%}: chunker={best['chunker']} "
+              f"index={best['index']} weights={best['weights']} depth={best['depth']} "
+              f"({best[metric]:.2%}, p50 {best['retrieve_ms_p50']}ms, {best['index_bytes'] / 1024:.0f} KB)")
+    else:
+        print(f"No config reaches {metric} ≥ {args.min_recall:.0%}")
+
+    if args.output:
+        report = {"config": vars(args), "questions": len(labels), "best": best, "rows": rows}
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"[INFO] Report saved: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
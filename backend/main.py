@@ -1,31 +1,48 @@
 """FastAPI application — entry point."""
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from pathlib import Path
+from typing import Optional
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
 from .api.routes import router
 from .config import settings
-from .core.bm25_retriever import BM25Retriever
-from .core.chat_engine import ChatEngine
-from .core.database import init_db
-from .core.embedder import EmbeddingEngine
-from .core.hybrid_retriever import HybridRetriever
-from .core.vector_store import VectorStore
+from .core.archive import ConversationArchiver, archive_loop
+from .core.database import checkpoint_loop, close_db, init_db
+from .core.session_cache import HistoryDrops, SessionCache
+from .core.write_behind import MessageWriter
+from .core.llm_providers import OllamaProvider, ThreadBridge
+from .core.metrics import render as render_metrics
+from .core.startup import StartupTracker
 
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """Load AI models khi server start — 1 lần duy nhất."""
-    # 1. Init database
-    init_db()
+def load_components(app: FastAPI, tracker: StartupTracker) -> None:
+    """
+    Load model + indexes — chạy trong background thread.
+    Import các thư viện nặng (torch, faiss, google-generativeai) ngay tại đây
+    thay vì ở module level để server bind cổng tức thì.
+    """
+    with tracker.phase("import_libraries"):
+        from .core.bm25_retriever import BM25Retriever
+        from .core.admission import AdmissionController
+        from .core.chat_engine import ChatEngine
+        from .core.embedder import EmbeddingEngine
+        from .core.faq_router import FAQRouter
+        from .core.hybrid_retriever import HybridRetriever
+        from .core.llm_router import LLMRouter
+        from .core.reranker import CrossEncoderReranker
+        from .core.semantic_cache import SemanticCache
+        from .core.table_index import TableIndex
+        from .core.vector_store import VectorStore
 
-    # 2. Load embedding model (chạy local)
-    print("[INFO] Loading embedding model...")
-    embedder = EmbeddingEngine(settings.EMBEDDING_MODEL)
+    # 1. Load embedding model (chạy local)
+    with tracker.phase("load_embedder"):
+        embedder = EmbeddingEngine(settings.EMBEDDING_MODEL)
 
-    # 3. Load indexes (nếu đã build)
+    # 2. Load indexes (nếu đã build)
     vs = VectorStore(dim=768)
     bm25 = BM25Retriever()
 
@@ -34,46 +51,223 @@ async def lifespan(app: FastAPI):
     processed_dir = base_dir / "data" / "processed"
 
     if (processed_dir / "faiss.index").exists():
-        vs.load()
-        bm25.load()
+        with tracker.phase("load_faiss"):
+            vs.load()
+        with tracker.phase("load_bm25"):
+            bm25.load()
         print("[SUCCESS] Indexes loaded from disk")
     else:
         print("[WARN] Indexes chưa được build.")
         print("   Chạy: python -m backend.core.indexer")
         print("   Hoặc upload file qua POST /api/ingest")
 
-    # 4. Khởi tạo các AI components
-    retriever = HybridRetriever(vs, bm25, embedder)
+    reranker = None
+    if settings.RERANKER_ENABLED:
+        with tracker.phase("load_reranker"):
+            reranker = CrossEncoderReranker(
+                settings.RERANKER_MODEL,
+                top_n=settings.RERANKER_TOP_N,
+                min_score=settings.RERANKER_MIN_SCORE,
+                latency_budget_ms=settings.RERANKER_LATENCY_BUDGET_MS,
+            )
+
+    tables = None
+    if settings.TABLE_FAST_PATH_ENABLED:
+        with tracker.phase("load_tables"):
+            tables = TableIndex.from_directory(base_dir / "data" / "raw")
 
-    chat_engine = None
-    provider = settings.LLM_PROVIDER.lower()
+    faq = None
+    faq_path = base_dir / settings.FAQ_PATH
+    if settings.FAQ_ENABLED and faq_path.exists():
+        with tracker.phase("load_faq"):
+            faq = FAQRouter(
+                embedder, faq_path,
+                threshold=settings.FAQ_THRESHOLD,
+                margin=settings.FAQ_MARGIN,
+                reload_interval=settings.FAQ_RELOAD_INTERVAL,
+            )
 
-    if provider == "gemini":
-        chat_engine = ChatEngine(
-            retriever, 
-            api_key=settings.GEMINI_API_KEY,
-            provider="gemini",
-            model_name="gemini-1.5-flash-latest"
+    # 3. Khởi tạo các AI components
+    with tracker.phase("init_engine"):
+        retriever = HybridRetriever(
+            vs, bm25, embedder,
+            reranker=reranker,
+            rerank_candidates=settings.RERANKER_CANDIDATES,
+            weights=(settings.RRF_DENSE_WEIGHT, settings.RRF_SPARSE_WEIGHT),
+            candidate_factor=settings.RETRIEVAL_CANDIDATE_FACTOR,
         )
-        if settings.GEMINI_API_KEY:
-            print("[SUCCESS] ChatEngine ready (GEMINI)")
-        else:
-            print("[WARN] GEMINI_API_KEY missing. Please configure in .env or via UI.")
-    elif provider == "ollama":
-        chat_engine = ChatEngine(
-            retriever,
-            provider="ollama",
-            model_name=settings.OLLAMA_MODEL
+
+        cache = None
+        if settings.SEMANTIC_CACHE_ENABLED:
+            cache = SemanticCache(
+                threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+                ttl=settings.SEMANTIC_CACHE_TTL,
+                max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+                max_bytes=settings.SEMANTIC_CACHE_MAX_BYTES,
+            )
+
+        chat_engine = None
+        provider = settings.LLM_PROVIDER.lower()
+        engine_kwargs = dict(
+            cache=cache,
+            token_budgets=settings.CONTEXT_TOKEN_BUDGETS,
+            ollama=app.state.ollama,
+            bridge=app.state.llm_threads,
+            gemini_endpoint=settings.GEMINI_API_ENDPOINT,
+            gemini_transport=settings.GEMINI_TRANSPORT,
+            client_pool_size=settings.LLM_CLIENT_POOL_SIZE,
+            client_idle_ttl=settings.LLM_CLIENT_IDLE_TTL,
+            router=LLMRouter(
+                hedging=settings.LLM_HEDGE_ENABLED,
+                hedge_quantile=settings.LLM_HEDGE_QUANTILE,
+                min_delay_ms=settings.LLM_HEDGE_MIN_DELAY_MS,
+                max_delay_ms=settings.LLM_HEDGE_MAX_DELAY_MS,
+                default_delay_ms=settings.LLM_HEDGE_DEFAULT_DELAY_MS,
+            ),
+            fallbacks=settings.LLM_FALLBACKS,
+            single_flight=settings.SINGLE_FLIGHT_ENABLED,
+            tables=tables,
+            faq=faq,
+            summaries=settings.CONVERSATION_SUMMARY_ENABLED,
+            summary_max_tokens=settings.CONVERSATION_SUMMARY_MAX_TOKENS,
+            summary_keep_messages=settings.CONVERSATION_SUMMARY_KEEP_MESSAGES,
+            session_cache=app.state.sessions,
+            admission=AdmissionController(
+                limits=settings.LLM_CONCURRENCY,
+                max_queue=settings.LLM_QUEUE_SIZE,
+                queue_timeout=settings.LLM_QUEUE_TIMEOUT,
+            ),
         )
-        print(f"[SUCCESS] ChatEngine ready (OLLAMA: {settings.OLLAMA_MODEL})")
 
-    app.state.chat_engine = chat_engine
+        if provider == "gemini":
+            chat_engine = ChatEngine(
+                retriever, 
+                api_key=settings.GEMINI_API_KEY,
+                provider="gemini",
+                model_name="gemini-1.5-flash-latest",
+                **engine_kwargs,
+            )
+            if settings.GEMINI_API_KEY:
+                print("[SUCCESS] ChatEngine ready (GEMINI)")
+            else:
+                print("[WARN] GEMINI_API_KEY missing. Please configure in .env or via UI.")
+        elif provider == "ollama":
+            chat_engine = ChatEngine(
+                retriever,
+                api_key=settings.GEMINI_API_KEY,
+                provider="ollama",
+                model_name=settings.OLLAMA_MODEL,
+                **engine_kwargs,
+            )
+            print(f"[SUCCESS] ChatEngine ready (OLLAMA: {settings.OLLAMA_MODEL})")
+
     app.state.retriever = retriever
     app.state.embedder = embedder
+    app.state.chat_engine = chat_engine
+
+
+async def _background_startup(app: FastAPI, tracker: StartupTracker) -> None:
+    try:
+        await asyncio.to_thread(load_components, app, tracker)
+        tracker.mark_ready()
+        print(f"[SUCCESS] Startup complete ({tracker.ready_after:.2f}s)")
+    except Exception as e:
+        tracker.mark_failed(e)
+        print(f"[ERROR] Startup failed: {e}")
+
+
+async def _cancel(task: Optional[asyncio.Task]) -> None:
+    """Huỷ task nền (nếu còn chạy) và chờ nó kết thúc hẳn."""
+    if task is None:
+        return
+    if not task.done():
+        task.cancel()
+    with suppress(asyncio.CancelledError):
+        await task
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Server bind cổng ngay; model + indexes load ở background.
+    /api/health/live trả lời tức thì, /api/health/ready → 503 cho đến khi load xong.
+    """
+    tracker = StartupTracker()
+    app.state.startup = tracker
+    app.state.chat_engine = None
+
+    # 1. Init database (nhẹ, chờ xong trước khi nhận request)
+    with tracker.phase("init_db"):
+        await init_db()
+    # Cửa sổ hội thoại nóng trong RAM (write-through) — lượt chat không đọc DB
+    # Đếm tin chưa tóm tắt bị bỏ khỏi prompt (có / không có session cache)
+    app.state.history_drops = HistoryDrops()
+    app.state.sessions = SessionCache(
+        max_bytes=settings.SESSION_CACHE_MAX_BYTES,
+        window=settings.SESSION_CACHE_WINDOW,
+        drops=app.state.history_drops,
+    ) if settings.SESSION_CACHE_ENABLED else None
+    # Writer nền: gom ghi message / conversation thành group commit
+    app.state.writer = MessageWriter(
+        durability=settings.DB_WRITE_DURABILITY,
+        flush_interval=settings.DB_FLUSH_INTERVAL_MS / 1000,
+        max_batch=settings.DB_WRITE_BATCH,
+        max_queue=settings.DB_WRITE_QUEUE,
+        sessions=app.state.sessions,
+    )
+    if app.state.sessions is not None:
+        app.state.sessions.has_pending = app.state.writer.has_pending
+    app.state.writer.start()
+    app.state.checkpointer = (
+        asyncio.create_task(checkpoint_loop(settings.DB_CHECKPOINT_INTERVAL))
+        if settings.DB_CHECKPOINT_INTERVAL > 0 else None
+    )
+    # Retention: đọc lại archive luôn bật, job định kỳ theo ARCHIVE_ENABLED
+    app.state.archiver = ConversationArchiver(
+        Path(__file__).parent / settings.ARCHIVE_DIR,
+        retention_days=settings.ARCHIVE_RETENTION_DAYS,
+        batch=settings.ARCHIVE_BATCH,
+        sessions=app.state.sessions,
+        has_pending=app.state.writer.has_pending,
+    )
+    app.state.archive_task = (
+        asyncio.create_task(archive_loop(app.state.archiver, settings.ARCHIVE_INTERVAL))
+        if settings.ARCHIVE_ENABLED else None
+    )
+
+    # 2. HTTP client dùng chung cho Ollama (keep-alive + pool limits)
+    app.state.ollama = OllamaProvider(
+        settings.OLLAMA_BASE_URL,
+        max_connections=settings.OLLAMA_MAX_CONNECTIONS,
+        max_keepalive=settings.OLLAMA_MAX_KEEPALIVE,
+        connect_timeout=settings.OLLAMA_CONNECT_TIMEOUT,
+        read_timeout=settings.OLLAMA_READ_TIMEOUT,
+        max_retries=settings.OLLAMA_MAX_RETRIES,
+    )
+
+    # Thread pool cho Gemini SDK (blocking) — stream không chặn event loop
+    app.state.llm_threads = ThreadBridge(settings.LLM_THREADS)
+
+    # 3. Load AI components ở background
+    print("[INFO] Loading embedding model + indexes in background...")
+    app.state.startup_task = asyncio.create_task(_background_startup(app, tracker))
 
     yield
 
     print("[INFO] Shutting down...")
+    # Tắt khi model / index còn đang load: huỷ và chờ task (thread load không
+    # ngắt được giữa chừng, nhưng task không bị bỏ lại ở trạng thái pending)
+    await _cancel(app.state.startup_task)
+    await app.state.ollama.aclose()
+    if app.state.chat_engine is not None:
+        app.state.chat_engine.clients.close()  # đóng channel gRPC của client Gemini
+    app.state.llm_threads.shutdown()
+    # Job nền dùng engine DB: chờ batch archive / checkpoint đang chạy dừng hẳn
+    # (đóng transaction, trả connection) trước khi drain writer và dispose engine
+    await _cancel(app.state.archive_task)
+    await _cancel(app.state.checkpointer)
+    await app.state.writer.drain()  # ghi hết queue trước khi đóng DB
+    await close_db()
 
 
 app = FastAPI(
@@ -102,4 +296,12 @@ def root():
         "app": "Chatbot Tư Vấn Tuyển Sinh PTIT",
         "docs": "/docs",
         "health": "/api/health",
+        "ready": "/api/health/ready",
+        "metrics": "/metrics",
     }
+
+
+@app.get("/metrics", tags=["Root"], response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Prometheus scrape endpoint (text format 0.0.4)."""
+    return PlainTextResponse(render_metrics(app.state), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,3 +1,4 @@
+import asyncio
 import os
 import sys
 from pathlib import Path
@@ -53,7 +54,7 @@ def test_chat():
         print(f"\nUser: {q}")
         print("Bot: Thinking...", end="", flush=True)
         
-        result = chat_engine.chat(q)
+        result = asyncio.run(chat_engine.chat(q))
         
         print("\r" + " "*20 + "\r", end="") # Clear line
         print(f"Bot: {result['answer']}")
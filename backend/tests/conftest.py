@@ -0,0 +1,93 @@
+"""Fixture dùng chung: DB SQLite tạm (schema hiện tại hoặc schema bản đầu)."""
+import asyncio
+import sqlite3
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from backend.core.database import Base, _migrate
+from backend.core.message_search import ensure_search_index
+
+# Schema của bản đầu tiên (trước rolling summary, source_ids, index, FTS)
+BASELINE_DDL = [
+    """CREATE TABLE conversations (
+        id VARCHAR NOT NULL PRIMARY KEY,
+        created_at DATETIME,
+        title VARCHAR
+    )""",
+    """CREATE TABLE messages (
+        id VARCHAR NOT NULL PRIMARY KEY,
+        conversation_id VARCHAR NOT NULL,
+        role VARCHAR NOT NULL,
+        content TEXT NOT NULL,
+        sources TEXT,
+        created_at DATETIME
+    )""",
+]
+
+START = datetime(2025, 6, 1, 8, 0, 0)
+
+
+def init_schema(path: Path) -> None:
+    """Như init_db(): create_all + _migrate + index FTS, trên engine đồng bộ."""
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        Base.metadata.create_all(conn)
+        _migrate(conn)
+        ensure_search_index(conn)
+    engine.dispose()
+
+
+def insert_messages(path: Path, rows) -> None:
+    """
+    rows: (conversation_id, role, content, sources_json, created_at).
+    created_at ghi đúng định dạng của SQLAlchemy (có micro giây) — cursor so sánh chuỗi.
+    """
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO messages (id, conversation_id, role, content, sources, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        ((str(uuid.uuid4()), cid, role, content, sources, ts.isoformat(" ", "microseconds")) for cid, role, content, sources, ts in rows),
+    )
+    conn.commit()
+    conn.close()
+
+
+def at(seconds: float) -> datetime:
+    return START + timedelta(seconds=seconds)
+
+
+@pytest.fixture
+def baseline_db(tmp_path) -> Path:
+    path = tmp_path / "baseline.db"
+    conn = sqlite3.connect(path)
+    for ddl in BASELINE_DDL:
+        conn.execute(ddl)
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def db_path(tmp_path) -> Path:
+    path = tmp_path / "chatbot.db"
+    init_schema(path)
+    return path
+
+
+@pytest.fixture
+def run_db(db_path):
+    """run_db(fn): chạy coroutine fn(AsyncSession) trên DB tạm, trả kết quả."""
+    def run(fn):
+        async def main():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+            try:
+                async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+                    return await fn(db)
+            finally:
+                await engine.dispose()
+        return asyncio.run(main())
+    return run
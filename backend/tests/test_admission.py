@@ -0,0 +1,111 @@
+"""Admission control: giới hạn slot, hàng đợi ưu tiên, 429/503 + Retry-After."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.api.routes import router
+from backend.core.admission import PRIORITY_HIGH, PRIORITY_NORMAL, AdmissionController, Overloaded
+from backend.core.chat_engine import ChatEngine
+from backend.core.database import get_db
+from backend.core.session_cache import HistoryDrops, SessionCache
+
+
+def test_high_priority_waiters_are_served_first():
+    async def main():
+        admission = AdmissionController(limits={"ollama": 1}, queue_timeout=5.0)
+        held = await admission.acquire("ollama")
+        order = []
+
+        async def request(name, priority):
+            slot = await admission.acquire("ollama", priority)
+            order.append(name)
+            slot.release()
+
+        tasks = [asyncio.ensure_future(request("normal", PRIORITY_NORMAL))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(request("high", PRIORITY_HIGH)))
+        await asyncio.sleep(0)
+        held.release()
+        await asyncio.gather(*tasks)
+        return order, admission.stats()["ollama"]
+
+    order, stats = asyncio.run(main())
+    assert order == ["high", "normal"]
+    assert stats["active"] == 0 and stats["queue_depth"] == 0
+
+
+def test_queue_full_is_429_and_deadline_is_503():
+    async def main():
+        full = AdmissionController(limits={"ollama": 1}, max_queue=0)
+        await full.acquire("ollama")
+        with pytest.raises(Overloaded) as queue_full:
+            await full.acquire("ollama")
+
+        slow = AdmissionController(limits={"ollama": 1}, max_queue=8, queue_timeout=0.05)
+        held = await slow.acquire("ollama")
+        slow.gate("ollama")._service_time = 0.01  # ước lượng chờ ngắn → được xếp hàng
+        with pytest.raises(Overloaded) as deadline:
+            await slow.acquire("ollama")
+        held.release()
+        return queue_full.value, deadline.value, slow.stats()["ollama"]
+
+    queue_full, deadline, stats = asyncio.run(main())
+    assert (queue_full.status_code, queue_full.retry_after) == (429, 1)
+    assert deadline.status_code == 503 and deadline.retry_after >= 1
+    assert stats["dropped_deadline"] == 1 and stats["queue_depth"] == 0 and stats["active"] == 0
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def main():
+        admission = AdmissionController(limits={"ollama": 1}, queue_timeout=5.0)
+        held = await admission.acquire("ollama")
+        waiter = asyncio.ensure_future(admission.acquire("ollama"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        held.release()
+        again = await admission.acquire("ollama")
+        again.release()
+        return admission.stats()["ollama"]
+
+    stats = asyncio.run(main())
+    assert stats["active"] == 0 and stats["queue_depth"] == 0
+
+
+# ─── /api/chat/stream ────────────────────────────────────────
+class NoDB:
+    async def close(self):
+        pass
+
+
+def make_client(admission: AdmissionController) -> TestClient:
+    async def aretrieve(query, k=5, q_emb=None):
+        return [("Học phí CNTT 30 triệu/năm.", 0.9)]
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    app.state.chat_engine = ChatEngine(
+        SimpleNamespace(aretrieve=aretrieve, index_version="v1"),
+        provider="ollama", model_name="m", summaries=False, admission=admission,
+    )
+    app.state.history_drops = HistoryDrops()
+    app.state.sessions = SessionCache()
+    app.state.sessions.create("c1")
+    app.state.writer = None   # quá tải → trả lỗi trước khi ghi gì
+    app.dependency_overrides[get_db] = lambda: NoDB()
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("max_queue,queue_timeout,status", [(0, 10.0, 429), (8, 0.5, 503)])
+def test_stream_rejected_with_retry_after_before_opening_sse(max_queue, queue_timeout, status):
+    admission = AdmissionController(limits={"ollama": 1}, max_queue=max_queue, queue_timeout=queue_timeout)
+    asyncio.run(admission.acquire("ollama"))  # slot duy nhất đang bận
+
+    response = make_client(admission).post("/api/chat/stream", json={"query": "học phí", "conversation_id": "c1"})
+
+    assert response.status_code == status
+    assert int(response.headers["Retry-After"]) >= 1
+    assert not response.headers["content-type"].startswith("text/event-stream")
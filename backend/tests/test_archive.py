@@ -0,0 +1,89 @@
+"""Archive: chuyển hội thoại cũ ra file, restore khi có tin mới, huỷ job nền sạch khi shutdown."""
+import asyncio
+import sqlite3
+from datetime import timedelta
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from backend.core.archive import ConversationArchiver, archive_loop
+from backend.main import _cancel
+from backend.tests.conftest import START, at, insert_messages
+
+
+def add_conversation(path, cid: str, created_at) -> None:
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "INSERT INTO conversations (id, created_at, title, summary, summary_upto) VALUES (?, ?, ?, ?, ?)",
+        (cid, created_at.isoformat(" ", "microseconds"), f"title {cid}", "tóm tắt", 2),
+    )
+    conn.commit()
+    conn.close()
+
+
+def counts(path) -> dict:
+    conn = sqlite3.connect(path)
+    row = {
+        table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        for table in ("conversations", "messages", "archived_conversations")
+    }
+    conn.close()
+    return row
+
+
+def test_archive_then_restore_round_trip(db_path, tmp_path):
+    add_conversation(db_path, "old", at(0))
+    add_conversation(db_path, "recent", at(0))
+    insert_messages(db_path, [("old", "user", f"cũ {i}", "", at(i)) for i in range(4)])
+    insert_messages(db_path, [("recent", "user", "mới", "", START + timedelta(days=55))])
+    now = START + timedelta(days=60)
+
+    async def main():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+        archiver = ConversationArchiver(
+            tmp_path / "archive", retention_days=30,
+            session_factory=sessions, read_session_factory=sessions, engine=engine,
+        )
+        try:
+            first = await archiver.run_once(now)
+            after_archive = counts(db_path)
+            record = await archiver.load("old")
+            restored = await archiver.restore("old")
+            after_restore = counts(db_path)
+            # Vừa restore → lượt job kế tiếp không archive lại ngay
+            second = await archiver.run_once(now)
+            return first, after_archive, record, restored, after_restore, second
+        finally:
+            await engine.dispose()
+
+    first, after_archive, record, restored, after_restore, second = asyncio.run(main())
+    assert first["archived"] == 1
+    assert after_archive == {"conversations": 1, "messages": 1, "archived_conversations": 1}
+    assert [m["content"] for m in record["messages"]] == [f"cũ {i}" for i in range(4)]
+    assert record["summary"] == "tóm tắt"
+    assert restored
+    assert after_restore == {"conversations": 2, "messages": 5, "archived_conversations": 0}
+    assert second["archived"] == 0
+
+
+def test_shutdown_waits_for_running_archive_job():
+    events = []
+
+    class SlowArchiver:
+        async def run_once(self):
+            events.append("start")
+            try:
+                await asyncio.sleep(10)
+            finally:
+                await asyncio.sleep(0.01)  # vd đóng transaction / trả connection
+                events.append("cleaned up")
+
+    async def main():
+        task = asyncio.create_task(archive_loop(SlowArchiver(), interval=0))
+        await asyncio.sleep(0.01)
+        await _cancel(task)
+        events.append("close_db")
+        await _cancel(None)
+
+    asyncio.run(main())
+    assert events == ["start", "cleaned up", "close_db"]
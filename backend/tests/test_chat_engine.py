@@ -0,0 +1,52 @@
+"""ChatEngine: fast path không chặn event loop."""
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from backend.core.chat_engine import ChatEngine
+
+
+class SlowEmbedder:
+    """encode() giả lập forward pass ~200ms, ghi lại thread đã chạy."""
+
+    def __init__(self):
+        self.threads = []
+
+    def encode(self, texts):
+        self.threads.append(threading.current_thread())
+        time.sleep(0.2)
+        return np.ones(4, dtype=np.float32)
+
+
+@pytest.fixture
+def engine():
+    embedder = SlowEmbedder()
+    engine = ChatEngine(SimpleNamespace(embedder=embedder), provider="ollama", model_name="m", summaries=False)
+    engine.faq = SimpleNamespace(route=lambda q_emb: None)
+    return engine
+
+
+def test_fast_path_encodes_off_the_event_loop(engine):
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.ensure_future(ticker())
+        result = await engine._fast_path("học phí ngành CNTT")
+        task.cancel()
+        return result, ticks
+
+    (answer, sources, fast_path, q_emb), ticks = asyncio.run(main())
+    assert fast_path is None and q_emb is not None
+    assert engine.retriever.embedder.threads[0] is not threading.main_thread()
+    # Loop vẫn chạy trong lúc encode (~200ms → ~20 tick)
+    assert ticks >= 10
@@ -0,0 +1,88 @@
+"""ContextPacker / PromptBuilder.build_packed: prompt không vượt ngân sách, sources = chunk trong prompt."""
+import asyncio
+import random
+from types import SimpleNamespace
+
+from backend.core.chat_engine import ChatEngine, PromptBuilder
+from backend.core.context_packer import ContextPacker, TokenCounter
+
+WORDS = "điểm chuẩn học phí ngành công nghệ thông tin cơ sở Hà Nội TP.HCM xét tuyển năm 2024 là 26,5".split()
+
+
+def sentence(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def test_prompt_never_exceeds_budget():
+    builder = PromptBuilder()
+    count = builder.packer.counter.count
+    for seed in range(300):
+        rng = random.Random(seed)
+        query = sentence(rng, rng.randint(3, 20))
+        results = [(sentence(rng, rng.randint(5, 400)), rng.random()) for _ in range(rng.randint(0, 8))]
+        history = [
+            {"role": "user" if i % 2 == 0 else "assistant", "content": sentence(rng, rng.randint(1, 120))}
+            for i in range(rng.randint(0, 8))
+        ]
+        summary = sentence(rng, rng.randint(0, 60))
+        budget = rng.randint(200, 2500)
+
+        prompt, usage, chunks = builder.build_packed(query, results, history, budget, summary)
+
+        # Chỉ vượt được khi riêng phần cố định (system + câu hỏi + summary) đã vượt
+        if usage["fixed"] <= budget:
+            assert count(prompt) <= budget, seed
+        assert usage["chunks_used"] == len(chunks)
+        assert all(chunk in prompt for chunk in chunks)
+
+
+def test_top_chunk_truncated_to_remaining_room():
+    packer = ContextPacker(TokenCounter(), min_chunk_tokens=8)
+    long_chunk = " ".join(["học phí"] * 200)
+    packed = packer.pack([(long_chunk, 1.0)], [], budget=120, fixed_tokens=20, frame_tokens=lambda i: 5)
+
+    assert len(packed.chunks) == 1 and packed.chunks[0].endswith("…")
+    assert packed.usage["context"] <= 100
+    assert packed.usage["total"] <= 120
+
+
+def test_top_chunk_dropped_when_room_below_minimum():
+    packer = ContextPacker(TokenCounter(), min_chunk_tokens=64)
+    packed = packer.pack([(" ".join(["học phí"] * 200), 1.0)], [], budget=60, fixed_tokens=20)
+    assert packed.chunks == []
+    assert packed.usage["chunks_dropped"] == 1
+
+
+# ─── sources theo chunk đã đóng gói ──────────────────────────
+class EchoRouter:
+    async def stream(self, prompt, targets):
+        yield "Học phí ngành CNTT là 30 triệu/năm."
+
+
+def test_sources_are_the_chunks_the_model_saw():
+    long_top = "Chunk dài: " + " ".join(["điểm chuẩn"] * 2000)
+    short = ["Học phí CNTT 30 triệu/năm.", "Chỉ tiêu CNTT 2024: 500.", "KTX cơ sở Hà Đông.", "Hotline 024.3756.2186."]
+    results = [(long_top, 0.9)] + [(c, 0.8 - i / 10) for i, c in enumerate(short)]
+
+    async def aretrieve(query, k=5, q_emb=None):
+        return results
+
+    engine = ChatEngine(
+        SimpleNamespace(aretrieve=aretrieve, index_version="v1"),
+        provider="ollama", model_name="m", summaries=False, router=EchoRouter(),
+        token_budgets={"ollama": 800},
+    )
+
+    async def main():
+        events = [e async for e in engine.stream_chat("học phí CNTT")]
+        return events, await engine.chat("học phí CNTT bao nhiêu")
+
+    events, reply = asyncio.run(main())
+    streamed = events[0]["sources"]
+    # Chunk top-1 quá dài bị cắt cho vừa phần còn lại của ngân sách → các chunk sau
+    # không còn chỗ: nguồn trích dẫn chỉ là bản đã cắt, không phải 3 chunk retrieval đầu
+    assert len(streamed) == 1
+    assert streamed[0] != long_top and streamed[0].endswith("…")
+    assert long_top.startswith(streamed[0][:-2])
+    assert len(reply["sources"]) == 1 and reply["sources"][0].endswith("…")
+    assert events[0]["token_usage"]["total"] <= 800
@@ -0,0 +1,73 @@
+"""Nâng cấp schema (_migrate) trên DB bản đầu + keyset pagination của history."""
+import sqlite3
+
+from backend.core.database import get_messages_page
+from backend.tests.conftest import at, init_schema, insert_messages
+
+
+def columns(path, table):
+    conn = sqlite3.connect(path)
+    cols = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    conn.close()
+    return cols
+
+
+def indexes(path, table):
+    conn = sqlite3.connect(path)
+    names = {row[1] for row in conn.execute(f"PRAGMA index_list({table})")}
+    conn.close()
+    return names
+
+
+def test_migrate_upgrades_baseline_schema(baseline_db):
+    insert_messages(baseline_db, [("c1", "user", "Học phí ngành CNTT?", '["chunk"]', at(0))])
+    conn = sqlite3.connect(baseline_db)
+    conn.execute("INSERT INTO conversations (id, created_at, title) VALUES ('c1', '2025-06-01 08:00:00', 'cũ')")
+    conn.commit()
+    conn.close()
+
+    init_schema(baseline_db)
+
+    assert {"summary", "summary_upto"} <= columns(baseline_db, "conversations")
+    assert {"source_ids", "index_version"} <= columns(baseline_db, "messages")
+    assert "ix_messages_conversation_created" in indexes(baseline_db, "messages")
+    assert "ix_conversations_created_at" in indexes(baseline_db, "conversations")
+
+    conn = sqlite3.connect(baseline_db)
+    assert conn.execute("SELECT summary, summary_upto FROM conversations").fetchone() == ("", 0)
+    assert conn.execute("SELECT sources, source_ids, index_version FROM messages").fetchone() == ('["chunk"]', "", "")
+    # Tin nhắn cũ được backfill vào index tìm kiếm
+    assert conn.execute("SELECT count(*) FROM messages_fts WHERE messages_fts MATCH 'hoc phi'").fetchone() == (1,)
+    conn.close()
+
+
+def test_migrate_is_idempotent(baseline_db):
+    init_schema(baseline_db)
+    before = columns(baseline_db, "messages"), indexes(baseline_db, "messages")
+    init_schema(baseline_db)
+    assert (columns(baseline_db, "messages"), indexes(baseline_db, "messages")) == before
+
+
+def test_messages_page_walks_history_once(db_path, run_db):
+    # 2 tin cùng created_at ở mỗi mốc: cursor phải phân giải hoà bằng id
+    insert_messages(db_path, [
+        ("c1", role, f"tin {i}-{role}", "", at(i))
+        for i in range(23) for role in ("user", "assistant")
+    ])
+    insert_messages(db_path, [("c2", "user", "hội thoại khác", "", at(5))])
+
+    async def walk(db):
+        pages, cursor = [], None
+        while True:
+            page, cursor = await get_messages_page(db, "c1", limit=5, before=cursor)
+            pages.append(page)
+            if cursor is None:
+                return pages
+
+    pages = run_db(walk)
+    assert all(len(p) == 5 for p in pages[:-1]) and len(pages[-1]) == 46 % 5
+    history = [m for page in reversed(pages) for m in page]  # trang đầu = mới nhất
+    assert len(history) == 46
+    assert len({m["id"] for m in history}) == 46
+    keys = [(m["created_at"], m["id"]) for m in history]
+    assert keys == sorted(keys)
@@ -0,0 +1,59 @@
+"""FAQRouter: threshold + margin giữa các intent, reload lỗi giữ bản cũ."""
+import json
+
+import numpy as np
+
+from backend.core.faq_router import FAQRouter
+
+VECTORS = {
+    "hotline là gì": [1.0, 0.0, 0.0],
+    "số điện thoại tư vấn": [0.96, 0.28, 0.0],
+    "ký túc xá ở đâu": [0.0, 1.0, 0.0],
+    "kí túc xá": [0.0, 0.0, 1.0],
+}
+
+
+class FakeEmbedder:
+    def encode(self, texts):
+        return np.asarray([VECTORS[t] for t in texts], dtype=np.float32)
+
+
+def write_faq(path, intents) -> None:
+    path.write_text(json.dumps({"intents": intents}, ensure_ascii=False), encoding="utf-8")
+
+
+def make_router(tmp_path) -> FAQRouter:
+    path = tmp_path / "faq.json"
+    write_faq(path, [
+        {"id": "hotline", "exemplars": ["hotline là gì", "số điện thoại tư vấn"],
+         "answer": "Hotline: 024.3756.2186", "sources": ["faq.json#hotline"]},
+        {"id": "dorm", "exemplars": ["ký túc xá ở đâu", "kí túc xá"], "answer": "KTX cơ sở Hà Đông"},
+        {"id": "empty", "exemplars": [], "answer": "bỏ qua"},
+    ])
+    return FAQRouter(FakeEmbedder(), path, threshold=0.8, margin=0.1, reload_interval=3600)
+
+
+def q(*values) -> np.ndarray:
+    v = np.asarray(values, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+def test_routes_confident_match_only(tmp_path):
+    router = make_router(tmp_path)
+    hit = router.route(q(1, 0.05, 0))
+    assert (hit.intent, hit.answer, hit.sources) == ("hotline", "Hotline: 024.3756.2186", ["faq.json#hotline"])
+
+    assert router.route(q(1, 1, 1)) is None     # dưới threshold
+    assert router.route(q(0.7, 1, 0)) is None   # lưng chừng hotline / ký túc xá → thiếu margin
+    stats = router.stats()
+    assert (stats["intents"], stats["exemplars"]) == (2, 4)
+    assert (stats["lookups"], stats["hits"], stats["near_misses"]) == (3, 1, 1)
+    assert stats["by_intent"] == {"hotline": 1, "dorm": 0}
+
+
+def test_failed_reload_keeps_previous_intents(tmp_path):
+    router = make_router(tmp_path)
+    (tmp_path / "faq.json").write_text("{không phải json", encoding="utf-8")
+    assert not router.reload()
+    assert router.stats()["reload_errors"] == 1 and router.version == 1
+    assert router.route(q(0, 1, 0)).intent == "dorm"
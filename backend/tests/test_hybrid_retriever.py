@@ -0,0 +1,30 @@
+"""HybridRetriever.aretrieve: toàn bộ pipeline retrieval chạy ngoài event loop."""
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+
+from backend.core.hybrid_retriever import HybridRetriever
+
+
+def test_aretrieve_runs_embed_search_and_fusion_in_a_worker_thread():
+    threads = {}
+
+    def record(stage, result):
+        def fn(*args, **kwargs):
+            threads[stage] = threading.current_thread()
+            return result
+        return fn
+
+    retriever = HybridRetriever(
+        SimpleNamespace(search=record("faiss", [("a", 0.9), ("b", 0.5)])),
+        SimpleNamespace(search=record("bm25", [("b", 7.0), ("c", 3.0)])),
+        SimpleNamespace(encode=record("embed", np.ones(4, dtype=np.float32))),
+    )
+
+    results = asyncio.run(retriever.aretrieve("học phí", k=2))
+
+    assert [chunk for chunk, _ in results] == ["b", "c"]  # BM25 nặng hơn (1.5)
+    assert set(threads) == {"embed", "faiss", "bm25"}
+    assert all(t is not threading.main_thread() for t in threads.values())
@@ -0,0 +1,101 @@
+"""ProviderPool: build client ngoài lock, đóng client bị evict / hết hạn / khi shutdown."""
+import asyncio
+import threading
+import time
+
+from backend.core.llm_providers import ProviderPool
+
+
+class FakeClient:
+    def __init__(self, name: str):
+        self.name = name
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class Factory:
+    def __init__(self, pool_ref=None, delay: float = 0.0):
+        self.built = []
+        self.threads = []
+        self.lock_held = []
+        self.pool_ref = pool_ref
+        self.delay = delay
+
+    def __call__(self, provider, model, api_key):
+        if self.pool_ref:
+            self.lock_held.append(self.pool_ref[0]._lock.locked())
+        self.threads.append(threading.current_thread())
+        time.sleep(self.delay)
+        client = FakeClient(f"{provider}:{model}:{api_key}")
+        self.built.append(client)
+        return client
+
+
+def test_factory_runs_outside_the_lock_and_concurrent_misses_share_one_client():
+    ref = []
+    factory = Factory(ref, delay=0.05)
+    pool = ProviderPool(factory)
+    ref.append(pool)
+
+    got = []
+    threads = [threading.Thread(target=lambda: got.append(pool.get("gemini", "m", "key"))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert factory.lock_held and not any(factory.lock_held)
+    assert len({id(c) for c in got}) == 1
+    # Các bản build thừa bị đóng ngay, bản giữ lại vẫn mở
+    assert not got[0].closed
+    assert sum(c.closed for c in factory.built) == len(factory.built) - 1
+    assert pool.stats()["size"] == 1
+
+
+def test_evicted_and_expired_clients_are_closed_after_grace():
+    factory = Factory()
+    pool = ProviderPool(factory, max_size=2, idle_ttl=60.0, close_grace=0.05)
+    a = pool.get("gemini", "m", "a")
+    pool.get("gemini", "m", "b")
+    pool.get("gemini", "m", "c")       # evict a (LRU)
+    assert not a.closed                # stream đang chạy trên a còn thời gian kết thúc
+    assert pool.stats()["retired"] == 1
+
+    time.sleep(0.06)
+    pool.get("gemini", "m", "c")
+    assert a.closed
+    assert pool.stats()["closed"] == 1
+
+    pool.idle_ttl = 0.0
+    b, c = factory.built[1], factory.built[2]
+    time.sleep(0.01)
+    pool.get("gemini", "m", "d")       # b, c hết hạn
+    time.sleep(0.06)
+    pool.get("gemini", "m", "d")
+    assert b.closed and c.closed
+
+
+def test_close_closes_every_client():
+    factory = Factory()
+    pool = ProviderPool(factory, max_size=1, close_grace=300.0)
+    pool.get("gemini", "m", "a")
+    pool.get("gemini", "m", "b")       # a chờ hết grace
+    pool.close()
+    assert all(c.closed for c in factory.built)
+    assert pool.stats()["size"] == 0
+
+
+def test_aget_builds_off_the_event_loop():
+    factory = Factory()
+    pool = ProviderPool(factory)
+
+    async def main():
+        first = await pool.aget("gemini", "m", "k")
+        return first, await pool.aget("gemini", "m", "k")
+
+    first, second = asyncio.run(main())
+    assert first is second
+    assert factory.threads == [factory.threads[0]] and factory.threads[0] is not threading.main_thread()
+    assert pool.stats()["hits"] == 1 and pool.stats()["misses"] == 1
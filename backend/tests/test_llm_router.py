@@ -0,0 +1,51 @@
+"""LLMRouter: hedge delay học từ TTFT của chính target, kể cả attempt thua bị huỷ."""
+import asyncio
+
+from backend.core.llm_router import LLMRouter, LLMTarget
+
+
+def target(name: str, ttft: float) -> LLMTarget:
+    async def stream(prompt):
+        await asyncio.sleep(ttft)
+        yield f"{name}: xin chào"
+    return LLMTarget(name, stream)
+
+
+def run_streams(router: LLMRouter, targets, n: int) -> list:
+    async def main():
+        return ["".join([t async for t in router.stream("q", targets)]) for _ in range(n)]
+    return asyncio.run(main())
+
+
+def test_slow_primary_raises_its_own_hedge_delay():
+    router = LLMRouter(min_delay_ms=10, max_delay_ms=1000, default_delay_ms=10, min_samples=5,
+                       count_tokens=len)
+    # Primary nhanh: TTFT ~0 → hedge delay = bucket nhỏ nhất của histogram
+    run_streams(router, [target("primary", 0.0), target("backup", 0.0)], 5)
+    assert router.hedge_delay("primary") <= 0.025
+
+    # Primary chậm hẳn: lần nào cũng bị hedge (delay ≤ max_delay) và thua backup (~120ms)
+    answers = run_streams(router, [target("primary", 5.0), target("backup", 0.12)], 5)
+    assert all(a.startswith("backup") for a in answers)
+
+    stats = router.stats()["targets"]["primary"]
+    assert stats["cancelled"] == 5
+    assert stats["ttft_ms"]["samples"] == 10
+    # Mẫu cận dưới (~130ms) của các lần thua đẩy q95 lên thay vì giữ ở 25ms
+    assert router.hedge_delay("primary") >= 0.12
+
+
+def test_cancelled_attempts_recorded_when_client_disconnects():
+    router = LLMRouter(default_delay_ms=5000, count_tokens=len)
+
+    async def main():
+        stream = router.stream("q", [target("primary", 1.0)])
+        task = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(main())
+    stats = router.stats()["targets"]["primary"]
+    assert stats["cancelled"] == 1
+    assert stats["ttft_ms"]["samples"] == 1
@@ -0,0 +1,59 @@
+"""Tìm kiếm toàn văn: bỏ dấu, phân trang theo rank / recent trên toàn bộ tập khớp."""
+from backend.core.message_search import match_query, search_messages
+from backend.tests.conftest import at, insert_messages
+
+
+def page_through(run_db, query, limit, **kwargs):
+    async def walk(db):
+        results, offset = [], 0
+        while offset is not None:
+            page, offset = await search_messages(db, query, limit=limit, offset=offset, **kwargs)
+            results.extend(page)
+        return results
+    return run_db(walk)
+
+
+def test_match_query_folds_diacritics_and_escapes_syntax():
+    assert match_query("Điểm chuẩn") == '"diem" "chuan"'
+    assert match_query('học phí" OR *') == '"hoc" "phi" "or"'
+    assert match_query("?!") == ""
+
+
+def test_search_ignores_diacritics(db_path, run_db):
+    insert_messages(db_path, [
+        ("c1", "user", "Điểm chuẩn ngành Công nghệ thông tin?", "", at(0)),
+        ("c1", "assistant", "Học phí năm nay tăng nhẹ.", "", at(1)),
+    ])
+    results = page_through(run_db, "diem chuan", limit=10)
+    assert [r["snippet"] for r in results] == ["Điểm chuẩn ngành Công nghệ thông tin?"]
+
+
+def test_rank_pagination_covers_every_match(db_path, run_db):
+    # Nhiều hơn 2000 tin khớp: trang sâu vẫn có kết quả, không trùng, không sót
+    rows = [("c%d" % (i % 40), "user", "học phí " + "ngành " * (i % 7), "", at(i)) for i in range(2300)]
+    rows += [("c0", "assistant", "ký túc xá", "", at(3000))]
+    insert_messages(db_path, rows)
+
+    results = page_through(run_db, "hoc phi", limit=100, sort="rank")
+    assert len(results) == 2300
+    assert len({r["id"] for r in results}) == 2300
+    scores = [r["score"] for r in results]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_recent_pagination_is_newest_first(db_path, run_db):
+    insert_messages(db_path, [("c1", "user", f"học bổng lượt {i}", "", at(i)) for i in range(57)])
+    results = page_through(run_db, "hoc bong", limit=10, sort="recent")
+    assert [r["snippet"] for r in results] == [f"học bổng lượt {i}" for i in reversed(range(57))]
+    assert all(r["score"] is None for r in results)
+
+
+def test_filters_apply_before_pagination(db_path, run_db):
+    insert_messages(db_path, [
+        ("c1" if i % 2 else "c2", "user" if i % 3 else "assistant", "chỉ tiêu tuyển sinh", "", at(i))
+        for i in range(60)
+    ])
+    results = page_through(run_db, "chi tieu", limit=7, role="user", conversation_id="c1")
+    expected = sum(1 for i in range(60) if i % 2 and i % 3)
+    assert len(results) == expected
+    assert all(r["role"] == "user" and r["conversation_id"] == "c1" for r in results)
@@ -0,0 +1,54 @@
+"""SemanticCache: hit theo cosine + cùng tập chunk, TTL, LRU, xoá khi index đổi."""
+import numpy as np
+
+from backend.core.semantic_cache import SemanticCache, chunk_set_key
+
+
+def unit(*values) -> np.ndarray:
+    v = np.asarray(values, dtype=np.float32)
+    return v / np.linalg.norm(v)
+
+
+CHUNKS = chunk_set_key(["Học phí CNTT 30 triệu/năm.", "Chỉ tiêu CNTT 500."])
+
+
+def test_hit_needs_similar_query_and_same_chunk_set():
+    cache = SemanticCache(threshold=0.9)
+    cache.put(unit(1, 0, 0), "học phí CNTT?", "30 triệu/năm", ["s1"], CHUNKS, "v1")
+
+    assert cache.lookup(unit(1, 0.1, 0), CHUNKS, "v1").answer == "30 triệu/năm"
+    assert cache.lookup(unit(0, 1, 0), CHUNKS, "v1") is None             # câu hỏi khác
+    assert cache.lookup(unit(1, 0.1, 0), chunk_set_key(["khác"]), "v1") is None  # retrieve ra chunk khác
+    assert chunk_set_key(["b", "a"]) == chunk_set_key(["a", "b"])
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 2)
+
+
+def test_index_version_change_invalidates_everything():
+    cache = SemanticCache()
+    cache.put(unit(1, 0), "q", "a", [], CHUNKS, "v1")
+    assert cache.lookup(unit(1, 0), CHUNKS, "v2") is None
+    assert cache.stats()["entries"] == 0 and cache.stats()["invalidations"] == 1
+    assert cache.lookup(unit(1, 0), CHUNKS, "v1") is None  # không quay lại bản cũ
+
+
+def test_expired_entries_are_dropped():
+    cache = SemanticCache(ttl=-1.0)
+    cache.put(unit(1, 0), "q", "a", [], CHUNKS, "v1")
+    assert cache.lookup(unit(1, 0), CHUNKS, "v1") is None
+    assert cache.stats()["expirations"] == 1 and cache.stats()["entries"] == 0
+
+
+def test_lru_eviction_by_count_and_bytes():
+    cache = SemanticCache(max_entries=2)
+    cache.put(unit(1, 0, 0), "a", "A", [], CHUNKS, "v1")
+    cache.put(unit(0, 1, 0), "b", "B", [], CHUNKS, "v1")
+    cache.lookup(unit(1, 0, 0), CHUNKS, "v1")        # a vừa dùng → b cũ nhất
+    cache.put(unit(0, 0, 1), "c", "C", [], CHUNKS, "v1")
+    assert cache.lookup(unit(0, 1, 0), CHUNKS, "v1") is None
+    assert cache.lookup(unit(1, 0, 0), CHUNKS, "v1").answer == "A"
+
+    small = SemanticCache(max_bytes=10)
+    small.put(unit(1, 0), "a", "x" * 8, [], CHUNKS, "v1")
+    small.put(unit(0, 1), "b", "y" * 8, [], CHUNKS, "v1")
+    assert small.stats()["entries"] == 1 and small.stats()["bytes"] == 8
+    assert small.stats()["evictions"] == 1
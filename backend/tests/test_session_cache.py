@@ -0,0 +1,49 @@
+"""SessionCache: cửa sổ write-through, load cũ bị bỏ, đếm tin bị bỏ khỏi prompt theo instance."""
+from backend.core.session_cache import HistoryDrops, SessionCache
+
+
+def msgs(n, start=0):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"tin {i}"} for i in range(start, start + n)]
+
+
+def test_write_through_window_and_unsummarized_tail():
+    cache = SessionCache(window=4)
+    cache.create("c1")
+    for m in msgs(6):
+        cache.append("c1", m["role"], m["content"])
+    cache.set_summary("c1", "tóm tắt 0-3", upto=4)
+
+    summary, history = cache.prompt_history("c1", limit=6)
+    assert summary == "tóm tắt 0-3"
+    assert [m["content"] for m in history] == ["tin 4", "tin 5"]
+    assert cache.prompt_history("missing", limit=6) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_load_raced_by_a_write_is_not_cached():
+    cache = SessionCache()
+    cache.begin_load("c1")
+    cache.append("c1", "user", "tin ghi xen giữa lúc đọc DB")
+    cache.put("c1", "", 0, 3, msgs(3))
+    assert cache.prompt_history("c1", limit=6) is None
+    assert cache.stats()["stale_loads"] == 1
+
+
+def test_history_drops_counted_per_instance_and_logged_once(capsys):
+    a, b = SessionCache(window=12), SessionCache(window=12)
+    a.put("c1", "", 0, 10, msgs(10))
+    for _ in range(3):
+        _, history = a.prompt_history("c1", limit=6)
+        assert len(history) == 6
+
+    assert a.stats()["history_dropped"] == {"prompts": 3, "messages": 12}
+    assert b.stats()["history_dropped"] == {"prompts": 0, "messages": 0}
+    assert capsys.readouterr().out.count("[WARN]") == 1
+
+
+def test_shared_drops_counter():
+    drops = HistoryDrops()
+    cache = SessionCache(drops=drops)
+    drops.note("c1", unsummarized=8, limit=6)
+    drops.note("c2", unsummarized=5, limit=6)
+    assert cache.stats()["history_dropped"] == {"prompts": 1, "messages": 2}
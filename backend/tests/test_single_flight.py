@@ -0,0 +1,133 @@
+"""SingleFlight: chia sẻ generation, huỷ khi subscriber cuối rời đi (kể cả khi chưa iterate)."""
+import asyncio
+from types import SimpleNamespace
+
+from backend.core.chat_engine import ChatEngine
+from backend.core.single_flight import SingleFlight
+
+
+class Producer:
+    """produce() sinh n token, mỗi token cách nhau `delay`; ghi lại nếu bị huỷ."""
+
+    def __init__(self, n: int = 5, delay: float = 0.01):
+        self.n = n
+        self.delay = delay
+        self.started = False
+        self.cancelled = False
+
+    async def __call__(self):
+        self.started = True
+        try:
+            for i in range(self.n):
+                await asyncio.sleep(self.delay)
+                yield f"t{i} "
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+async def _drain(tokens) -> str:
+    return "".join([t async for t in tokens])
+
+
+def test_followers_replay_prefix_and_share_one_generation():
+    async def main():
+        flights, produce = SingleFlight(), Producer()
+        leader, is_leader = flights.subscribe("k", produce)
+        first = await leader.__anext__()
+        follower, follower_leads = flights.subscribe("k", None)
+        return is_leader, follower_leads, first + "".join([t async for t in leader]), "".join([t async for t in follower]), flights
+
+    is_leader, follower_leads, a, b, flights = asyncio.run(main())
+    assert (is_leader, follower_leads) == (True, False)
+    assert a == b == "t0 t1 t2 t3 t4 "
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_generation_cancelled_when_last_subscriber_leaves():
+    async def main():
+        flights, produce, released = SingleFlight(), Producer(n=100), []
+        a, _ = flights.subscribe("k", produce, on_done=lambda: released.append(True))
+        b, _ = flights.subscribe("k", None)
+        await a.__anext__()
+        await b.__anext__()
+
+        await a.aclose()
+        await asyncio.sleep(0.03)
+        still_running = not produce.cancelled and flights.in_flight("k")
+
+        # Subscriber cuối đang đọc stream thì bị huỷ (client ngắt kết nối)
+        task = asyncio.ensure_future(_drain(b))
+        await asyncio.sleep(0.03)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0.01)
+        # Kiểm tra trong loop: asyncio.run() huỷ mọi task còn lại khi thoát
+        return still_running, produce.cancelled, list(released), flights.stats()["in_flight"]
+
+    still_running, cancelled, released, in_flight = asyncio.run(main())
+    assert still_running
+    assert cancelled
+    assert released == [True]
+    assert in_flight == 0
+
+
+def test_abandoned_subscriber_that_never_iterated_cancels_generation():
+    async def main():
+        flights, produce, released = SingleFlight(), Producer(n=100), []
+        tokens, _ = flights.subscribe("k", produce, on_done=lambda: released.append(True))
+        await asyncio.sleep(0.03)  # generation đã chạy, subscriber chưa đọc token nào
+        await tokens.aclose()
+        await tokens.aclose()       # idempotent
+        await asyncio.sleep(0.01)
+        return produce.started, produce.cancelled, list(released), flights.stats()["in_flight"]
+
+    started, cancelled, released, in_flight = asyncio.run(main())
+    assert started and cancelled
+    assert released == [True]
+    assert in_flight == 0
+
+
+# ─── ChatEngine.stream_chat ──────────────────────────────────
+class SlowRouter:
+    def __init__(self):
+        self.cancelled = False
+
+    async def stream(self, prompt, targets):
+        try:
+            for i in range(100):
+                await asyncio.sleep(0.01)
+                yield f"t{i} "
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+def make_engine() -> ChatEngine:
+    async def aretrieve(query, k=5, q_emb=None):
+        return [("Học phí 2024 ngành CNTT: 30 triệu/năm.", 0.9)]
+
+    retriever = SimpleNamespace(aretrieve=aretrieve, index_version="v1")
+    return ChatEngine(retriever, provider="ollama", model_name="m", summaries=False, router=SlowRouter())
+
+
+def test_stream_abandoned_after_first_event_releases_slot_and_cancels():
+    # Route nhận event đầu (sources) rồi lưu DB lỗi / client ngắt trước khi đọc token
+    async def main():
+        engine = make_engine()
+        events = engine.stream_chat("học phí CNTT")
+        first = await events.__anext__()
+        await asyncio.sleep(0.03)  # generation đang chạy, chưa ai đọc token
+        active = engine.admission.stats()["ollama"]["active"]
+        await events.aclose()
+        await asyncio.sleep(0.01)
+        return (
+            first, active, engine.admission.stats()["ollama"]["active"],
+            engine.router.cancelled, engine.flights.stats()["in_flight"],
+        )
+
+    first, active_before, active_after, cancelled, in_flight = asyncio.run(main())
+    assert "sources" in first
+    assert (active_before, active_after) == (1, 0)
+    assert cancelled
+    assert in_flight == 0
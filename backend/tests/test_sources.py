@@ -0,0 +1,133 @@
+"""Nguồn của tin nhắn lưu dạng chunk_id: migration, lưu theo thứ tự, tra lại qua /api/chunks."""
+import json
+import sqlite3
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.api.routes import router
+from backend.core.chat_engine import ChatEngine
+from backend.core.vector_store import VectorStore, chunk_id
+from backend.dev import migrate_sources
+from backend.tests.conftest import at, insert_messages
+
+CHUNKS = [f"Đoạn tài liệu tuyển sinh số {i}: điểm chuẩn, học phí, chỉ tiêu." for i in range(400)]
+TABLE_ROW = "Điểm chuẩn 2024 | CNTT | 26.4"
+
+
+def message_sources(path):
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT content, sources, source_ids, index_version FROM messages ORDER BY rowid").fetchall()
+    conn.close()
+    return {content: (sources, source_ids, version) for content, sources, source_ids, version in rows}
+
+
+@pytest.fixture
+def vector_store():
+    vs = VectorStore(dim=4)
+    vs.add(np.eye(4, dtype="float32")[np.arange(len(CHUNKS)) % 4], CHUNKS)
+    return vs
+
+
+# ─── migrate_sources ─────────────────────────────────────────
+def test_migrate_keeps_source_order(db_path):
+    sources = [CHUNKS[0], TABLE_ROW, CHUNKS[1]]
+    insert_messages(db_path, [
+        ("c1", "assistant", "mixed", json.dumps(sources, ensure_ascii=False), at(0)),
+        ("c1", "assistant", "inline only", json.dumps([TABLE_ROW], ensure_ascii=False), at(1)),
+        ("c1", "user", "no sources", "", at(2)),
+    ])
+    counts = migrate_sources.migrate(db_path, {chunk_id(c): c for c in CHUNKS}, "v1")
+
+    assert counts == {"rows": 2, "chunk_refs": 2, "kept_inline": 2}
+    rows = message_sources(db_path)
+    assert rows["mixed"] == (
+        json.dumps([TABLE_ROW], ensure_ascii=False),
+        f"{chunk_id(CHUNKS[0])},,{chunk_id(CHUNKS[1])}",
+        "v1",
+    )
+    assert rows["inline only"] == (json.dumps([TABLE_ROW], ensure_ascii=False), "", "")
+    assert rows["no sources"] == ("", None, None)
+
+
+def test_migrate_resumes_after_interruption(db_path, monkeypatch):
+    insert_messages(db_path, [
+        ("c1", "assistant", f"answer {i}", json.dumps(CHUNKS[i:i + 3], ensure_ascii=False), at(i))
+        for i in range(25)
+    ])
+    chunks = {chunk_id(c): c for c in CHUNKS}
+
+    # Crash giữa batch thứ 3: 2 batch đầu đã commit
+    calls = {"n": 0}
+    real_chunk_id = migrate_sources.chunk_id
+
+    def flaky_chunk_id(text):
+        calls["n"] += 1
+        if calls["n"] > 2 * 10 * 3:
+            raise RuntimeError("crash")
+        return real_chunk_id(text)
+
+    monkeypatch.setattr(migrate_sources, "chunk_id", flaky_chunk_id)
+    with pytest.raises(RuntimeError):
+        migrate_sources.migrate(db_path, chunks, "v1", batch=10)
+    partial = message_sources(db_path)
+    assert sum(1 for _, ids, _ in partial.values() if ids) == 20
+
+    monkeypatch.setattr(migrate_sources, "chunk_id", real_chunk_id)
+    counts = migrate_sources.migrate(db_path, chunks, "v1", batch=10)
+    assert counts["rows"] == 5  # chỉ các dòng còn lại
+
+    rows = message_sources(db_path)
+    for i in range(25):
+        sources, source_ids, version = rows[f"answer {i}"]
+        assert source_ids == ",".join(chunk_id(c) for c in CHUNKS[i:i + 3])
+        assert (sources, version) == ("", "v1")
+
+    # Chạy lại lần nữa: không còn gì để chuyển
+    assert migrate_sources.migrate(db_path, chunks, "v1")["rows"] == 0
+
+
+# ─── source_refs ─────────────────────────────────────────────
+def test_source_refs_keeps_one_slot_per_source(vector_store):
+    engine = SimpleNamespace(retriever=SimpleNamespace(vs=vector_store, index_version="v1"))
+    refs = ChatEngine.source_refs(engine, [TABLE_ROW, CHUNKS[3], CHUNKS[7]])
+    assert refs == {
+        "sources": [TABLE_ROW],
+        "source_ids": ["", chunk_id(CHUNKS[3]), chunk_id(CHUNKS[7])],
+        "index_version": "v1",
+    }
+    assert ChatEngine.source_refs(engine, [TABLE_ROW])["source_ids"] == []
+
+
+# ─── /api/chunks ─────────────────────────────────────────────
+@pytest.fixture
+def client(vector_store):
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    app.state.chat_engine = SimpleNamespace(retriever=SimpleNamespace(vs=vector_store, index_version="v1"))
+    return TestClient(app)
+
+
+def test_chunks_resolves_a_full_history_page(client):
+    # limit=200 → tới 100 câu trả lời × 3 nguồn
+    ids = [chunk_id(c) for c in CHUNKS[:300]]
+    response = client.post("/api/chunks", json={"ids": ids + ids[:10] + [""]})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["index_version"] == "v1"
+    assert body["chunks"] == {chunk_id(c): c for c in CHUNKS[:300]}
+
+
+def test_chunks_missing_from_index_are_null(client):
+    response = client.post("/api/chunks", json={"ids": [chunk_id(CHUNKS[0]), "0" * 16]})
+    assert response.json()["chunks"] == {chunk_id(CHUNKS[0]): CHUNKS[0], "0" * 16: None}
+
+
+def test_chunks_before_engine_is_ready():
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    app.state.chat_engine = None
+    assert TestClient(app).post("/api/chunks", json={"ids": ["x"]}).status_code == 503
@@ -0,0 +1,84 @@
+"""coalesce_tokens: token đầu flush ngay, gộp theo kích thước / thời gian, 1 task đọc cho cả stream."""
+import asyncio
+
+import pytest
+
+from backend.api.sse import coalesce_tokens, sse_event
+
+
+async def source(items, closed=None):
+    """items: event dict hoặc số giây cần chờ trước event kế tiếp."""
+    try:
+        for item in items:
+            if isinstance(item, (int, float)):
+                await asyncio.sleep(item)
+            else:
+                await asyncio.sleep(0)
+                yield item
+    finally:
+        if closed is not None:
+            closed.append(True)
+
+
+def run(items, **kwargs):
+    async def main():
+        return [e async for e in coalesce_tokens(source(items), **kwargs)]
+    return asyncio.run(main())
+
+
+def tokens(*texts):
+    return [{"token": t} for t in texts]
+
+
+def test_sse_event_serializes_once_without_ascii_escapes():
+    assert sse_event({"token": "học phí"}) == 'data: {"token": "học phí"}\n\n'
+
+
+def test_first_token_is_immediate_then_frames_fill_to_max_chars():
+    frames = run(tokens("a", "bb", "cc", "dd", "e"), max_delay=10.0, max_chars=4)
+    assert frames == [{"token": "a"}, {"token": "bbcc"}, {"token": "dde"}]
+
+
+def test_frame_flushed_when_oldest_token_waits_past_max_delay():
+    frames = run([*tokens("a", "b", "c"), 0.1, *tokens("d")], max_delay=0.02, max_chars=100)
+    assert frames == [{"token": "a"}, {"token": "bc"}, {"token": "d"}]
+
+
+def test_other_events_flush_the_buffer_and_pass_through():
+    items = [{"sources": ["s1"]}, *tokens("a", "b", "c"), {"token": "x", "done": True}, *tokens("d")]
+    frames = run(items, max_delay=10.0, max_chars=100)
+    assert frames == [
+        {"sources": ["s1"]}, {"token": "a"}, {"token": "bc"}, {"token": "x", "done": True}, {"token": "d"},
+    ]
+
+
+def test_upstream_error_is_raised_to_the_consumer():
+    async def failing():
+        yield {"token": "a"}
+        raise RuntimeError("provider down")
+
+    async def main():
+        return [e async for e in coalesce_tokens(failing())]
+
+    with pytest.raises(RuntimeError, match="provider down"):
+        asyncio.run(main())
+
+
+def test_one_reader_task_per_stream_and_upstream_closed_on_early_exit():
+    async def main():
+        loop = asyncio.get_running_loop()
+        created = []
+        loop.set_task_factory(lambda loop, coro, **kw: created.append(1) or asyncio.Task(coro, loop=loop, **kw))
+
+        frames = [e async for e in coalesce_tokens(source(tokens(*"x" * 500)), max_delay=0.001, max_chars=16)]
+
+        closed = []
+        stream = coalesce_tokens(source([*tokens("a", "b"), 10.0], closed), max_delay=0.01)
+        await stream.__anext__()
+        await stream.aclose()   # client ngắt kết nối khi upstream còn đang chờ
+        return "".join(f["token"] for f in frames), len(created), closed
+
+    text, created, closed = asyncio.run(main())
+    assert text == "x" * 500
+    assert created == 2
+    assert closed == [True]
@@ -0,0 +1,63 @@
+"""TableIndex: tra cứu điểm chuẩn / học phí chính xác, không chắc → None (đi RAG)."""
+import pandas as pd
+
+from backend.core.table_index import SCORE, TUITION, TableIndex, fold
+
+
+def make_index() -> TableIndex:
+    index = TableIndex()
+    index.add_frame(pd.DataFrame({
+        "Mã ngành": ["7480201", "7480202", "7520207"],
+        "Tên ngành": ["Công nghệ thông tin", "An toàn thông tin", "Kỹ thuật Điện tử viễn thông"],
+        "Cơ sở": ["Hà Nội", "Hà Nội", "Hà Nội"],
+        "2023": [26.4, 25.9, 25.1],
+        "2024": [26.5, 26.25, 25.3],
+    }), "score.csv")
+    index.add_frame(pd.DataFrame({
+        "Ngành": ["Công nghệ thông tin", "Công nghệ thông tin"],
+        "Hệ đào tạo": ["Hệ đại trà", "Hệ Chất lượng cao"],
+        "Năm": ["2024", "2024"],
+        "Học phí": [30000000, 45000000],
+        "Đơn vị": ["đồng/năm", "đồng/năm"],
+    }), "tuition_fees.csv")
+    return index
+
+
+def test_fold_strips_vietnamese_diacritics():
+    assert fold("Điểm chuẩn CNTT (2024)") == "diem chuan cntt 2024"
+
+
+def test_score_lookup_by_abbreviation_code_and_year():
+    index = make_index()
+    hit = index.lookup("Điểm chuẩn CNTT năm 2023 cơ sở Hà Nội?")
+    assert hit.kind == SCORE and hit.rows == 1
+    assert "**26.4**" in hit.answer and "mã 7480201" in hit.answer
+    assert hit.sources[0].startswith("score.csv, dòng 2")
+
+    by_code = index.lookup("điểm chuẩn ngành 7480202 năm 2024")
+    assert "An toàn thông tin" in by_code.answer and "**26.25**" in by_code.answer
+
+    # Không hỏi năm → năm mới nhất
+    latest = index.lookup("điểm chuẩn an toàn thông tin bao nhiêu")
+    assert latest.rows == 1 and "năm 2024" in latest.answer
+
+
+def test_tuition_lookup_filters_by_program():
+    index = make_index()
+    both = index.lookup("học phí CNTT 2024")
+    assert both.kind == TUITION and both.rows == 2
+    assert "30.000.000 đồng/năm" in both.answer
+
+    clc = index.lookup("học phí CNTT hệ chất lượng cao")
+    assert clc.rows == 1 and "45.000.000" in clc.answer
+
+
+def test_uncertain_questions_fall_back_to_rag():
+    index = make_index()
+    assert index.lookup("so sánh điểm chuẩn CNTT và ATTT") is None     # cần LLM
+    assert index.lookup("điểm chuẩn CNTT 2023 và 2024") is None         # nhiều năm
+    assert index.lookup("điểm chuẩn ngành nào cao nhất") is None        # không rõ ngành
+    assert index.lookup("học phí ATTT") is None                         # không có dữ liệu
+    assert index.lookup("ký túc xá CNTT") is None                       # không phải tra cứu bảng
+    stats = index.stats()
+    assert stats["lookups"] == 5 and stats["hits"] == 0
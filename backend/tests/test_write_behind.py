@@ -0,0 +1,62 @@
+"""MessageWriter: group commit, drain khi shutdown không mất row đang chờ trong queue."""
+import asyncio
+import sqlite3
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from backend.core.session_cache import SessionCache
+from backend.core.write_behind import DURABILITY_ASYNC, MessageWriter
+
+
+def contents(path) -> list:
+    conn = sqlite3.connect(path)
+    rows = [r[0] for r in conn.execute("SELECT content FROM messages ORDER BY created_at")]
+    conn.close()
+    return rows
+
+
+def run_writer(db_path, fn, **kwargs):
+    async def main():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+        writer = MessageWriter(async_sessionmaker(engine, expire_on_commit=False), **kwargs)
+        writer.start()
+        try:
+            return await fn(writer)
+        finally:
+            await writer.drain()
+            await engine.dispose()
+    return asyncio.run(main())
+
+
+def test_drain_commits_rows_still_queued_at_shutdown(db_path):
+    async def fn(writer):
+        conv = await writer.create_conversation(durable=False)
+        for i in range(50):
+            await writer.save_message(conv.id, "user", f"m{i}")
+        # Cửa sổ gom dài → chưa batch nào được commit khi bắt đầu shutdown
+        before = contents(db_path)
+        await writer.drain()
+        return before, writer.stats(), writer.has_pending(conv.id)
+
+    before, stats, pending = run_writer(db_path, fn, durability=DURABILITY_ASYNC, flush_interval=0.5)
+    assert before == []
+    assert contents(db_path) == [f"m{i}" for i in range(50)]
+    assert stats["written"] == 51 and stats["failed"] == 0
+    assert stats["batches"] < 51   # group commit, không phải 1 commit / row
+    assert not pending
+
+
+def test_flush_durability_waits_for_commit_and_writes_through_cache(db_path):
+    sessions = SessionCache()
+
+    async def fn(writer):
+        conv = await writer.create_conversation()
+        await writer.save_message(conv.id, "user", "học phí?")
+        committed = await writer.save_message(conv.id, "assistant", "30 triệu", durable=False)
+        _, cached = sessions.prompt_history(conv.id, 10)
+        await committed
+        return contents(db_path), cached
+
+    persisted, cached = run_writer(db_path, fn, sessions=sessions, flush_interval=0.005)
+    assert persisted == ["học phí?", "30 triệu"]
+    assert [m["content"] for m in cached] == ["học phí?", "30 triệu"]
@@ -6,8 +6,31 @@ export type Message = {
     role: "user" | "assistant";
     content: string;
     sources?: string[];
+    source_ids?: string[];
 };
 
+// Tin nhắn lưu trong DB chỉ giữ chunk_id của nguồn → tra nội dung 1 lần cho cả trang.
+// source_ids giữ thứ tự nguồn: slot rỗng = nguồn inline (bảng, FAQ) kế tiếp trong sources
+async function resolveSources(messages: Message[]): Promise<Message[]> {
+    const ids = Array.from(new Set(messages.flatMap((m) => m.source_ids || []).filter((id) => id)));
+    if (ids.length === 0) return messages;
+    const response = await fetch("http://localhost:8000/api/chunks", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ ids }),
+    });
+    if (!response.ok) return messages;
+    const { chunks } = await response.json();
+    return messages.map((m) => {
+        const inline = [...(m.sources || [])];
+        const ordered = (m.source_ids || []).map((id) => (id ? chunks[id] : inline.shift()));
+        return {
+            ...m,
+            sources: [...ordered.filter((text): text is string => !!text), ...inline],
+        };
+    });
+}
+
 export function useChat() {
     const [messages, setMessages] = useState<Message[]>([]);
     const [isLoading, setIsLoading] = useState(false);
@@ -108,7 +131,7 @@ export function useChat() {
             const response = await fetch(`http://localhost:8000/api/conversations/${id}/messages`);
             if (response.ok) {
                 const data = await response.json();
-                setMessages(data.messages);
+                setMessages(await resolveSources(data.messages));
                 setConversationId(id);
             }
         } catch (error) {